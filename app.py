@@ -1,12 +1,33 @@
 import os
 import json
-from flask import Flask, render_template, request, redirect, url_for, jsonify, abort
+import hashlib
+import base64
+import click
+from flask import (Flask, Response, render_template, request, redirect, url_for, jsonify, abort,
+                   stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from datetime import datetime, date, timedelta, timezone
 import logging
 from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
+from sqlalchemy import event as sa_event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
 from flask import jsonify
+import atexit
+from audit import AuditWriter, AuditPolicy
+from health import CachedCheck
+from db_pool import build_engine_options, pool_metrics
+from events import EventBroker, PostgresListener, format_sse
+from retention import ChunkedPurge
+from partitions import drop_partitions_before, ensure_partitions, is_partitioned
+from archive import ARCHIVE_FIELDS, LogArchiver
+from interning import StringInterner, value_hash
+import transfer
+from cache import MISSING, create_cache
+import rollups
+import bitsets
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -25,13 +46,92 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-123')
+app.config['WEEKLY_STATS_MAX_WEEKS'] = int(os.getenv('WEEKLY_STATS_MAX_WEEKS', 104))
+# Максимум периодов (дней, недель или месяцев) в /api/stats/<period>
+app.config['ROLLUP_STATS_MAX_PERIODS'] = int(os.getenv('ROLLUP_STATS_MAX_PERIODS', 366))
+# Кеш данных главной страницы и истории: бэкенд (memory или redis), размер, TTL
+app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'memory')
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', 256))
+app.config['CACHE_TTL_SECONDS'] = float(os.getenv('CACHE_TTL_SECONDS', 30))
+# Добавляется ко всем ETag: сменить при выкатке, меняющей разметку страниц
+app.config['ETAG_SALT'] = os.getenv('ETAG_SALT', '')
+# Выгрузка и загрузка данных: строк в пачке серверного курсора и в пачке вставки
+app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+app.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', 5000))
+# Максимум отметок в одном запросе POST /api/checkins
+app.config['CHECKINS_MAX_BATCH'] = int(os.getenv('CHECKINS_MAX_BATCH', 500))
+
+# Фоновая запись журнала действий
+app.config['AUDIT_ASYNC'] = os.getenv('AUDIT_ASYNC', 'true').lower() == 'true'
+app.config['AUDIT_BATCH_SIZE'] = int(os.getenv('AUDIT_BATCH_SIZE', 100))
+app.config['AUDIT_FLUSH_INTERVAL_MS'] = int(os.getenv('AUDIT_FLUSH_INTERVAL_MS', 500))
+app.config['AUDIT_QUEUE_SIZE'] = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+app.config['AUDIT_OVERFLOW'] = os.getenv('AUDIT_OVERFLOW', 'drop')  # drop или block
+# Политика по действиям: always, never или доля записываемых событий
+app.config['AUDIT_ACTION_POLICY'] = os.getenv(
+    'AUDIT_ACTION_POLICY', 'view_index=0.05,view_logs=0.05,view_history=0.05,api_call=0.05'
+)
+
+# Журнал действий: размер страницы JSON API и период опроса страницы /logs
+app.config['LOGS_API_MAX_LIMIT'] = int(os.getenv('LOGS_API_MAX_LIMIT', 500))
+app.config['LOGS_POLL_INTERVAL_MS'] = int(os.getenv('LOGS_POLL_INTERVAL_MS', 10000))
+# Хранение журнала: срок, размер пачки удаления, пауза между пачками и
+# сколько пачек можно удалить за один HTTP-запрос /logs/clear
+app.config['LOG_RETENTION_DAYS'] = int(os.getenv('LOG_RETENTION_DAYS', 30))
+app.config['LOG_PURGE_CHUNK_SIZE'] = int(os.getenv('LOG_PURGE_CHUNK_SIZE', 5000))
+app.config['LOG_PURGE_PAUSE_MS'] = int(os.getenv('LOG_PURGE_PAUSE_MS', 0))
+app.config['LOG_PURGE_HTTP_MAX_CHUNKS'] = int(os.getenv('LOG_PURGE_HTTP_MAX_CHUNKS', 10))
+# Секции журнала на PostgreSQL: на сколько месяцев вперед создавать и
+# отключать ли старые секции вместо удаления
+app.config['LOG_PARTITION_MONTHS_AHEAD'] = int(os.getenv('LOG_PARTITION_MONTHS_AHEAD', 3))
+app.config['LOG_PARTITION_DETACH_ONLY'] = os.getenv('LOG_PARTITION_DETACH_ONLY', 'false').lower() == 'true'
+# Архив журнала перед удалением: каталог (пусто - не архивировать) и степень сжатия
+app.config['LOG_ARCHIVE_DIR'] = os.getenv('LOG_ARCHIVE_DIR', '')
+app.config['LOG_ARCHIVE_COMPRESSLEVEL'] = int(os.getenv('LOG_ARCHIVE_COMPRESSLEVEL', 6))
+# Сколько строк User-Agent держать в кеше id процесса
+app.config['USER_AGENT_CACHE_SIZE'] = int(os.getenv('USER_AGENT_CACHE_SIZE', 1024))
+# Страница /logs читает только последние дни, чтобы запрос шел по свежим секциям
+app.config['LOGS_VIEW_WINDOW_DAYS'] = int(os.getenv('LOGS_VIEW_WINDOW_DAYS', 31))
+
+# Поток событий (SSE): буфер на клиента, лимит клиентов, keepalive и LISTEN/NOTIFY.
+# Каждый клиент занимает поток воркера gunicorn, поэтому по умолчанию лимит на
+# процесс на единицу меньше GUNICORN_THREADS (sync-воркер с одним потоком - 0),
+# и для обычных запросов и /readyz всегда остается свободный поток. Больше
+# клиентов - только отдельным деплоем /events с большим числом потоков.
+app.config['EVENTS_BUFFER_SIZE'] = int(os.getenv('EVENTS_BUFFER_SIZE', 100))
+app.config['EVENTS_MAX_SUBSCRIBERS'] = int(os.getenv(
+    'EVENTS_MAX_SUBSCRIBERS', max(int(os.getenv('GUNICORN_THREADS', 2)) - 1, 0)))
+# Главная страница подписывается на /events, только если это включено
+app.config['EVENTS_LIVE_RELOAD'] = os.getenv('EVENTS_LIVE_RELOAD', 'false').lower() == 'true'
+app.config['EVENTS_KEEPALIVE_SECONDS'] = int(os.getenv('EVENTS_KEEPALIVE_SECONDS', 15))
+app.config['EVENTS_PG_NOTIFY'] = os.getenv('EVENTS_PG_NOTIFY', 'true').lower() == 'true'
+
+# Сколько секунд ждать БД при старте процесса
+app.config['DB_WAIT_TIMEOUT'] = int(os.getenv('DB_WAIT_TIMEOUT', 60))
+# Применять миграции при старте (для одиночного контейнера; в k8s это делает Job)
+app.config['MIGRATE_ON_START'] = os.getenv('MIGRATE_ON_START', 'false').lower() == 'true'
+
+# Readiness-проба: результат кешируется, проверка ограничена по времени
+app.config['READINESS_CACHE_MS'] = int(os.getenv('READINESS_CACHE_MS', 2000))
+app.config['READINESS_TIMEOUT_MS'] = int(os.getenv('READINESS_TIMEOUT_MS', 500))
 
 # Если в тестовом режиме, добавляем дополнительные настройки
 if os.environ.get('FLASK_ENV') == 'testing':
     app.config['TESTING'] = True
     app.config['WTF_CSRF_ENABLED'] = False
+    # В тестах пишем аудит синхронно, чтобы записи были видны сразу
+    app.config['AUDIT_ASYNC'] = False
+    app.config['AUDIT_ACTION_POLICY'] = ''
+
+# Пул соединений и таймауты запросов (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+# DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_STATEMENT_TIMEOUT_MS)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'], os.environ
+)
 
 db = SQLAlchemy(app)
+migrate = Migrate(app, db)
 
 # Настройка логирования
 if not os.path.exists('logs'):
@@ -62,16 +162,72 @@ class Habit(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     logs = db.relationship('HabitLog', backref='habit', cascade="all, delete-orphan", lazy=True)
     activity_logs = db.relationship('ActivityLog', backref='habit', cascade="all, delete-orphan", lazy=True)
+    streak = db.relationship('HabitStreak', backref='habit', cascade="all, delete-orphan", uselist=False, lazy=True)
+    year_bits = db.relationship('HabitYearBits', cascade="all, delete-orphan", lazy=True)
 
 class HabitLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), nullable=False)
     date = db.Column(db.Date, default=date.today, nullable=False, index=True)
-    status = db.Column(db.Boolean, default=False)
+    # active_history: прежний статус нужен для счетчиков daily_rollup при flush
+    status = db.column_property(db.Column(db.Boolean, default=False), active_history=True)
 
     # Уникальный индекс для предотвращения дубликатов
     __table_args__ = (db.UniqueConstraint('habit_id', 'date', name='unique_habit_date'),)
 
+class HabitStreak(db.Model):
+    """Сохраненное состояние серий привычки (обновляется инкрементально)"""
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)  # длина последней серии
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_completed_date = db.Column(db.Date, nullable=True)  # конец последней серии
+
+    def current_for(self, today):
+        """Текущая серия на дату today (0, если последняя серия оборвалась)"""
+        if self.last_completed_date is None:
+            return 0
+        if today - timedelta(days=1) <= self.last_completed_date <= today:
+            return self.current_streak
+        return 0
+
+class ResourceVersion(db.Model):
+    """Счетчики версий данных для ETag: 'global' и 'habit:<id>'"""
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyRollup(db.Model):
+    """Число выполнений за день, неделю или месяц: по привычке и по всем (habit_id = 0)"""
+    period = db.Column(db.String(5), primary_key=True)  # 'day', 'week' или 'month'
+    habit_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # без FK: 0 - все привычки
+    period_start = db.Column(db.Date, primary_key=True)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+
+class HabitYearBits(db.Model):
+    """Битовая карта выполнений привычки за год (бит на день, см. bitsets)"""
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bits = db.Column(db.LargeBinary(bitsets.YEAR_BYTES), nullable=False)
+
+class UserAgent(db.Model):
+    """Справочник строк User-Agent: журнал хранит только ссылку на него"""
+    id = db.Column(db.Integer, primary_key=True)
+    value_hash = db.Column(db.String(32), nullable=False, unique=True)  # md5(value)
+    value = db.Column(db.Text, nullable=False)
+
+    @classmethod
+    def get_or_create(cls, value):
+        """Строка справочника для value в текущей сессии (для ORM-кода, не для аудита)"""
+        key = value_hash(value)
+        pending = [obj for obj in db.session.new if isinstance(obj, cls) and obj.value_hash == key]
+        if pending:
+            return pending[0]
+        with db.session.no_autoflush:
+            user_agent = cls.query.filter_by(value_hash=key).first()
+        if user_agent is None:
+            user_agent = cls(value_hash=key, value=value)
+            db.session.add(user_agent)
+        return user_agent
+
 class ActivityLog(db.Model):
     """Модель для логирования действий пользователя"""
     id = db.Column(db.Integer, primary_key=True)
@@ -80,21 +236,159 @@ class ActivityLog(db.Model):
     action = db.Column(db.String(100), nullable=False)  # create, update, delete, toggle, etc.
     details = db.Column(db.Text, nullable=True)
     ip_address = db.Column(db.String(50), nullable=True)
-    user_agent = db.Column(db.Text, nullable=True)
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('user_agent.id'), nullable=True)
+    user_agent_ref = db.relationship(UserAgent)
+
+    @property
+    def user_agent(self):
+        return self.user_agent_ref.value if self.user_agent_ref else None
+
+    @user_agent.setter
+    def user_agent(self, value):
+        self.user_agent_ref = UserAgent.get_or_create(value) if value is not None else None
+
+# Индексы под реальные запросы:
+# - серии: выполненные записи привычки от новых к старым (частичный индекс)
+# - /logs и очистка: сортировка (keyset по timestamp, id) и удаление по timestamp
+# - журнал по привычке: habit_id + timestamp
+PERFORMANCE_INDEXES = [
+    db.Index('ix_habit_log_completed_habit_date', HabitLog.habit_id, HabitLog.date.desc(),
+             postgresql_where=HabitLog.status == True,
+             sqlite_where=HabitLog.status == True),
+    db.Index('ix_activity_log_timestamp_id', ActivityLog.timestamp, ActivityLog.id),
+    db.Index('ix_activity_log_habit_timestamp', ActivityLog.habit_id, ActivityLog.timestamp),
+]
+
+EVENTS_CHANNEL = 'habit_events'
+
+event_broker = EventBroker(
+    buffer_size=app.config['EVENTS_BUFFER_SIZE'],
+    max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS']
+)
+
+def _connect_listener():
+    """Отдельное соединение psycopg2 для LISTEN (не из пула)"""
+    import psycopg2
+    with app.app_context():
+        url = db.engine.url.set(drivername='postgresql')
+    return psycopg2.connect(url.render_as_string(hide_password=False))
+
+pg_listener = PostgresListener(_connect_listener, EVENTS_CHANNEL, event_broker, logger=app.logger)
+
+def _use_pg_notify():
+    return app.config['EVENTS_PG_NOTIFY'] and db.engine.dialect.name == 'postgresql'
+
+def _notify(connection, event):
+    """NOTIFY в текущей транзакции: событие уйдет подписчикам только после COMMIT"""
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    connection.execute(db.text('SELECT pg_notify(:channel, :payload)'),
+                       {'channel': EVENTS_CHANNEL, 'payload': payload})
+
+def emit_event(kind, data):
+    """Публикует событие после коммита текущей сессии.
+
+    На PostgreSQL событие идет через NOTIFY и доходит до всех реплик;
+    на SQLite (и в тестах) - в EventBroker этого процесса после коммита.
+    """
+    event = {'type': kind, 'data': data}
+    if _use_pg_notify():
+        _notify(db.session, event)
+    else:
+        db.session.info.setdefault('pending_events', []).append(event)
+
+@sa_event.listens_for(db.session, 'after_commit')
+def _publish_pending_events(session):
+    for event in session.info.pop('pending_events', []):
+        event_broker.publish(event)
+
+@sa_event.listens_for(db.session, 'after_rollback')
+def _drop_pending_events(session):
+    session.info.pop('pending_events', None)
+
+def _activity_event(row):
+    return {'type': 'activity', 'data': {
+        'timestamp': row['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
+        'habit_id': row['habit_id'],
+        'action': row['action'],
+        # NOTIFY ограничен 8000 байт - подробности обрезаем
+        'details': (row['details'] or '')[:500]
+    }}
+
+user_agents = StringInterner(UserAgent.__table__, maxsize=app.config['USER_AGENT_CACHE_SIZE'])
+
+def _detach_missing_habits(connection, records):
+    """Убирает ссылку на привычки, которых нет в БД (неудачные действия с
+    несуществующим id, привычка удалена, пока запись ждала в очереди)"""
+    habit_ids = {record['habit_id'] for record in records if record.get('habit_id') is not None}
+    existing = set(connection.scalars(db.select(Habit.id).where(Habit.id.in_(habit_ids))))
+    return [{**record, 'habit_id': None} if record.get('habit_id') not in existing else record
+            for record in records]
+
+def _write_activity_rows(rows):
+    """Вставляет пачку записей аудита одним запросом в отдельной транзакции.
+
+    Строки User-Agent заменяются на id из справочника; новые строки
+    добавляются в справочник заранее, в своей транзакции. Если вставка
+    нарушила внешний ключ привычки, записи без существующей привычки
+    вставляются повторно без ссылки на нее.
+    """
+    with app.app_context():
+        use_notify = _use_pg_notify()
+        ids = user_agents.ids_for(db.engine.begin, [row.get('user_agent') for row in rows])
+        records = [
+            {**{k: v for k, v in row.items() if k != 'user_agent'},
+             'user_agent_id': ids.get(row.get('user_agent'))}
+            for row in rows
+        ]
+
+        def insert(connection, records):
+            connection.execute(ActivityLog.__table__.insert(), records)
+            if use_notify:
+                for row in rows:
+                    _notify(connection, _activity_event(row))
+
+        try:
+            with db.engine.begin() as connection:
+                insert(connection, records)
+        except IntegrityError:
+            with db.engine.begin() as connection:
+                insert(connection, _detach_missing_habits(connection, records))
+        if not use_notify:
+            for row in rows:
+                event_broker.publish(_activity_event(row))
+
+audit_writer = AuditWriter(
+    _write_activity_rows,
+    batch_size=app.config['AUDIT_BATCH_SIZE'],
+    flush_interval=app.config['AUDIT_FLUSH_INTERVAL_MS'] / 1000,
+    max_queue=app.config['AUDIT_QUEUE_SIZE'],
+    overflow=app.config['AUDIT_OVERFLOW'],
+    synchronous=not app.config['AUDIT_ASYNC'],
+    logger=app.logger
+)
+atexit.register(audit_writer.stop)
+audit_policy = AuditPolicy.from_spec(app.config['AUDIT_ACTION_POLICY'])
 
 # Вспомогательная функция для логирования
 def log_activity(action, habit_id=None, details=None, request=None):
-    """Логирует действие пользователя"""
+    """Логирует действие пользователя.
+
+    Запись не попадает в сессию запроса: она ставится в очередь audit_writer
+    и вставляется в БД фоновым потоком вместе с другими записями. Частые
+    события (просмотры страниц) пишутся выборочно согласно audit_policy.
+    """
     try:
-        activity_log = ActivityLog(
-            habit_id=habit_id,
-            action=action,
-            details=details,
-            ip_address=request.remote_addr if request else None,
-            user_agent=request.user_agent.string if request else None
-        )
-        db.session.add(activity_log)
-        db.session.commit()
+        if not audit_policy.should_record(action):
+            return
+
+        audit_writer.submit({
+            'timestamp': datetime.now(timezone.utc),
+            'habit_id': habit_id,
+            'action': action,
+            'details': details,
+            'ip_address': request.remote_addr if request else None,
+            'user_agent': request.user_agent.string if request else None
+        })
         
         # Также логируем в файл
         log_message = f"Action: {action}, Habit ID: {habit_id}, Details: {details}"
@@ -102,69 +396,547 @@ def log_activity(action, habit_id=None, details=None, request=None):
     
     except Exception as e:
         app.logger.error(f"Failed to log activity: {e}")
-        db.session.rollback()
 
-def calculate_streak(habit_id):
-    """Рассчитывает текущую серию непрерывного выполнения привычки"""
-    today = date.today()
-    
-    # Получаем все выполненные записи, отсортированные по дате (от новых к старым)
-    logs = HabitLog.query.filter_by(habit_id=habit_id, status=True)\
-                         .order_by(HabitLog.date.desc())\
-                         .all()
-    
-    if not logs:
-        return 0
-    
-    # Определяем, есть ли сегодня выполнение
-    has_today = logs[0].date == today
-    
-    # Определяем дату, с которой начинать подсчет
-    if has_today:
+def _streak_from_dates(done_dates, today):
+    """Считает текущую серию по множеству дат с выполнением"""
+    if today in done_dates:
         current_date = today
+    elif today - timedelta(days=1) in done_dates:
+        current_date = today - timedelta(days=1)
     else:
-        # Если сегодня нет выполнения, проверяем вчера
-        if logs[0].date == today - timedelta(days=1):
-            current_date = today - timedelta(days=1)
-        else:
-            # Последнее выполнение было раньше чем вчера
-            return 0
-    
-    # Подсчитываем непрерывные дни
+        return 0, None
+
     streak = 0
-    for log in logs:
-        if log.date == current_date:
-            streak += 1
-            current_date -= timedelta(days=1)
-        else:
+    while current_date in done_dates:
+        streak += 1
+        current_date -= timedelta(days=1)
+
+    # Возвращаем длину серии и первый день перед ней (где выполнения нет)
+    return streak, current_date
+
+def calculate_streaks(habit_ids, today=None):
+    """Рассчитывает текущие серии с нуля сразу для нескольких привычек.
+
+    Вместо полной выборки истории читаются только окна выполненных дней,
+    каждое следующее вдвое длиннее предыдущего, и только для тех привычек,
+    чья серия доходит до границы уже загруженного окна.
+    """
+    today = today or date.today()
+    done = {habit_id: set() for habit_id in habit_ids}
+    lower = today + timedelta(days=1)
+
+    streaks = {}
+    pending = set(done)
+    span = 16
+    while pending:
+        # Серия известна окончательно, если день перед ней попал в загруженное окно
+        for habit_id in list(pending):
+            streak, gap = _streak_from_dates(done[habit_id], today)
+            if gap is not None and gap >= lower:
+                streaks[habit_id] = streak
+                pending.discard(habit_id)
+            elif streak == 0 and lower <= today - timedelta(days=1):
+                streaks[habit_id] = 0
+                pending.discard(habit_id)
+        if not pending:
             break
-    
-    return streak
+
+        new_lower = lower - timedelta(days=span)
+        rows = db.session.query(HabitLog.habit_id, HabitLog.date).filter(
+            HabitLog.habit_id.in_(pending),
+            HabitLog.status == True,
+            HabitLog.date >= new_lower,
+            HabitLog.date < lower
+        ).all()
+        for habit_id, log_date in rows:
+            done[habit_id].add(log_date)
+
+        lower = new_lower
+        span *= 2
+
+    return streaks
+
+def calculate_streak(habit_id):
+    """Рассчитывает текущую серию непрерывного выполнения привычки"""
+    return calculate_streaks([habit_id])[habit_id]
+
+def compute_streak_state(done_dates):
+    """Считает состояние серий с нуля по отсортированному списку выполненных дат.
+
+    Возвращает (длина последней серии, самая длинная серия, последняя дата).
+    """
+    current = longest = 0
+    previous = None
+    for log_date in done_dates:
+        if previous is not None and log_date == previous + timedelta(days=1):
+            current += 1
+        else:
+            current = 1
+        longest = max(longest, current)
+        previous = log_date
+    return current, longest, previous
+
+def rebuild_streak_states(habit_ids=None, fix=True):
+    """Пересчитывает состояние серий с нуля и сверяет его с сохраненным.
+
+    Возвращает список расхождений (habit_id, сохранено, пересчитано).
+    При fix=True сохраненное состояние приводится к пересчитанному.
+    """
+    if habit_ids is None:
+        habit_ids = [row.id for row in db.session.query(Habit.id).all()]
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return []
+
+    # Один запрос по всем нужным привычкам, группировка в Python
+    done = {habit_id: [] for habit_id in habit_ids}
+    rows = db.session.query(HabitLog.habit_id, HabitLog.date).filter(
+        HabitLog.habit_id.in_(habit_ids),
+        HabitLog.status == True
+    ).order_by(HabitLog.habit_id, HabitLog.date).all()
+    for habit_id, log_date in rows:
+        done[habit_id].append(log_date)
+
+    stored = {
+        state.habit_id: state
+        for state in HabitStreak.query.filter(HabitStreak.habit_id.in_(habit_ids)).all()
+    }
+
+    mismatches = []
+    new_states = []
+    for habit_id in habit_ids:
+        expected = compute_streak_state(done[habit_id])
+        state = stored.get(habit_id)
+        actual = (
+            (state.current_streak, state.longest_streak, state.last_completed_date)
+            if state else None
+        )
+        if actual == expected:
+            continue
+        mismatches.append((habit_id, actual, expected))
+        if not fix:
+            continue
+        if state is None:
+            new_states.append({
+                'habit_id': habit_id,
+                'current_streak': expected[0],
+                'longest_streak': expected[1],
+                'last_completed_date': expected[2]
+            })
+        else:
+            state.current_streak, state.longest_streak, state.last_completed_date = expected
+
+    if new_states:
+        # Строку могла вставить параллельная транзакция (первый просмотр страницы)
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        db.session.execute(dialect.insert(HabitStreak).values(new_states)
+                           .on_conflict_do_nothing(index_elements=[HabitStreak.habit_id]))
+    db.session.flush()
+    return mismatches
+
+def _run_edge(habit_id, day, step):
+    """Возвращает дальнюю границу непрерывной серии выполнений от day в направлении step.
+
+    Соседние даты читаются окнами, каждое вдвое длиннее предыдущего, поэтому
+    пересчет затрагивает только саму серию, а не всю историю привычки.
+    """
+    edge = day
+    span = 16
+    while True:
+        if step < 0:
+            low, high = edge - timedelta(days=span), edge - timedelta(days=1)
+        else:
+            low, high = edge + timedelta(days=1), edge + timedelta(days=span)
+        dates = {
+            row.date for row in db.session.query(HabitLog.date).filter(
+                HabitLog.habit_id == habit_id,
+                HabitLog.status == True,
+                HabitLog.date.between(low, high)
+            )
+        }
+        probe = edge + timedelta(days=step)
+        while probe in dates:
+            edge = probe
+            probe += timedelta(days=step)
+        if low <= probe <= high:
+            return edge
+        span *= 2
+
+def _habit_log_insert():
+    """INSERT с поддержкой ON CONFLICT для текущей БД (PostgreSQL или SQLite)"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(HabitLog)
+
+# Самый ранний день, который можно отметить. Около date.min и date.max поиск
+# границ серии (_run_edge) вышел бы за пределы дат, да и смысла в них нет
+EARLIEST_LOG_DATE = date(1900, 1, 1)
+
+def is_loggable_date(day, today=None):
+    """Можно ли отметить день: не раньше EARLIEST_LOG_DATE и не позже сегодня"""
+    return EARLIEST_LOG_DATE <= day <= (today or date.today())
+
+def toggle_habit_log(habit_id, day):
+    """Переключает отметку дня одним запросом; возвращает новый статус.
+
+    Нет записи - вставляется выполненная, есть - статус инвертируется.
+    Одновременные клики не падают на unique_habit_date, а применяются по очереди.
+    """
+    statement = _habit_log_insert().values(habit_id=habit_id, date=day, status=True)
+    statement = statement.on_conflict_do_update(
+        index_elements=[HabitLog.habit_id, HabitLog.date],
+        set_={'status': db.not_(db.func.coalesce(HabitLog.__table__.c.status, False))}
+    ).returning(HabitLog.status)
+    status = bool(db.session.execute(statement).scalar_one())
+    apply_log_changes([(habit_id, day, 1 if status else -1)])
+    return status
+
+def set_habit_log_status(habit_id, day, status):
+    """Устанавливает статус дня одним запросом; возвращает True, если он изменился.
+
+    RETURNING отдает строку, только если запись вставлена или статус
+    действительно поменялся, поэтому старое значение заранее читать не нужно.
+    Отсутствующая запись равнозначна невыполненному дню и не создается.
+    """
+    return bool(set_habit_log_statuses([(habit_id, day, status)]))
+
+def set_habit_log_statuses(items):
+    """Пакетный вариант set_habit_log_status: не больше двух запросов на весь список.
+
+    items - пары (habit_id, date, status) без повторов дней. Возвращает
+    множество (habit_id, date), статус которых действительно изменился.
+    """
+    done = [{'habit_id': habit_id, 'date': day, 'status': True}
+            for habit_id, day, status in items if status]
+    cleared = [(habit_id, day) for habit_id, day, status in items if not status]
+    changed = set()
+    if done:
+        statement = _habit_log_insert().values(done).on_conflict_do_update(
+            index_elements=[HabitLog.habit_id, HabitLog.date],
+            set_={'status': True},
+            where=HabitLog.__table__.c.status.is_not(True)
+        ).returning(HabitLog.habit_id, HabitLog.date)
+        changed.update(tuple(row) for row in db.session.execute(statement))
+    if cleared:
+        statement = db.update(HabitLog).where(
+            db.tuple_(HabitLog.habit_id, HabitLog.date).in_(cleared),
+            HabitLog.status == True
+        ).values(status=False).returning(HabitLog.habit_id, HabitLog.date)
+        changed.update(tuple(row) for row in db.session.execute(statement))
+    statuses = {(habit_id, day): status for habit_id, day, status in items}
+    apply_log_changes((habit_id, day, 1 if statuses[(habit_id, day)] else -1)
+                      for habit_id, day in changed)
+    return changed
+
+def apply_log_changes(changes, connection=None, deleted_habits=()):
+    """Обновляет производные от HabitLog данные: daily_rollup и годовые битовые карты.
+
+    changes - тройки (habit_id, день, +1/-1). Вызывается в той же транзакции,
+    что и изменение HabitLog, поэтому производные данные не расходятся с
+    отметками ни при откате, ни при гонке кликов. Карты удаляемых привычек
+    (deleted_habits) не трогаются - они удаляются вместе с привычкой.
+    """
+    changes = list(changes)
+    connection = connection or db.session.connection()
+    rollups.apply_deltas(connection, DailyRollup.__table__, rollups.aggregate(changes))
+    bitsets.apply_changes(connection, HabitYearBits.__table__,
+                          [change for change in changes if change[0] not in deleted_habits])
+
+def _habit_log_before(obj):
+    """(habit_id, date, status) записи HabitLog до изменений текущего flush"""
+    state = db.inspect(obj)
+    values = []
+    for name in ('habit_id', 'date', 'status'):
+        history = state.attrs[name].history
+        values.append(history.deleted[0] if history.deleted else
+                      history.unchanged[0] if history.unchanged else getattr(obj, name))
+    return tuple(values)
+
+@sa_event.listens_for(db.session, 'before_flush')
+def _collect_rollup_changes(session, flush_context, instances):
+    # Записи через ORM (каскадное удаление привычки, тесты, скрипты) тоже
+    # меняют счетчики. Старые значения доступны только до flush, а id и
+    # значения по умолчанию новых записей - только после него.
+    changes = session.info.setdefault('rollup_changes', [])
+    new = session.info.setdefault('rollup_new_logs', [])
+    session.info.setdefault('rollup_deleted_habits', set()).update(
+        obj.id for obj in session.deleted if isinstance(obj, Habit))
+    for obj in session.deleted:
+        if isinstance(obj, HabitLog) and db.inspect(obj).persistent:
+            habit_id, day, status = _habit_log_before(obj)
+            if status:
+                changes.append((habit_id, day, -1))
+    for obj in session.dirty:
+        if isinstance(obj, HabitLog) and session.is_modified(obj):
+            habit_id, day, status = _habit_log_before(obj)
+            if status:
+                changes.append((habit_id, day, -1))
+            new.append(obj)
+    new.extend(obj for obj in session.new if isinstance(obj, HabitLog))
+
+@sa_event.listens_for(db.session, 'after_flush')
+def _apply_rollup_changes(session, flush_context):
+    changes = session.info.pop('rollup_changes', [])
+    changes.extend((obj.habit_id, obj.date, 1)
+                   for obj in session.info.pop('rollup_new_logs', []) if obj.status)
+    deleted_habits = session.info.pop('rollup_deleted_habits', set())
+    if changes:
+        apply_log_changes(changes, session.connection(), deleted_habits)
+
+@sa_event.listens_for(db.session, 'after_rollback')
+def _drop_rollup_changes(session):
+    # Неудачный flush не должен оставить изменения для следующего
+    session.info.pop('rollup_changes', None)
+    session.info.pop('rollup_new_logs', None)
+    session.info.pop('rollup_deleted_habits', None)
+
+def _stream_done_days():
+    """Пары (habit_id, дата) всех выполненных отметок потоком"""
+    return db.session.execute(
+        db.select(HabitLog.habit_id, HabitLog.date).where(HabitLog.status == True)
+        .execution_options(yield_per=app.config['EXPORT_BATCH_SIZE'])
+    )
+
+def rebuild_rollups(fix=True):
+    """Пересчитывает daily_rollup по HabitLog и сверяет с сохраненными счетчиками.
+
+    Возвращает список расхождений (period, habit_id, начало, сохранено,
+    пересчитано). При fix=True таблица заменяется пересчитанными счетчиками.
+    Выполненные дни читаются потоком, в памяти - только сами счетчики.
+    """
+    expected = rollups.aggregate((habit_id, day, 1) for habit_id, day in _stream_done_days())
+    table = DailyRollup.__table__
+    stored = {
+        (row.period, row.habit_id, row.period_start): row.completed
+        for row in db.session.execute(db.select(table).where(table.c.completed != 0))
+    }
+    mismatches = [
+        key + (stored.get(key, 0), expected.get(key, 0))
+        for key in sorted(set(stored) | set(expected))
+        if stored.get(key, 0) != expected.get(key, 0)
+    ]
+    if fix and mismatches:
+        rollups.replace(db.session.connection(), table, expected)
+    return mismatches
+
+def rebuild_year_bits(fix=True):
+    """Пересобирает годовые битовые карты по HabitLog и сверяет с сохраненными.
+
+    Возвращает список расхождений (habit_id, год). При fix=True таблица
+    заменяется пересобранными картами.
+    """
+    expected = bitsets.build(_stream_done_days())
+    table = HabitYearBits.__table__
+    stored = {
+        (habit_id, year): bitsets.from_bytes(blob)
+        for habit_id, year, blob in db.session.execute(db.select(table))
+    }
+    mismatches = sorted(
+        key for key in set(stored) | set(expected)
+        if stored.get(key, 0) != expected.get(key, 0)
+    )
+    if fix and mismatches:
+        bitsets.replace(db.session.connection(), table, expected)
+    return mismatches
+
+def load_completion_history(habit_id, years=None):
+    """История выполнений привычки одним запросом (строка на год).
+
+    years - нужные годы; по умолчанию читается вся история.
+    """
+    query = db.session.query(HabitYearBits.year, HabitYearBits.bits).filter(
+        HabitYearBits.habit_id == habit_id
+    )
+    if years is not None:
+        query = query.filter(HabitYearBits.year.in_(list(years)))
+    return bitsets.CompletionHistory.from_rows(query)
+
+def update_streak_state(habit_id, log_date, new_status):
+    """Инкрементально обновляет состояние серий после изменения одного дня.
+
+    Вызывается после того, как изменение HabitLog уже отправлено в БД (flush).
+    Строка состояния блокируется (FOR UPDATE), чтобы параллельные изменения
+    одной привычки не затирали друг друга.
+    """
+    state = db.session.get(HabitStreak, habit_id, with_for_update=True, populate_existing=True)
+    if state is None:
+        rebuild_streak_states([habit_id])
+        return
+
+    last = state.last_completed_date
+    run_start = last - timedelta(days=state.current_streak - 1) if last else None
+    start = _run_edge(habit_id, log_date, -1)
+    end = _run_edge(habit_id, log_date, 1)
+
+    if new_status:
+        # День присоединился к серии [start, end]
+        length = (end - start).days + 1
+        state.longest_streak = max(state.longest_streak, length)
+        if last is None or end >= last:
+            state.last_completed_date = end
+            state.current_streak = length
+    else:
+        # Серия [start, end] разбилась на [start, log_date - 1] и [log_date + 1, end]
+        old_length = (end - start).days + 1
+        if last is not None and run_start <= log_date <= last:
+            if end > log_date:
+                state.current_streak = (end - log_date).days
+            elif start < log_date:
+                state.last_completed_date = log_date - timedelta(days=1)
+                state.current_streak = (log_date - start).days
+            else:
+                previous = db.session.query(db.func.max(HabitLog.date)).filter(
+                    HabitLog.habit_id == habit_id,
+                    HabitLog.status == True,
+                    HabitLog.date < log_date
+                ).scalar()
+                state.last_completed_date = previous
+                state.current_streak = (
+                    (previous - _run_edge(habit_id, previous, -1)).days + 1 if previous else 0
+                )
+        if old_length >= state.longest_streak:
+            # Разбита самая длинная серия - пересчитываем ее по битовым картам
+            # (один запрос, строка на год), а не по всем отметкам
+            state.longest_streak = load_completion_history(habit_id).longest_run()
+
+    db.session.flush()
+
+def update_streak_states(changes):
+    """Обновляет серии после пакета изменений [(habit_id, день, статус), ...].
+
+    Привычки идут по возрастанию id, чтобы строки серий блокировались в одном
+    порядке. Новые отметки (и единственное изменение) применяются по дням тем
+    же инкрементальным пересчетом, что и одиночная отметка. Если в пакете есть
+    снятые отметки и еще что-то, соседние изменения уже видны в БД и
+    пересчет по дням ошибся бы - тогда состояние целиком берется из битовых
+    карт привычки (один запрос, строка на год).
+    """
+    by_habit = {}
+    for habit_id, day, status in changes:
+        by_habit.setdefault(habit_id, []).append((day, status))
+    for habit_id, days in sorted(by_habit.items()):
+        state = db.session.get(HabitStreak, habit_id, with_for_update=True, populate_existing=True)
+        if state is None:
+            # Состояния еще нет (привычка из импорта) - считаем его один раз
+            rebuild_streak_states([habit_id])
+            continue
+        if len(days) == 1 or all(status for _, status in days):
+            for day, status in sorted(days):
+                update_streak_state(habit_id, day, status)
+            continue
+        history = load_completion_history(habit_id)
+        last = history.last_day()
+        state.last_completed_date = last
+        state.current_streak = history.current_streak(last) if last else 0
+        state.longest_streak = history.longest_run()
+    db.session.flush()
+
+def get_current_streaks(habit_ids, today=None):
+    """Возвращает текущие серии из сохраненного состояния (habit_id -> длина)"""
+    today = today or date.today()
+
+    def load_states():
+        return {
+            state.habit_id: state
+            for state in HabitStreak.query.filter(HabitStreak.habit_id.in_(habit_ids)).all()
+        }
+
+    states = load_states()
+    missing = [habit_id for habit_id in habit_ids if habit_id not in states]
+    if missing:
+        # Состояния еще нет (например, после миграции) - считаем его один раз
+        rebuild_streak_states(missing)
+        db.session.commit()
+        states = load_states()
+    return {habit_id: states[habit_id].current_for(today) for habit_id in habit_ids}
+
+def _week_bucket_expr(column, start):
+    """SQL-выражение номера недели (от start) для группировки на стороне БД"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # date - date в PostgreSQL дает целое число дней
+        return (column - db.literal(start, db.Date)) // 7
+    if dialect == 'sqlite':
+        days = db.cast(db.func.julianday(column) - db.func.julianday(start.isoformat()),
+                       db.Integer)
+        return days // 7
+    return None
+
+def get_weekly_stats_many(habit_ids, weeks=8, today=None):
+    """Получает статистику по неделям сразу для нескольких привычек.
+
+    Недели отсчитываются от сегодняшнего дня, а не с понедельника, поэтому
+    суммируются дневные счетчики daily_rollup - одним GROUP BY в БД (или
+    одним проходом в Python для прочих СУБД). Число недель ограничено
+    WEEKLY_STATS_MAX_WEEKS. Возвращает {habit_id: {'дд.мм': выполнено дней}}.
+    """
+    today = today or date.today()
+    weeks = max(1, min(weeks, app.config['WEEKLY_STATS_MAX_WEEKS']))
+    habit_ids = list(habit_ids)
+    first_week_start = today - timedelta(weeks=weeks - 1)
+    window_end = today + timedelta(days=6)
+
+    filters = (
+        DailyRollup.period == 'day',
+        DailyRollup.habit_id.in_(habit_ids),
+        DailyRollup.period_start >= first_week_start,
+        DailyRollup.period_start <= window_end
+    )
+    counts = {}
+    bucket = _week_bucket_expr(DailyRollup.period_start, first_week_start) if habit_ids else None
+    if bucket is not None:
+        rows = db.session.query(DailyRollup.habit_id, bucket, db.func.sum(DailyRollup.completed))\
+                         .filter(*filters)\
+                         .group_by(DailyRollup.habit_id, bucket)\
+                         .all()
+        for habit_id, week_index, count in rows:
+            counts[(habit_id, int(week_index))] = count or 0
+    elif habit_ids:
+        rows = db.session.query(DailyRollup.habit_id, DailyRollup.period_start,
+                                DailyRollup.completed).filter(*filters)
+        for habit_id, day, completed in rows:
+            key = (habit_id, (day - first_week_start).days // 7)
+            counts[key] = counts.get(key, 0) + completed
+
+    week_keys = [(first_week_start + timedelta(weeks=i)).strftime('%d.%m') for i in range(weeks)]
+    return {
+        habit_id: {
+            week_key: min(counts.get((habit_id, i), 0), 7)  # Максимум 7 дней в неделе
+            for i, week_key in enumerate(week_keys)
+        }
+        for habit_id in habit_ids
+    }
+
+def get_rollup_totals(period, count, habit_ids=(), today=None):
+    """Выполнения за последние count периодов ('day', 'week', 'month') из daily_rollup.
+
+    Один запрос по первичному ключу: общие итоги (habit_id = 0) и, если
+    заданы habit_ids, итоги этих привычек. Стоимость зависит от числа
+    периодов, а не от числа отметок. Возвращает ({'начало периода': итог},
+    {habit_id: {'начало периода': итог}}).
+    """
+    today = today or date.today()
+    starts = [rollups.period_start(period, today)]
+    for _ in range(count - 1):
+        starts.append(rollups.period_start(period, starts[-1] - timedelta(days=1)))
+    starts.reverse()
+    habit_ids = list(habit_ids)
+
+    rows = db.session.query(DailyRollup.habit_id, DailyRollup.period_start,
+                            DailyRollup.completed).filter(
+        DailyRollup.period == period,
+        DailyRollup.habit_id.in_([rollups.ALL_HABITS] + habit_ids),
+        DailyRollup.period_start.between(starts[0], starts[-1])
+    )
+    values = {(habit_id, start): completed for habit_id, start, completed in rows}
+
+    def series(habit_id):
+        return {start.isoformat(): values.get((habit_id, start), 0) for start in starts}
+
+    return series(rollups.ALL_HABITS), {habit_id: series(habit_id) for habit_id in habit_ids}
 
 def get_weekly_stats(habit_id, weeks=8):
     """Получает статистику по неделям за последние N недель"""
-    today = date.today()
-    start_date = today - timedelta(weeks=weeks * 7)
-    
-    # Получаем все логи за период
-    logs = HabitLog.query.filter(
-        HabitLog.habit_id == habit_id,
-        HabitLog.date >= start_date,
-        HabitLog.status == True
-    ).all()
-    
-    # Группируем по неделям
-    weekly_data = {}
-    for i in range(weeks):
-        week_start = today - timedelta(weeks=weeks - i - 1)
-        week_end = week_start + timedelta(days=6)
-        week_key = week_start.strftime('%d.%m')
-        
-        # Подсчитываем выполненные дни за неделю
-        count = sum(1 for log in logs if week_start <= log.date <= week_end)
-        weekly_data[week_key] = min(count, 7)  # Максимум 7 дней в неделе
-    
-    return weekly_data
+    return get_weekly_stats_many([habit_id], weeks)[habit_id]
 
 # Функция для форматирования дней в русском языке
 def russian_plural_days(n):
@@ -176,56 +948,214 @@ def russian_plural_days(n):
     else:
         return "дней"
 
-@app.route('/')
-def index():
-    today = date.today()
-    habits_raw = Habit.query.all()
-    habit_data = []
-    
+page_cache = create_cache(
+    app.config['CACHE_BACKEND'],
+    url=app.config['CACHE_REDIS_URL'],
+    maxsize=app.config['CACHE_MAX_ENTRIES'],
+    ttl=app.config['CACHE_TTL_SECONDS']
+)
+
+def _history_cache_view(view):
+    return view if view in ('2weeks', 'year') else 'weeks'
+
+# Версия данных входит в ключ: маршрут читает ее до загрузки, поэтому под
+# ключом версии V не может оказаться данных старше V, и ETag той же версии
+# никогда не сочетается с устаревшей страницей. Явный сброс не нужен -
+# записи прежних версий вытесняются LRU или истекают по TTL.
+
+def dashboard_cache_key(today, version):
+    # Дата в ключе: после полуночи страница строится заново
+    return f"dashboard:{version}:{today.isoformat()}"
+
+def history_cache_key(habit_id, view, today, version, year=None):
+    if view == 'year':
+        return f"history:{habit_id}:year:{year}:{version}:{today.isoformat()}"
+    return f"history:{habit_id}:{_history_cache_view(view)}:{version}:{today.isoformat()}"
+
+def cached(key, loader):
+    """Значение из page_cache или результат loader(), который кладется в кеш"""
+    value = page_cache.get(key)
+    if value is MISSING:
+        value = loader()
+        page_cache.set(key, value)
+    return value
+
+def bump_versions(habit_ids=()):
+    """Увеличивает глобальную версию и версии привычек в текущей транзакции.
+
+    Вызывается изменяющими маршрутами до коммита: новая версия становится
+    видна ровно тогда же, когда и сами изменения.
+    """
+    keys = ['global'] + [f'habit:{habit_id}' for habit_id in sorted(set(habit_ids))]
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    table = ResourceVersion.__table__
+    statement = dialect.insert(table).values([{'key': key, 'version': 1} for key in keys])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={'version': table.c.version + 1}
+    )
+    db.session.execute(statement)
+
+def get_versions(keys):
+    """{ключ: версия} одним запросом по первичному ключу; нет строки - версия 0"""
+    rows = db.session.query(ResourceVersion.key, ResourceVersion.version).filter(
+        ResourceVersion.key.in_(keys)
+    )
+    versions = dict.fromkeys(keys, 0)
+    versions.update(rows)
+    return versions
+
+def make_etag(*parts):
+    """Сильный ETag из частей, от которых зависит ответ"""
+    raw = '|'.join(str(part) for part in (app.config['ETAG_SALT'],) + parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def not_modified(etag):
+    """Ответ 304, если у клиента уже есть версия etag, иначе None"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+def with_etag(response, etag):
+    """Ставит ETag и требует перепроверки перед каждым использованием копии"""
+    response = app.make_response(response)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def load_dashboard_data(today=None):
+    """Загружает данные главной страницы фиксированным числом запросов.
+
+    Один запрос получает привычки, второй - сохраненные серии, третий -
+    дневные счетчики daily_rollup за последние 14 дней по всем привычкам сразу.
+    """
+    today = today or date.today()
+    habits_raw = db.session.query(Habit.id, Habit.name).order_by(Habit.id).all()
+    if not habits_raw:
+        return []
+    streaks = get_current_streaks([h.id for h in habits_raw], today)
+
     # Генерируем 14 точек для истории (последние 2 недели)
     last_14_days = [(today - timedelta(days=i)) for i in range(13, -1, -1)]
-    
+    window_start = last_14_days[0]
+
+    statuses = {}
+    rows = db.session.query(DailyRollup.habit_id, DailyRollup.period_start).filter(
+        DailyRollup.period == 'day',
+        DailyRollup.habit_id != rollups.ALL_HABITS,
+        DailyRollup.period_start.between(window_start, today),
+        DailyRollup.completed > 0
+    ).all()
+    for habit_id, log_date in rows:
+        statuses[(habit_id, log_date)] = True
+
+    habit_data = []
     for h in habits_raw:
-        log_today = HabitLog.query.filter_by(habit_id=h.id, date=today).first()
-        
-        # Рассчитываем текущую серию
-        current_streak = calculate_streak(h.id)
-        
-        # Получаем историю за 14 дней
-        two_week_history = []
-        for d in last_14_days:
-            l = HabitLog.query.filter_by(habit_id=h.id, date=d).first()
-            two_week_history.append(l.status if l else False)
-        
+        two_week_history = [statuses.get((h.id, d), False) for d in last_14_days]
+
         # Рассчитываем прогресс за 2 недели
         completed_last_14 = sum(two_week_history)
         progress_percentage = int((completed_last_14 / 14) * 100) if two_week_history else 0
-        
+
         habit_data.append({
             'id': h.id,
             'name': h.name,
-            'done_today': log_today.status if log_today else False,
-            'current_streak': current_streak,
+            'done_today': statuses.get((h.id, today), False),
+            'current_streak': streaks.get(h.id, 0),
             'two_week_history': two_week_history,
             'progress_percentage': progress_percentage,
             'completed_last_14': completed_last_14,
             'total_last_14': 14
         })
+
+    return habit_data
+
+MONTH_LABELS = ['янв', 'фев', 'мар', 'апр', 'май', 'июн',
+                'июл', 'авг', 'сен', 'окт', 'ноя', 'дек']
+
+def load_history_snapshot(habit_id, view='2weeks', today=None, weeks=8, year=None):
+    """Загружает все данные страницы истории одним запросом к годовым битовым картам.
+
+    Из карт строятся редактируемая история за 14 дней, значения графика,
+    недельные суммы и годовой календарь; серия берется из сохраненного
+    состояния. Для любого вида читается не больше пары строк на год, поэтому
+    годовой вид стоит столько же, сколько двухнедельный.
+    """
+    today = today or date.today()
+    editable_days = [today - timedelta(days=i) for i in range(13, -1, -1)]
+    first_week_start = today - timedelta(weeks=weeks - 1)
+
+    if view == '2weeks':
+        start, end = editable_days[0], today
+    elif view == 'year':
+        year = year or today.year
+        start, end = date(year, 1, 1), date(year, 12, 31)
+    else:
+        start, end = first_week_start, today + timedelta(days=6)
+    years = set(range(start.year, end.year + 1)) | {editable_days[0].year, today.year}
+    completion = load_completion_history(habit_id, years)
+
+    editable_history = [{
+        'date': d,
+        'status': status,
+        'date_str': d.strftime('%Y-%m-%d'),
+        'day_name': d.strftime('%A')
+    } for d, status in zip(editable_days, completion.days(editable_days[0], today))]
+
+    snapshot = {'current_streak': get_current_streaks([habit_id], today)[habit_id],
+                'editable_history': editable_history}
+    if view == '2weeks':
+        snapshot['labels'] = [d.strftime('%d.%m') for d in editable_days]
+        snapshot['values'] = [1 if entry['status'] else 0 for entry in editable_history]
+        snapshot['chart_title'] = "За последние 2 недели"
+    elif view == 'year':
+        months = completion.month_counts(year)
+        snapshot.update({
+            'labels': MONTH_LABELS,
+            'values': months,
+            'chart_title': f"Выполнено по месяцам за {year} год",
+            'year': year,
+            'year_completed': sum(months),
+            'year_days': (end - start).days + 1,
+            'heatmap_start': start - timedelta(days=start.weekday()),
+            'heatmap': completion.week_grid(start, end)
+        })
+    else:
+        snapshot['labels'] = [(first_week_start + timedelta(weeks=i)).strftime('%d.%m')
+                              for i in range(weeks)]
+        snapshot['values'] = completion.weekly_counts(first_week_start, weeks)
+        snapshot['chart_title'] = f"Статистика по неделям ({weeks} недель)"
+    return snapshot
+
+@app.route('/')
+def index():
+    today = date.today()
+    version = get_versions(['global'])['global']
+    etag = make_etag('index', today, version, app.config['EVENTS_LIVE_RELOAD'])
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
+    habit_data = cached(dashboard_cache_key(today, version), lambda: load_dashboard_data(today))
     
     # Рассчитываем общую статистику для отображения
-    total_habits = len(habits_raw)
+    total_habits = len(habit_data)
     completed_today = sum(1 for h in habit_data if h['done_today'])
     
     log_activity('view_index', details=f'Total habits: {total_habits}', request=request)
     
     # Передаем функции в шаблон
-    return render_template('index.html', 
+    return with_etag(render_template('index.html', 
                          habits=habit_data, 
                          today=today,
                          timedelta=timedelta,
                          russian_plural_days=russian_plural_days,
                          total_habits=total_habits,
-                         completed_today=completed_today)
+                         completed_today=completed_today,
+                         live_reload=app.config['EVENTS_LIVE_RELOAD']), etag)
 
 @app.route('/add', methods=['POST'])
 def add_habit():
@@ -233,6 +1163,11 @@ def add_habit():
     if name:
         new_habit = Habit(name=name.strip())
         db.session.add(new_habit)
+        db.session.flush()
+        # Пустое состояние серий сразу: главной странице не нужно создавать его при чтении
+        db.session.add(HabitStreak(habit_id=new_habit.id))
+        emit_event('habit', {'habit_id': new_habit.id, 'action': 'created'})
+        bump_versions([new_habit.id])
         db.session.commit()
         
         # Логируем создание привычки
@@ -255,17 +1190,12 @@ def toggle_today(habit_id):
         abort(404)
     
     today = date.today()
-    log = HabitLog.query.filter_by(habit_id=habit_id, date=today).first()
-    
-    old_status = log.status if log else False
-    new_status = not old_status if log else True
-    
-    if log:
-        log.status = new_status
-    else:
-        log = HabitLog(habit_id=habit_id, date=today, status=True)
-        db.session.add(log)
+    new_status = toggle_habit_log(habit_id, today)
+    old_status = not new_status
     
+    update_streak_state(habit_id, today, new_status)
+    emit_event('habit_log', {'habit_id': habit_id, 'date': today.isoformat(), 'status': new_status})
+    bump_versions([habit_id])
     db.session.commit()
     
     # Логируем переключение
@@ -277,56 +1207,58 @@ def toggle_today(habit_id):
     
     return redirect(url_for('index'))
 
+def _heatmap_cells(grid):
+    """Сетка календаря для JSON: 1 - выполнено, 0 - нет, None - день другого года"""
+    return [[None if cell is None else int(cell) for cell in week] for week in grid]
+
+def _heatmap_year(today):
+    """Год из ?year= (по умолчанию текущий) или None, если это не число или
+    год вне EARLIEST_LOG_DATE.year..следующий год"""
+    value = request.args.get('year')
+    if value is None:
+        return today.year
+    try:
+        year = int(value)
+    except ValueError:
+        return None
+    if not EARLIEST_LOG_DATE.year <= year <= today.year + 1:
+        return None
+    return year
+
 @app.route('/history/<int:habit_id>')
 @app.route('/history/<int:habit_id>/<string:view>')
 def history(habit_id, view='2weeks'):
+    today = date.today()
+    year = _heatmap_year(today) if view == 'year' else None
+    if view == 'year' and year is None:
+        abort(400)
+    # Удаление привычки тоже увеличивает ее версию, поэтому 304 не переживет 404
+    version = get_versions([f'habit:{habit_id}'])[f'habit:{habit_id}']
+    etag = make_etag('history', habit_id, view, year, today, version)
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
     habit = db.session.get(Habit, habit_id)
     if not habit:
         abort(404)
     
     log_activity('view_history', habit_id=habit_id, 
-                details=f'View: {view}', request=request)
-    
-    current_streak = calculate_streak(habit_id)
-    
-    if view == '2weeks':
-        days_count = 14
-        days = [date.today() - timedelta(days=i) for i in range(days_count - 1, -1, -1)]
-        chart_title = "За последние 2 недели"
-    else:
-        weekly_data = get_weekly_stats(habit_id, 8)
-        days = []
-        chart_title = "Статистика по неделям (8 недель)"
-    
-    editable_days = [date.today() - timedelta(days=i) for i in range(13, -1, -1)]
-    editable_history = []
+                details=f'View: {view}' + (f', year: {year}' if year else ''), request=request)
     
-    for d in editable_days:
-        log = HabitLog.query.filter_by(habit_id=habit_id, date=d).first()
-        is_done = log.status if log else False
-        editable_history.append({
-            'date': d, 
-            'status': is_done,
-            'date_str': d.strftime('%Y-%m-%d'),
-            'day_name': d.strftime('%A')
-        })
-    
-    if view == '2weeks':
-        labels = [d.strftime('%d.%m') for d in days]
-        values = []
-        for d in days:
-            log = HabitLog.query.filter_by(habit_id=habit_id, date=d).first()
-            values.append(1 if log and log.status else 0)
-    else:
-        weekly_data = get_weekly_stats(habit_id, 8)
-        labels = list(weekly_data.keys())
-        values = list(weekly_data.values())
+    snapshot = cached(history_cache_key(habit_id, view, today, version, year),
+                      lambda: load_history_snapshot(habit_id, view, today, year=year))
+    current_streak = snapshot['current_streak']
+    editable_history = snapshot['editable_history']
+    labels = snapshot['labels']
+    values = snapshot['values']
+    chart_title = snapshot['chart_title']
     
     completed_total = sum(1 for entry in editable_history if entry['status'])
     total_days = len(editable_history)
     percentage = int((completed_total / total_days * 100)) if total_days > 0 else 0
     
-    return render_template('history.html', 
+    return with_etag(render_template('history.html', 
                            habit=habit,
                            labels=json.dumps(labels),
                            values=json.dumps(values),
@@ -337,24 +1269,37 @@ def history(habit_id, view='2weeks'):
                            completed_total=completed_total,
                            total_days=total_days,
                            percentage=percentage,
+                           year=snapshot.get('year'),
+                           min_year=EARLIEST_LOG_DATE.year,
+                           max_year=today.year + 1,
+                           year_completed=snapshot.get('year_completed'),
+                           year_days=snapshot.get('year_days'),
+                           heatmap=json.dumps(_heatmap_cells(snapshot['heatmap'])) if view == 'year' else None,
+                           heatmap_start=snapshot.get('heatmap_start'),
                            russian_plural_days=russian_plural_days,
-                           timedelta=timedelta)
+                           timedelta=timedelta), etag)
 
 @app.route('/history_update/<int:habit_id>/<string:log_date>', methods=['POST'])
 def history_update(habit_id, log_date):
     try:
         target_date = datetime.strptime(log_date, '%Y-%m-%d').date()
-        log = HabitLog.query.filter_by(habit_id=habit_id, date=target_date).first()
-        
-        old_status = log.status if log else False
+    except ValueError:
+        target_date = None
+    if target_date is None or not is_loggable_date(target_date):
+        log_activity('update_history_error', habit_id=habit_id,
+                    details=f'Invalid date: {log_date}', request=request)
+        abort(400)
+
+    try:
         new_status = 'status' in request.form
+        changed = set_habit_log_status(habit_id, target_date, new_status)
+        old_status = not new_status if changed else new_status
         
-        if log:
-            log.status = new_status
-        else:
-            log = HabitLog(habit_id=habit_id, date=target_date, status=new_status)
-            db.session.add(log)
-        
+        if changed:
+            update_streak_state(habit_id, target_date, new_status)
+            emit_event('habit_log', {'habit_id': habit_id, 'date': target_date.isoformat(),
+                                     'status': new_status})
+            bump_versions([habit_id])
         db.session.commit()
         
         # Логируем обновление истории
@@ -381,13 +1326,19 @@ def delete_habit(habit_id):
     
     habit_name = habit.name
     
-    # Логируем перед удалением
-    log_activity('delete_habit', habit_id=habit_id, 
-                details=f'Name: {habit_name}', request=request)
-    
     db.session.delete(habit)
+    # Flush вычитает отметки привычки из общих счетчиков, ее собственные удаляем
+    db.session.flush()
+    db.session.execute(db.delete(DailyRollup).where(DailyRollup.habit_id == habit_id))
+    emit_event('habit', {'habit_id': habit_id, 'action': 'deleted'})
+    bump_versions([habit_id])
     db.session.commit()
     
+    # Логируем после удаления без ссылки на привычку: запись пишется в фоне
+    # и иначе нарушила бы внешний ключ (или удалилась бы каскадом вместе с ней)
+    log_activity('delete_habit', 
+                details=f'ID: {habit_id}, Name: {habit_name}', request=request)
+    
     app.logger.info(f"Habit deleted: {habit_name} (ID: {habit_id})")
     
     return redirect(url_for('index'))
@@ -396,56 +1347,576 @@ def delete_habit(habit_id):
 def api_weekly_stats(habit_id):
     """API для получения статистики по неделям"""
     weeks = request.args.get('weeks', 8, type=int)
+    etag = make_etag('weekly_stats', habit_id, weeks, date.today(),
+                     get_versions([f'habit:{habit_id}'])[f'habit:{habit_id}'])
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
     weekly_data = get_weekly_stats(habit_id, weeks)
     
     log_activity('api_call', habit_id=habit_id, 
                 details=f'weekly_stats, weeks={weeks}', request=request)
     
-    return jsonify(weekly_data)
+    return with_etag(jsonify(weekly_data), etag)
+
+@app.route('/api/weekly_stats')
+def api_weekly_stats_many():
+    """API для статистики по неделям сразу по нескольким привычкам (?habit_ids=1,2,3)"""
+    weeks = request.args.get('weeks', 8, type=int)
+    try:
+        habit_ids = [int(value) for value in request.args.get('habit_ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'habit_ids must be a comma-separated list of integers'}), 400
+    if not habit_ids:
+        return jsonify({'error': 'habit_ids is required'}), 400
+
+    keys = [f'habit:{habit_id}' for habit_id in habit_ids]
+    versions = get_versions(keys)
+    etag = make_etag('weekly_stats_many', weeks, date.today(),
+                     *(f'{key}={versions[key]}' for key in keys))
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
+    weekly_data = get_weekly_stats_many(habit_ids, weeks)
+    
+    log_activity('api_call', details=f'weekly_stats, habits={len(habit_ids)}, weeks={weeks}',
+                 request=request)
+    
+    return with_etag(jsonify({
+        'weeks': min(max(weeks, 1), app.config['WEEKLY_STATS_MAX_WEEKS']),
+        'habits': {str(habit_id): stats for habit_id, stats in weekly_data.items()}
+    }), etag)
+
+@app.route('/api/stats/<string:period>')
+def api_rollup_stats(period):
+    """Итоги выполнений по дням, неделям или месяцам (?count=12&habit_ids=1,2) из daily_rollup"""
+    if period not in rollups.PERIODS:
+        abort(404)
+    count = max(1, min(request.args.get('count', 12, type=int),
+                       app.config['ROLLUP_STATS_MAX_PERIODS']))
+    try:
+        habit_ids = [int(value) for value in request.args.get('habit_ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'habit_ids must be a comma-separated list of integers'}), 400
+
+    today = date.today()
+    etag = make_etag('rollup_stats', period, count, today, ','.join(map(str, habit_ids)),
+                     get_versions(['global'])['global'])
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
+    totals, habits = get_rollup_totals(period, count, habit_ids, today)
+    log_activity('api_call', details=f'rollup_stats, period={period}, count={count}',
+                 request=request)
+    return with_etag(jsonify({
+        'period': period,
+        'totals': totals,
+        'habits': {str(habit_id): series for habit_id, series in habits.items()}
+    }), etag)
+
+@app.route('/api/heatmap/<int:habit_id>')
+def api_heatmap(habit_id):
+    """Годовой календарь выполнений (?year=2026): сетка недель по 7 дней и итоги по месяцам"""
+    today = date.today()
+    year = _heatmap_year(today)
+    if year is None:
+        return jsonify({'error': f'year must be between {EARLIEST_LOG_DATE.year} and {today.year + 1}'}), 400
+    version = get_versions([f'habit:{habit_id}'])[f'habit:{habit_id}']
+    etag = make_etag('heatmap', habit_id, year, today, version)
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
+    if not db.session.get(Habit, habit_id):
+        abort(404)
+    snapshot = cached(history_cache_key(habit_id, 'year', today, version, year),
+                      lambda: load_history_snapshot(habit_id, 'year', today, year=year))
+    log_activity('api_call', habit_id=habit_id, details=f'heatmap, year={year}', request=request)
+    return with_etag(jsonify({
+        'habit_id': habit_id,
+        'year': year,
+        'days': snapshot['year_days'],
+        'completed': snapshot['year_completed'],
+        'first_monday': snapshot['heatmap_start'].isoformat(),
+        # Недели с понедельника: 1 - выполнено, 0 - нет, null - день другого года
+        'grid': _heatmap_cells(snapshot['heatmap']),
+        'months': {f'{year}-{month:02d}': count
+                   for month, count in enumerate(snapshot['values'], start=1)}
+    }), etag)
+
+@app.route('/api/summary/<int:habit_id>')
+def api_habit_summary(habit_id):
+    """Сводка по всей истории привычки из годовых битовых карт"""
+    today = date.today()
+    etag = make_etag('summary', habit_id, today,
+                     get_versions([f'habit:{habit_id}'])[f'habit:{habit_id}'])
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
+    if not db.session.get(Habit, habit_id):
+        abort(404)
+    history = load_completion_history(habit_id)
+    first_week_start = today - timedelta(weeks=7)
+    log_activity('api_call', habit_id=habit_id, details='summary', request=request)
+    return with_etag(jsonify({
+        'habit_id': habit_id,
+        'completed_days': history.bits.bit_count(),
+        'current_streak': history.current_streak(today),
+        'longest_streak': history.longest_run(),
+        'completion_rate_30': round(history.completion_rate(today - timedelta(days=29), today), 4),
+        'completion_rate_365': round(history.completion_rate(today - timedelta(days=364), today), 4),
+        'weekly': dict(zip(
+            [(first_week_start + timedelta(weeks=i)).strftime('%d.%m') for i in range(8)],
+            history.weekly_counts(first_week_start, 8)
+        ))
+    }), etag)
+
+def _parse_checkin(item):
+    """Проверяет элемент пакета отметок; возвращает (habit_id, date, status) или текст ошибки"""
+    if not isinstance(item, dict):
+        return 'item must be an object'
+    habit_id, status = item.get('habit_id'), item.get('status')
+    if not isinstance(habit_id, int) or isinstance(habit_id, bool):
+        return 'habit_id must be an integer'
+    if not isinstance(status, bool):
+        return 'status must be a boolean'
+    try:
+        day = date.fromisoformat(item.get('date'))
+    except (TypeError, ValueError):
+        return 'date must be YYYY-MM-DD'
+    if not is_loggable_date(day):
+        return f'date must be between {EARLIEST_LOG_DATE.isoformat()} and today'
+    return habit_id, day, status
+
+@app.route('/api/checkins', methods=['POST'])
+def api_checkins():
+    """Пакетные отметки: {"items": [{"habit_id": 1, "date": "2026-10-01", "status": true}, ...]}.
+
+    Корректные элементы применяются в одной транзакции (не больше двух
+    запросов на запись), ошибочные пропускаются. В журнал пишется одна
+    запись на весь пакет. Ответ содержит результат по каждому элементу.
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    max_batch = app.config['CHECKINS_MAX_BATCH']
+    if len(items) > max_batch:
+        return jsonify({'error': f'too many items, max is {max_batch}'}), 413
+
+    parsed = [_parse_checkin(item) for item in items]
+    requested_ids = {entry[0] for entry in parsed if isinstance(entry, tuple)}
+    existing_ids = {
+        row.id for row in db.session.query(Habit.id).filter(Habit.id.in_(requested_ids))
+    } if requested_ids else set()
+
+    results = []
+    valid = []
+    seen = set()
+    for index, entry in enumerate(parsed):
+        if isinstance(entry, tuple):
+            habit_id, day, status = entry
+            if habit_id not in existing_ids:
+                entry = 'habit not found'
+            elif (habit_id, day) in seen:
+                entry = 'duplicate habit_id and date in batch'
+            else:
+                seen.add((habit_id, day))
+                valid.append(entry)
+        results.append({'index': index, 'error': entry} if isinstance(entry, str) else
+                       {'index': index, 'habit_id': entry[0], 'date': entry[1].isoformat(),
+                        'status': entry[2]})
+
+    changed = set()
+    if valid:
+        try:
+            changed = set_habit_log_statuses(valid)
+            habit_ids = sorted({habit_id for habit_id, _ in changed})
+            if habit_ids:
+                update_streak_states([entry for entry in valid if entry[:2] in changed])
+                emit_event('habit_log', {'habit_ids': habit_ids, 'changed': len(changed)})
+                bump_versions(habit_ids)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Bulk check-in failed: {e}")
+            return jsonify({'error': 'bulk check-in failed'}), 500
+
+    for result in results:
+        if 'error' in result:
+            result['result'] = 'error'
+        else:
+            key = (result['habit_id'], date.fromisoformat(result['date']))
+            result['result'] = 'changed' if key in changed else 'unchanged'
+
+    summary = {
+        'changed': len(changed),
+        'unchanged': len(valid) - len(changed),
+        'errors': len(items) - len(valid)
+    }
+    log_activity('bulk_checkin',
+                 details=f"Items: {len(items)}, changed: {summary['changed']}, "
+                         f"unchanged: {summary['unchanged']}, errors: {summary['errors']}",
+                 request=request)
+    return jsonify({'results': results, **summary})
+
+def _export_statement(name):
+    """(запрос, колонки) выгрузки таблицы name; порядок по id для воспроизводимости"""
+    if name == 'habits':
+        table = Habit.__table__
+    elif name == 'habit_logs':
+        table = HabitLog.__table__
+    elif name == 'activity_logs':
+        table, agents = ActivityLog.__table__, UserAgent.__table__
+        columns = [agents.c.value.label(field) if field == 'user_agent' else table.c[field]
+                   for field in ARCHIVE_FIELDS]
+        statement = (db.select(*columns)
+                     .select_from(table.outerjoin(agents, table.c.user_agent_id == agents.c.id))
+                     .order_by(table.c.id))
+        return statement, list(ARCHIVE_FIELDS)
+    else:
+        return None, None
+    return db.select(table).order_by(table.c.id), [column.name for column in table.columns]
+
+# Таблицы, которые можно загрузить обратно (в порядке зависимостей)
+IMPORT_TABLES = {'habits': Habit.__table__, 'habit_logs': HabitLog.__table__}
+
+def export_chunks(name, fmt):
+    """Куски выгрузки таблицы name в формате fmt; соединение держится, пока идет поток"""
+    statement, columns = _export_statement(name)
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    with db.engine.connect() as connection:
+        rows = transfer.stream_rows(connection, statement, batch_size)
+        yield from transfer.encode(rows, columns, fmt, batch_size)
+
+def import_records(name, lines, fmt):
+    """Загружает выгрузку таблицы name одной транзакцией; возвращает число строк"""
+    table = IMPORT_TABLES[name]
+    columns = [column.name for column in table.columns]
+    with db.engine.begin() as connection:
+        loaded = transfer.bulk_load(connection, table, columns, transfer.decode(lines, fmt),
+                                    chunk_size=app.config['IMPORT_CHUNK_SIZE'])
+        transfer.reset_sequence(connection, table)
+    return loaded
+
+@app.route('/export/<string:name>.<string:fmt>')
+def export_table(name, fmt):
+    """Потоковая выгрузка: /export/habits.csv, /export/habit_logs.jsonl, /export/activity_logs.csv"""
+    if fmt not in transfer.FORMATS or _export_statement(name)[0] is None:
+        abort(404)
+    log_activity('export', details=f'{name}.{fmt}', request=request)
+    return Response(
+        stream_with_context(export_chunks(name, fmt)),
+        content_type=transfer.CONTENT_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'}
+    )
+
+def encode_log_cursor(log):
+    """Курсор keyset-пагинации журнала: непрозрачная строка из (timestamp, id)"""
+    raw = f"{log.timestamp.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_log_cursor(cursor):
+    """Разбирает курсор в (timestamp, id); ValueError, если он поврежден"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, _, log_id = base64.urlsafe_b64decode(padded).decode().partition('|')
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+def format_activity(log):
+    """Запись журнала в виде словаря для шаблона и JSON"""
+    return {
+        'id': log.id,
+        'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'habit_id': log.habit_id,
+        'action': log.action,
+        'details': log.details,
+        'ip': log.ip_address
+    }
+
+def query_activity_page(limit=100, before=None, since=None, action=None, habit_id=None,
+                        start=None, end=None):
+    """Страница журнала с keyset-пагинацией по (timestamp, id).
+
+    before - курсор: вернуть записи старше него (от новых к старым);
+    since - курсор: вернуть только записи новее него (от старых к новым),
+    чтобы клиент мог догружать изменения без перечитывания всего журнала.
+    """
+    key = db.tuple_(ActivityLog.timestamp, ActivityLog.id)
+    query = ActivityLog.query
+    if action:
+        query = query.filter(ActivityLog.action == action)
+    if habit_id is not None:
+        query = query.filter(ActivityLog.habit_id == habit_id)
+    if start is not None:
+        query = query.filter(ActivityLog.timestamp >= start)
+    if end is not None:
+        query = query.filter(ActivityLog.timestamp < end)
+
+    # Сравнение кортежей PostgreSQL не использует для отсечения секций,
+    # поэтому границу по timestamp дублируем отдельным условием
+    if since is not None:
+        query = query.filter(key > since, ActivityLog.timestamp >= since[0])
+        query = query.order_by(ActivityLog.timestamp, ActivityLog.id)
+    else:
+        if before is not None:
+            query = query.filter(key < before, ActivityLog.timestamp <= before[0])
+        query = query.order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc())
+
+    # Одна лишняя запись показывает, есть ли следующая страница
+    rows = query.limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
 
 @app.route('/logs')
 def view_logs():
     """Страница для просмотра логов"""
-    # Получаем последние 100 записей
-    logs = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).limit(100).all()
+    # Страница показывает записи за окно LOGS_VIEW_WINDOW_DAYS; той же границей
+    # ограничен и запрос версии, чтобы он читал только свежие секции
+    window_start = datetime.now(timezone.utc) - timedelta(days=app.config['LOGS_VIEW_WINDOW_DAYS'])
+    # Версия журнала - первая и последняя запись окна, кроме собственных
+    # просмотров этой страницы: иначе каждый просмотр менял бы ETag следующего.
+    # Первая нужна потому, что очистка по сроку хранения удаляет старые
+    # записи внутри окна, не меняя последнюю
+    oldest_id, latest_id = db.session.query(
+        db.func.min(ActivityLog.id), db.func.max(ActivityLog.id)
+    ).filter(
+        ActivityLog.timestamp >= window_start,
+        ActivityLog.action != 'view_logs'
+    ).one()
+    etag = make_etag('logs', date.today(), oldest_id, latest_id)
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
+
+    # Получаем последние 100 записей за окно
+    logs, _ = query_activity_page(limit=100, start=window_start)
     
     # Форматируем для отображения
-    formatted_logs = []
-    for log in logs:
-        formatted_logs.append({
-            'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'habit_id': log.habit_id,
-            'action': log.action,
-            'details': log.details,
-            'ip': log.ip_address
-        })
+    formatted_logs = [format_activity(log) for log in logs]
+    latest_cursor = encode_log_cursor(logs[0]) if logs else ''
     
     log_activity('view_logs', details=f'Viewed {len(logs)} logs', request=request)
     
-    return render_template('logs.html', logs=formatted_logs)
+    return with_etag(render_template('logs.html', logs=formatted_logs, latest_cursor=latest_cursor,
+                                     poll_interval_ms=app.config['LOGS_POLL_INTERVAL_MS']), etag)
+
+@app.route('/api/logs')
+def api_logs():
+    """JSON-журнал: keyset-пагинация (cursor), фильтры и режим догрузки (since).
+
+    Параметры: limit, cursor, since, action, habit_id, from, to (ISO 8601).
+    Запрос не пишется в журнал, чтобы опрос страницы не порождал новые записи.
+    """
+    limit = max(1, min(request.args.get('limit', 100, type=int), app.config['LOGS_API_MAX_LIMIT']))
+    try:
+        before = decode_log_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        since = decode_log_cursor(request.args['since']) if request.args.get('since') else None
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    logs, has_more = query_activity_page(
+        limit=limit,
+        before=before,
+        since=since,
+        action=request.args.get('action') or None,
+        habit_id=request.args.get('habit_id', type=int),
+        start=start,
+        end=end
+    )
+
+    response = {'logs': [format_activity(log) for log in logs], 'has_more': has_more}
+    if since is not None:
+        # Новые записи идут от старых к новым; курсор - последняя из них
+        response['latest_cursor'] = encode_log_cursor(logs[-1]) if logs else request.args['since']
+    else:
+        response['next_cursor'] = encode_log_cursor(logs[-1]) if logs and has_more else None
+        response['latest_cursor'] = encode_log_cursor(logs[0]) if logs else None
+    return jsonify(response)
+
+def ensure_log_partitions(today=None):
+    """Создает секции журнала на LOG_PARTITION_MONTHS_AHEAD месяцев вперед (только PostgreSQL)"""
+    with db.engine.begin() as connection:
+        if not is_partitioned(connection, ActivityLog.__tablename__):
+            return []
+        return ensure_partitions(connection, ActivityLog.__tablename__, 'timestamp',
+                                 today or date.today(),
+                                 months_ahead=app.config['LOG_PARTITION_MONTHS_AHEAD'])
+
+def retention_cutoff(days=None):
+    """Граница хранения - полночь (UTC), чтобы архив и удаление шли целыми днями"""
+    days = days if days is not None else app.config['LOG_RETENTION_DAYS']
+    day = datetime.now(timezone.utc).date() - timedelta(days=days)
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def _whole_days(rows, max_rows, result):
+    """Пропускает строки, пока их не больше max_rows, но обрывает поток только
+    на границе дня; в result['until'] записывает полночь первого непрочитанного дня"""
+    count = 0
+    previous = None
+    for row in rows:
+        day = row['timestamp'].date()
+        if count >= max_rows and day != previous:
+            result['until'] = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            return
+        previous = day
+        count += 1
+        yield row
+
+def archive_old_logs(cutoff, directory=None, max_rows=None):
+    """Выгружает записи журнала старше cutoff в сжатые файлы по дням.
+
+    Строки читаются потоком (yield_per, на PostgreSQL - серверный курсор),
+    поэтому память не зависит от размера журнала. С max_rows выгружается
+    примерно столько строк, но только целыми днями; 'until' в результате -
+    граница, до которой все записи уже в архиве (иначе равна cutoff).
+    """
+    archiver = LogArchiver(directory or app.config['LOG_ARCHIVE_DIR'],
+                           compresslevel=app.config['LOG_ARCHIVE_COMPRESSLEVEL'])
+    table = ActivityLog.__table__
+    agents = UserAgent.__table__
+    columns = [agents.c.value.label(field) if field == 'user_agent' else table.c[field]
+               for field in ARCHIVE_FIELDS]
+    statement = (
+        db.select(*columns)
+        .select_from(table.outerjoin(agents, table.c.user_agent_id == agents.c.id))
+        .where(table.c.timestamp < cutoff)
+        .order_by(table.c.timestamp, table.c.id)
+    )
+    bound = {'until': cutoff}
+    with db.engine.connect() as connection:
+        result = connection.execution_options(yield_per=1000).execute(statement)
+        rows = (row._mapping for row in result)
+        if max_rows is not None:
+            rows = _whole_days(rows, max_rows, bound)
+        stats = archiver.write(rows)
+    stats['until'] = bound['until']
+    return stats
+
+def purge_old_logs(days=None, chunk_size=None, max_chunks=None, progress=None):
+    """Удаляет записи журнала старше days дней.
+
+    Если задан LOG_ARCHIVE_DIR, записи сначала выгружаются в архив и
+    удаляются только уже выгруженные. При max_chunks архив ограничен тем же
+    числом строк (целыми днями), так что и HTTP-запрос остается коротким. На
+    секционированной таблице целиком устаревшие месяцы отключаются и
+    удаляются одной операцией, пачками по id дочищается только граничный месяц.
+    """
+    cutoff = retention_cutoff(days)
+    chunk_size = chunk_size or app.config['LOG_PURGE_CHUNK_SIZE']
+    archived = None
+    if app.config['LOG_ARCHIVE_DIR']:
+        archived = archive_old_logs(cutoff, max_rows=max_chunks * chunk_size if max_chunks else None)
+        cutoff = archived['until']
+    dropped = []
+    with db.engine.begin() as connection:
+        if is_partitioned(connection, ActivityLog.__tablename__):
+            dropped = drop_partitions_before(connection, ActivityLog.__tablename__, cutoff.date(),
+                                             detach_only=app.config['LOG_PARTITION_DETACH_ONLY'])
+    purge = ChunkedPurge(
+        db.engine, ActivityLog.__table__, ActivityLog.timestamp, ActivityLog.id,
+        chunk_size=chunk_size,
+        pause=app.config['LOG_PURGE_PAUSE_MS'] / 1000
+    )
+    result = purge.run(cutoff, max_chunks=max_chunks, progress=progress)
+    result['dropped_partitions'] = dropped
+    result['archived'] = archived
+    return result
 
 @app.route('/logs/clear', methods=['POST'])
 def clear_logs():
-    """Очистка логов (только для админа)"""
+    """Очистка логов (только для админа).
+
+    За один запрос удаляется не больше LOG_PURGE_HTTP_MAX_CHUNKS пачек;
+    полную очистку большой таблицы делает команда purge-logs (CronJob).
+    """
     try:
-        # Удаляем логи старше 30 дней
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=30)
-        deleted_count = ActivityLog.query.filter(ActivityLog.timestamp < cutoff_date).delete()
-        db.session.commit()
+        result = purge_old_logs(max_chunks=app.config['LOG_PURGE_HTTP_MAX_CHUNKS'])
+        deleted_count = result['deleted']
         
         log_activity('clear_logs', details=f'Deleted {deleted_count} old logs', request=request)
-        app.logger.info(f"Cleared {deleted_count} old logs")
+        app.logger.info(f"Cleared {deleted_count} old logs, remaining {result['remaining']}")
         
-        return jsonify({'success': True, 'deleted': deleted_count})
+        return jsonify({'success': True, 'deleted': deleted_count,
+                        'remaining': result['remaining'], 'complete': result['complete']})
     except Exception as e:
         app.logger.error(f"Error clearing logs: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/events')
+def events_stream():
+    """Server-Sent Events: новые записи журнала и изменения отметок привычек"""
+    if _use_pg_notify():
+        pg_listener.ensure_started()
+    subscription = event_broker.subscribe()
+    if subscription is None:
+        return jsonify({'error': 'Too many event subscribers'}), 503
+    keepalive = app.config['EVENTS_KEEPALIVE_SECONDS']
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=keepalive)
+                yield format_sse(event) if event else ": keepalive\n\n"
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+    """Внутренние счетчики приложения в JSON"""
+    return jsonify({
+        'audit': audit_writer.stats(),
+        'audit_policy': audit_policy.stats(),
+        'db_pool': pool_metrics(db.engine),
+        'events': event_broker.stats(),
+        'user_agents': user_agents.stats(),
+        'page_cache': page_cache.stats()
+    })
+
+def _ping_database():
+    """Проверяет соединение из пула без ORM-сессии"""
+    with app.app_context():
+        with db.engine.connect() as connection:
+            connection.execute(db.text('SELECT 1'))
+
+readiness_check = CachedCheck(
+    _ping_database,
+    ttl=app.config['READINESS_CACHE_MS'] / 1000,
+    timeout=app.config['READINESS_TIMEOUT_MS'] / 1000
+)
+
+@app.route('/livez')
+def livez():
+    """Liveness-проба: процесс жив и отвечает, БД не трогаем"""
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/readyz')
+def readyz():
+    """Readiness-проба: кешированная проверка соединения с БД"""
+    result = readiness_check()
+    return jsonify({
+        'status': 'ready' if result['ok'] else 'not ready',
+        'database': result['detail'],
+        'duration_ms': result['duration_ms'],
+        'cached': result['cached']
+    }), 200 if result['ok'] else 503
+
 @app.route('/health')
 def health_check():
     """Health check endpoint для Kubernetes"""
     try:
-        db.session.execute('SELECT 1')
+        db.session.execute(db.text('SELECT 1'))
         
         return jsonify({
             'status': 'healthy',
@@ -462,15 +1933,199 @@ def health_check():
             'timestamp': datetime.now(timezone.utc).isoformat()
         }), 500
     
+@app.cli.command('rebuild-streaks')
+@click.option('--check', is_flag=True, help='Только сверить сохраненные серии, ничего не меняя')
+def rebuild_streaks_command(check):
+    """Пересчитывает сохраненные серии с нуля и сверяет их с текущими"""
+    mismatches = rebuild_streak_states(fix=not check)
+    for habit_id, stored, expected in mismatches:
+        click.echo(f"Habit {habit_id}: stored={stored} expected={expected}")
+    if check:
+        db.session.rollback()
+        if mismatches:
+            raise SystemExit(1)
+    else:
+        if mismatches:
+            bump_versions(habit_id for habit_id, _, _ in mismatches)
+        db.session.commit()
+    click.echo(f"Checked streaks, mismatches: {len(mismatches)}")
+
+@app.cli.command('rebuild-rollups')
+@click.option('--check', is_flag=True, help='Только сверить счетчики, ничего не меняя')
+def rebuild_rollups_command(check):
+    """Пересчитывает daily_rollup по отметкам (после загрузки данных или для сверки)"""
+    mismatches = rebuild_rollups(fix=not check)
+    for period, habit_id, start, stored, expected in mismatches[:20]:
+        click.echo(f"{period} {start} habit {habit_id}: stored={stored} expected={expected}")
+    if check:
+        db.session.rollback()
+        if mismatches:
+            raise SystemExit(1)
+    else:
+        if mismatches:
+            bump_versions({habit_id for _, habit_id, _, _, _ in mismatches} - {rollups.ALL_HABITS})
+        db.session.commit()
+    click.echo(f"Checked rollups, mismatches: {len(mismatches)}")
+
+@app.cli.command('rebuild-year-bits')
+@click.option('--check', is_flag=True, help='Только сверить карты, ничего не меняя')
+def rebuild_year_bits_command(check):
+    """Пересобирает годовые битовые карты выполнений по отметкам"""
+    mismatches = rebuild_year_bits(fix=not check)
+    for habit_id, year in mismatches[:20]:
+        click.echo(f"Habit {habit_id}, year {year}: bitmap differs from habit_log")
+    if check:
+        db.session.rollback()
+        if mismatches:
+            raise SystemExit(1)
+    else:
+        if mismatches:
+            bump_versions(habit_id for habit_id, _ in mismatches)
+        db.session.commit()
+    click.echo(f"Checked year bitmaps, mismatches: {len(mismatches)}")
+
+@app.cli.command('purge-logs')
+@click.option('--days', type=int, default=None, help='Срок хранения (по умолчанию LOG_RETENTION_DAYS)')
+@click.option('--chunk-size', type=int, default=None, help='Строк в одной пачке')
+@click.option('--max-chunks', type=int, default=None, help='Остановиться после N пачек')
+def purge_logs_command(days, chunk_size, max_chunks):
+    """Удаляет старые записи журнала пачками (для k8s CronJob)"""
+    def report(state):
+        click.echo(f"deleted={state['deleted']} remaining={state['remaining']} "
+                   f"rows/sec={state['rows_per_sec']} id={state['last_id']}/{state['max_id']}")
+
+    for name in ensure_log_partitions():
+        click.echo(f"Created partition {name}")
+    result = purge_old_logs(days=days, chunk_size=chunk_size, max_chunks=max_chunks, progress=report)
+    if result['archived'] is not None:
+        click.echo(f"Archived {result['archived']['rows']} logs "
+                   f"into {result['archived']['files']} files")
+    for name in result['dropped_partitions']:
+        click.echo(f"Dropped partition {name}")
+    click.echo(f"Purged {result['deleted']} logs in {result['seconds']}s "
+               f"({result['rows_per_sec']} rows/sec), remaining {result['remaining']}")
+
+@app.cli.command('archive-logs')
+@click.option('--days', type=int, default=None, help='Архивировать записи старше N дней')
+@click.option('--directory', default=None, help='Каталог архива (по умолчанию LOG_ARCHIVE_DIR)')
+def archive_logs_command(days, directory):
+    """Выгружает старые записи журнала в activity-YYYY-MM-DD.jsonl.gz, ничего не удаляя"""
+    if not (directory or app.config['LOG_ARCHIVE_DIR']):
+        raise click.UsageError('Set LOG_ARCHIVE_DIR or pass --directory')
+    stats = archive_old_logs(retention_cutoff(days), directory)
+    click.echo(f"Archived {stats['rows']} logs into {stats['files']} files "
+               f"({stats['bytes']} bytes), skipped existing days: {stats['skipped_days']}")
+
+def _transfer_format(path, fmt):
+    fmt = fmt or ('jsonl' if path.endswith('.jsonl') else 'csv')
+    if fmt not in transfer.FORMATS:
+        raise click.BadParameter(f'format must be one of {", ".join(transfer.FORMATS)}')
+    return fmt
+
+@app.cli.command('export')
+@click.argument('name', type=click.Choice(['habits', 'habit_logs', 'activity_logs']))
+@click.argument('output', default='-')
+@click.option('--format', 'fmt', default=None, help='csv или jsonl (по умолчанию по расширению)')
+def export_command(name, output, fmt):
+    """Выгружает таблицу в CSV/JSONL потоком (OUTPUT '-' - stdout)"""
+    fmt = _transfer_format(output, fmt)
+    with click.open_file(output, 'w', encoding='utf-8') as handle:
+        for chunk in export_chunks(name, fmt):
+            handle.write(chunk)
+
+@app.cli.command('import')
+@click.argument('name', type=click.Choice(list(IMPORT_TABLES)))
+@click.argument('source')
+@click.option('--format', 'fmt', default=None, help='csv или jsonl (по умолчанию по расширению)')
+def import_command(name, source, fmt):
+    """Загружает выгрузку export (habits, затем habit_logs): COPY на PostgreSQL"""
+    fmt = _transfer_format(source, fmt)
+    # newline='' нужен csv для переводов строк внутри полей
+    if source == '-':
+        loaded = import_records(name, click.get_text_stream('stdin'), fmt)
+    else:
+        with open(source, encoding='utf-8', newline='') as handle:
+            loaded = import_records(name, handle, fmt)
+    if name == 'habit_logs':
+        rebuild_streak_states()
+        rebuild_rollups()
+        rebuild_year_bits()
+    bump_versions(row.id for row in db.session.query(Habit.id))
+    db.session.commit()
+    click.echo(f"Imported {loaded} rows into {name}")
+
+@app.cli.command('ensure-partitions')
+def ensure_partitions_command():
+    """Создает будущие помесячные секции журнала (PostgreSQL)"""
+    created = ensure_log_partitions()
+    for name in created:
+        click.echo(f"Created partition {name}")
+    click.echo(f"Partitions up to date, created: {len(created)}")
+
+# Ключ pg_advisory_lock, под которым выполняются миграции
+MIGRATION_LOCK_ID = 72_581_001
+
+def run_migrations(connection, revision='head'):
+    """Применяет миграции alembic на переданном соединении.
+
+    База, созданная раньше через create_all (таблицы есть, версии нет),
+    сначала помечается начальной ревизией.
+    """
+    from alembic import command
+
+    config = migrate.get_config()
+    config.attributes['connection'] = connection
+    tables = set(db.inspect(connection).get_table_names())
+    connection.commit()
+    if 'habit' in tables and 'alembic_version' not in tables:
+        command.stamp(config, '0001_initial')
+    command.upgrade(config, revision)
+
 def init_db():
-    """Инициализация базы данных"""
+    """Инициализация базы данных: миграции схемы до последней версии"""
     with app.app_context():
-        db.create_all()
-        app.logger.info("Database tables created")
+        with db.engine.connect() as connection:
+            is_postgres = connection.dialect.name == 'postgresql'
+            if is_postgres:
+                # Одновременно мигрирует только один процесс
+                connection.exec_driver_sql(f'SELECT pg_advisory_lock({MIGRATION_LOCK_ID})')
+                connection.commit()
+            try:
+                run_migrations(connection)
+            finally:
+                if is_postgres:
+                    connection.exec_driver_sql(f'SELECT pg_advisory_unlock({MIGRATION_LOCK_ID})')
+                    connection.commit()
+        ensure_log_partitions()
+        app.logger.info("Database migrations applied")
 
-if __name__ == '__main__':
+@app.cli.command('init-db')
+def init_db_command():
+    """Применяет миграции схемы (для разового k8s Job)"""
+    init_db()
+    click.echo("Database is up to date")
+
+def wait_for_database(timeout=None, interval=1.0):
+    """Ждет, пока БД начнет принимать соединения, вместо фиксированной паузы"""
     import time
-    time.sleep(10)
+    timeout = timeout if timeout is not None else app.config['DB_WAIT_TIMEOUT']
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            _ping_database()
+            app.logger.info(f"Database is ready (attempt {attempt})")
+            return
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Database is not ready after {timeout}s: {e}")
+            app.logger.warning(f"Waiting for database (attempt {attempt}): {e}")
+            time.sleep(interval)
+
+if __name__ == '__main__':
+    # Сервер разработки; в продакшене используется gunicorn (см. wsgi.py)
+    wait_for_database()
     init_db()
     app.logger.info(f"URL: http://localhost:5000")
     app.run(debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true', 
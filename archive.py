@@ -0,0 +1,111 @@
+# archive.py
+"""Архив журнала действий: сжатые JSONL-файлы по одному на день"""
+import gzip
+import json
+import os
+from datetime import datetime
+
+ARCHIVE_FIELDS = ('id', 'timestamp', 'habit_id', 'action', 'details', 'ip_address', 'user_agent')
+
+
+def archive_path(directory, day):
+    return os.path.join(directory, f"activity-{day:%Y-%m-%d}.jsonl.gz")
+
+
+def archive_day(path):
+    """День файла архива по его имени или None для посторонних файлов"""
+    name = os.path.basename(path)
+    if not (name.startswith('activity-') and name.endswith('.jsonl.gz')):
+        return None
+    try:
+        return datetime.strptime(name[len('activity-'):-len('.jsonl.gz')], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+class LogArchiver:
+    """Пишет записи журнала в файлы activity-YYYY-MM-DD.jsonl.gz.
+
+    Строки принимаются потоком, отсортированными по времени, и сразу
+    сжимаются в файл своего дня, так что память не зависит от объема
+    журнала. Файл пишется во временный и переименовывается только целиком,
+    а уже существующие дни пропускаются: повторный запуск после сбоя не
+    перезаписывает готовый архив урезанными данными.
+    """
+
+    def __init__(self, directory, compresslevel=6):
+        self.directory = directory
+        self.compresslevel = compresslevel
+
+    def write(self, rows):
+        """Архивирует строки (словари с полями ARCHIVE_FIELDS); возвращает статистику"""
+        os.makedirs(self.directory, exist_ok=True)
+        stats = {'rows': 0, 'files': 0, 'skipped_days': 0, 'bytes': 0}
+        current_day = handle = tmp_path = None
+        skipping = False
+
+        def finish():
+            handle.close()
+            path = archive_path(self.directory, current_day)
+            os.replace(tmp_path, path)
+            stats['files'] += 1
+            stats['bytes'] += os.path.getsize(path)
+
+        try:
+            for row in rows:
+                day = row['timestamp'].date()
+                if day != current_day:
+                    if handle is not None:
+                        finish()
+                        handle = None
+                    current_day = day
+                    path = archive_path(self.directory, day)
+                    skipping = os.path.exists(path)
+                    if skipping:
+                        stats['skipped_days'] += 1
+                    else:
+                        tmp_path = path + '.partial'
+                        handle = gzip.open(tmp_path, 'wt', encoding='utf-8',
+                                           compresslevel=self.compresslevel)
+                if skipping:
+                    continue
+                record = {field: row[field] for field in ARCHIVE_FIELDS}
+                record['timestamp'] = row['timestamp'].isoformat()
+                handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+                stats['rows'] += 1
+            if handle is not None:
+                finish()
+                handle = None
+        finally:
+            if handle is not None:
+                handle.close()
+                os.remove(tmp_path)
+        return stats
+
+
+def read_archive(path):
+    """Построчно читает файл архива, не загружая его в память целиком"""
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        for line in handle:
+            record = json.loads(line)
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+            yield record
+
+
+def scan_archives(directory, start=None, end=None, action=None, habit_id=None):
+    """Записи всех архивов за дни [start, end] по порядку с фильтрами"""
+    if not os.path.isdir(directory):
+        return
+    days = sorted(
+        (day, name) for name in os.listdir(directory)
+        if (day := archive_day(name)) is not None
+    )
+    for day, name in days:
+        if (start is not None and day < start) or (end is not None and day > end):
+            continue
+        for record in read_archive(os.path.join(directory, name)):
+            if action is not None and record['action'] != action:
+                continue
+            if habit_id is not None and record['habit_id'] != habit_id:
+                continue
+            yield record
@@ -0,0 +1,210 @@
+# audit.py
+"""Фоновая запись журнала действий (ActivityLog) пачками"""
+import os
+import queue
+import random
+import threading
+import time
+import logging
+
+from sqlalchemy.exc import IntegrityError
+
+# Маркер, которым stop() будит поток, ожидающий очередь
+_STOP = object()
+
+
+class AuditWriter:
+    """Очередь записей аудита и фоновый поток, который пишет их пачками.
+
+    write_batch(rows) получает список словарей и должен вставить их одним
+    запросом. Если пачку отверг constraint (IntegrityError), записи
+    повторяются по одной; прочие ошибки (например, БД недоступна) пачка
+    получает один раз. Пачка пишется, когда набралось batch_size записей или
+    прошло flush_interval секунд. Если очередь заполнена, запись либо отбрасывается
+    (overflow='drop'), либо вызывающий ждет до block_timeout секунд
+    (overflow='block') и только потом запись отбрасывается.
+    В режиме synchronous=True запись выполняется сразу в вызывающем потоке.
+    """
+
+    def __init__(self, write_batch, batch_size=100, flush_interval=0.5, max_queue=10000,
+                 overflow='drop', block_timeout=0.05, synchronous=False, logger=None):
+        if overflow not in ('drop', 'block'):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.synchronous = synchronous
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._counters = {'queued': 0, 'dropped': 0, 'flushed': 0, 'failed': 0}
+        self._reset_worker()
+
+    def _reset_worker(self):
+        # После fork (gunicorn --preload) поток родителя не существует - начинаем заново
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _count(self, name, value=1):
+        with self._counters_lock:
+            self._counters[name] += value
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self._reset_worker()
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, row):
+        """Ставит запись в очередь; возвращает False, если она была отброшена"""
+        if self.synchronous:
+            self._count('queued')
+            self._write([row])
+            return True
+
+        self._ensure_started()
+        try:
+            if self.overflow == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def _drain(self):
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if row is not _STOP:
+                self._pending.append(row)
+
+    def _write(self, rows):
+        try:
+            self.write_batch(rows)
+        except Exception as e:
+            if len(rows) > 1 and isinstance(e, IntegrityError):
+                # Одна плохая запись не должна терять всю пачку - пишем по одной
+                self.logger.warning(f"Batch of {len(rows)} activity rows failed, retrying one by one: {e}")
+                for row in rows:
+                    self._write([row])
+                return
+            self._count('failed', len(rows))
+            self.logger.error(f"Failed to write {len(rows)} activity rows: {e}")
+        else:
+            self._count('flushed', len(rows))
+
+    def _flush_pending(self):
+        # Вызывается под self._lock
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            self._write(batch)
+        self._last_flush = time.monotonic()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                row = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                row = None
+            with self._lock:
+                if row is not None and row is not _STOP:
+                    self._pending.append(row)
+                self._drain()
+                due = time.monotonic() - self._last_flush >= self.flush_interval
+                if len(self._pending) >= self.batch_size or (due and self._pending):
+                    self._flush_pending()
+
+    def flush(self):
+        """Немедленно записывает все накопленные записи"""
+        with self._lock:
+            self._drain()
+            self._flush_pending()
+
+    def stop(self, timeout=5):
+        """Останавливает поток и дописывает очередь (вызывается при завершении)"""
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                pass  # очередь полна - поток и так не ждет новых записей
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        """Счетчики записей: поставлено в очередь, отброшено, записано, ошибки"""
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats['pending'] = self._queue.qsize() + len(self._pending)
+        return stats
+
+
+class AuditPolicy:
+    """Политика записи аудита по типам действий: always, never или доля 0..1.
+
+    Спецификация задается строкой вида 'view_index=0.05,view_logs=never'.
+    Действия, не упомянутые в ней, пишутся всегда. Пропущенные выборкой
+    события не теряются бесследно - для них ведутся счетчики по действиям.
+    """
+
+    def __init__(self, rates=None, rng=random.random):
+        self.rates = dict(rates or {})
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._sampled_out = {}
+        self._recorded = {}
+
+    @classmethod
+    def from_spec(cls, spec, **kwargs):
+        rates = {}
+        for item in (spec or '').split(','):
+            if not item.strip():
+                continue
+            action, _, value = item.partition('=')
+            action, value = action.strip(), value.strip().lower()
+            if value == 'always':
+                rate = 1.0
+            elif value == 'never':
+                rate = 0.0
+            else:
+                try:
+                    rate = float(value)
+                except ValueError:
+                    raise ValueError(f"Invalid audit policy for {action!r}: {value!r}")
+                if not 0 <= rate <= 1:
+                    raise ValueError(f"Audit sample rate for {action!r} must be between 0 and 1")
+            rates[action] = rate
+        return cls(rates, **kwargs)
+
+    def should_record(self, action):
+        """Решает, писать ли событие, и обновляет счетчики"""
+        rate = self.rates.get(action, 1.0)
+        record = rate >= 1 or (rate > 0 and self.rng() < rate)
+        counters = self._recorded if record else self._sampled_out
+        with self._lock:
+            counters[action] = counters.get(action, 0) + 1
+        return record
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rates': dict(self.rates),
+                'recorded': dict(self._recorded),
+                'sampled_out': dict(self._sampled_out)
+            }
@@ -0,0 +1,157 @@
+# bench_user_agents.py
+"""Бенчмарк: размер журнала и скорость вставки со строкой User-Agent и со справочником
+
+    python bench_user_agents.py --rows 200000 --batch 100
+
+Заполняет две таблицы одинаковыми записями аудита: activity_log_text (полная
+строка User-Agent в каждой записи, как раньше) и activity_log_ref (ссылка на
+справочник через StringInterner, как сейчас), пачками по --batch, как пишет
+AuditWriter. Печатает записи в секунду и размер таблиц с индексами. БД берется
+из DATABASE_URL; если она не задана, используется временный файл SQLite.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import (Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table,
+                        Text, create_engine, text)
+
+from interning import StringInterner
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/129.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_6) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.6 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:131.0) Gecko/20100101 Firefox/131.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_6 like Mac OS X) AppleWebKit/605.1.15 '
+    '(KHTML, like Gecko) Version/17.6 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/129.0.0.0 Mobile Safari/537.36',
+    'kube-probe/1.30',
+]
+
+metadata = MetaData()
+
+
+def _log_columns():
+    return [
+        Column('id', Integer, primary_key=True),
+        Column('timestamp', DateTime, nullable=False),
+        Column('habit_id', Integer),
+        Column('action', String(100), nullable=False),
+        Column('details', Text),
+        Column('ip_address', String(50)),
+    ]
+
+
+user_agent = Table('bench_user_agent', metadata,
+                   Column('id', Integer, primary_key=True),
+                   Column('value_hash', String(32), nullable=False, unique=True),
+                   Column('value', Text, nullable=False))
+log_text = Table('activity_log_text', metadata, *_log_columns(), Column('user_agent', Text))
+log_ref = Table('activity_log_ref', metadata, *_log_columns(),
+                Column('user_agent_id', Integer, ForeignKey('bench_user_agent.id')))
+for table in (log_text, log_ref):
+    Index(f'ix_{table.name}_timestamp_id', table.c.timestamp, table.c.id)
+
+
+def make_rows(count, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    weights = [40, 20, 15, 15, 9, 1]
+    return [{
+        'timestamp': start + timedelta(seconds=n),
+        'habit_id': rng.randint(1, 50),
+        'action': rng.choice(['view_index', 'toggle', 'view_logs', 'update_history']),
+        'details': f'Viewed {rng.randint(1, 50)} habits',
+        'ip_address': f'10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+        'user_agent': rng.choices(USER_AGENTS, weights)[0],
+    } for n in range(count)]
+
+
+def insert_text(engine, rows, batch):
+    for start in range(0, len(rows), batch):
+        with engine.begin() as connection:
+            connection.execute(log_text.insert(), rows[start:start + batch])
+
+
+def insert_ref(engine, rows, batch):
+    interner = StringInterner(user_agent)
+    for start in range(0, len(rows), batch):
+        chunk = rows[start:start + batch]
+        ids = interner.ids_for(engine.begin, [row['user_agent'] for row in chunk])
+        records = [{**{k: v for k, v in row.items() if k != 'user_agent'},
+                    'user_agent_id': ids[row['user_agent']]} for row in chunk]
+        with engine.begin() as connection:
+            connection.execute(log_ref.insert(), records)
+    return interner.stats()
+
+
+def table_size(engine, name):
+    """Байты таблицы вместе с индексами"""
+    with engine.connect() as connection:
+        if engine.dialect.name == 'postgresql':
+            return connection.execute(text('SELECT pg_total_relation_size(:t)'), {'t': name}).scalar()
+        # dbstat есть не в каждой сборке SQLite - тогда считаем по числу страниц
+        try:
+            return connection.execute(text(
+                "SELECT sum(pgsize) FROM dbstat WHERE name = :t OR name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t)"
+            ), {'t': name}).scalar()
+        except Exception:
+            return None
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    engine = create_engine(url)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    rows = make_rows(args.rows)
+    try:
+        text_seconds, _ = timed(insert_text, engine, rows, args.batch)
+        ref_seconds, stats = timed(insert_ref, engine, rows, args.batch)
+        if engine.dialect.name == 'postgresql':
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.exec_driver_sql('VACUUM ANALYZE')
+
+        text_size = table_size(engine, log_text.name)
+        ref_size = table_size(engine, log_ref.name)
+        dim_size = table_size(engine, user_agent.name)
+        print(f"rows={args.rows} batch={args.batch} dialect={engine.dialect.name}")
+        print(f"text column:   {args.rows / text_seconds:10.0f} rows/sec  size={text_size}")
+        print(f"dimension ref: {args.rows / ref_seconds:10.0f} rows/sec  "
+              f"size={ref_size} + dimension {dim_size}")
+        print(f"interner: {stats}")
+        if text_size and ref_size:
+            print(f"size ratio: {(ref_size + (dim_size or 0)) / text_size:.2f}")
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
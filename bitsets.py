@@ -0,0 +1,217 @@
+# bitsets.py
+"""Битовые карты выполнений: одна строка на привычку и год, бит на каждый день.
+
+Бит i года - день года с номером i + 1 (1 января - бит 0). В БД карта
+хранится как 46 байт little-endian; тот же порядок битов использует set_bit
+в PostgreSQL, поэтому отдельные дни меняются прямо в запросе. Несколько лет
+склеиваются в одно целое Python, и анализ сводится к сдвигам и AND.
+"""
+import calendar
+import collections
+from datetime import date, timedelta
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+YEAR_BITS = 366
+YEAR_BYTES = (YEAR_BITS + 7) // 8
+
+
+def day_index(day):
+    """Номер бита дня в карте его года"""
+    return day.timetuple().tm_yday - 1
+
+
+def to_bytes(bits):
+    return bits.to_bytes(YEAR_BYTES, 'little')
+
+
+def from_bytes(blob):
+    return int.from_bytes(blob or b'', 'little')
+
+
+def _mask(length):
+    return (1 << length) - 1 if length > 0 else 0
+
+
+def longest_run(bits):
+    """Длина самой длинной серии единиц за O(log n) операций над целым.
+
+    runs[j] отмечает позиции, с которых начинается серия длиной не меньше 2**j;
+    дальше длина добирается двоичным поиском по этим уровням.
+    """
+    if not bits:
+        return 0
+    runs = [bits]
+    while True:
+        step = 1 << (len(runs) - 1)
+        longer = runs[-1] & (runs[-1] >> step)
+        if not longer:
+            break
+        runs.append(longer)
+    length = 1 << (len(runs) - 1)
+    starts = runs[-1]
+    for level in range(len(runs) - 2, -1, -1):
+        extended = starts & (runs[level] >> length)
+        if extended:
+            starts = extended
+            length += 1 << level
+    return length
+
+
+class CompletionHistory:
+    """История выполнений привычки за несколько лет как одно целое число"""
+
+    def __init__(self, years=None):
+        years = years or {}
+        first = min(years) if years else date.today().year
+        self.origin = date(first, 1, 1)
+        self.bits = 0
+        for year, bits in years.items():
+            self.bits |= bits << (date(year, 1, 1) - self.origin).days
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Из строк (year, bits) таблицы карт"""
+        return cls({year: from_bytes(blob) for year, blob in rows})
+
+    def _index(self, day):
+        return (day - self.origin).days
+
+    def _window(self, start, length):
+        """Биты length дней начиная со start (младший - start); дни до истории - нули"""
+        index = self._index(start)
+        bits = self.bits >> index if index >= 0 else self.bits << -index
+        return bits & _mask(length)
+
+    def is_done(self, day):
+        return bool(self._window(day, 1))
+
+    def days(self, start, end):
+        """Статусы дней [start, end] списком (для календаря и графиков)"""
+        length = (end - start).days + 1
+        window = self._window(start, length)
+        return [bool(window >> i & 1) for i in range(length)]
+
+    def count(self, start, end):
+        return self._window(start, (end - start).days + 1).bit_count()
+
+    def completion_rate(self, start, end):
+        """Доля выполненных дней в [start, end] (0.0, если диапазон пуст)"""
+        total = (end - start).days + 1
+        return self.count(start, end) / total if total > 0 else 0.0
+
+    def weekly_counts(self, start, weeks):
+        """Выполненные дни в weeks семидневных окнах начиная со start"""
+        window = self._window(start, 7 * weeks)
+        return [(window >> (7 * week) & 0x7F).bit_count() for week in range(weeks)]
+
+    def month_counts(self, year):
+        """Выполненные дни по месяцам года (12 чисел)"""
+        return [self.count(date(year, month, 1),
+                           date(year, month, calendar.monthrange(year, month)[1]))
+                for month in range(1, 13)]
+
+    def week_grid(self, start, end):
+        """Календарная сетка [start, end]: недели с понедельника по 7 статусов.
+
+        Дни вне диапазона в первой и последней неделе - None.
+        """
+        first = start - timedelta(days=start.weekday())
+        statuses = self.days(first, end + timedelta(days=6 - end.weekday()))
+        offset, length = (start - first).days, (end - start).days + 1
+        cells = [status if offset <= i < offset + length else None
+                 for i, status in enumerate(statuses)]
+        return [cells[i:i + 7] for i in range(0, len(cells), 7)]
+
+    def longest_run(self):
+        return longest_run(self.bits)
+
+    def last_day(self):
+        """Последний выполненный день (None, если выполнений нет)"""
+        if not self.bits:
+            return None
+        return self.origin + timedelta(days=self.bits.bit_length() - 1)
+
+    def current_streak(self, today):
+        """Серия, заканчивающаяся сегодня или вчера (как HabitStreak.current_for)"""
+        index = self._index(today)
+        if index >= 0 and not self.bits >> index & 1:
+            index -= 1
+        if index < 0 or not self.bits >> index & 1:
+            return 0
+        gaps = ~self.bits & _mask(index + 1)
+        return index + 1 if not gaps else index - (gaps.bit_length() - 1)
+
+
+def _changes_by_year(changes):
+    """{(habit_id, год): {бит: статус}} из троек (habit_id, день, +1/-1)"""
+    net = collections.Counter()
+    for habit_id, day, delta in changes:
+        net[(habit_id, day)] += delta
+    grouped = collections.defaultdict(dict)
+    for (habit_id, day), delta in net.items():
+        if delta:
+            grouped[(habit_id, day.year)][day_index(day)] = delta > 0
+    return grouped
+
+
+def apply_changes(connection, table, changes):
+    """Ставит и снимает биты дней по тройкам (habit_id, день, +1/-1).
+
+    PostgreSQL меняет биты на месте через set_bit - запрос на каждую пару
+    привычка/год без чтения. На SQLite карты читаются и записываются целиком:
+    запись в БД там одна на всех, поэтому изменения не теряются. Карты
+    обновляются в порядке ключа, чтобы параллельные пакеты брали блокировки
+    в одном порядке.
+    """
+    grouped = _changes_by_year(changes)
+    if not grouped:
+        return
+    if connection.dialect.name == 'postgresql':
+        for (habit_id, year), days in sorted(grouped.items()):
+            initial = sum(1 << index for index, status in days.items() if status)
+            bits = table.c.bits
+            for index, status in sorted(days.items()):
+                bits = func.set_bit(bits, index, int(status))
+            statement = postgresql.insert(table).values(
+                habit_id=habit_id, year=year, bits=to_bytes(initial))
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.habit_id, table.c.year], set_={'bits': bits}))
+        return
+
+    stored = {
+        (habit_id, year): from_bytes(blob)
+        for habit_id, year, blob in connection.execute(
+            select(table.c.habit_id, table.c.year, table.c.bits)
+            .where(tuple_(table.c.habit_id, table.c.year).in_(list(grouped)))
+        )
+    }
+    rows = []
+    for (habit_id, year), days in sorted(grouped.items()):
+        bits = stored.get((habit_id, year), 0)
+        for index, status in days.items():
+            bits = bits | (1 << index) if status else bits & ~(1 << index)
+        rows.append({'habit_id': habit_id, 'year': year, 'bits': to_bytes(bits)})
+    statement = sqlite.insert(table).values(rows)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.habit_id, table.c.year],
+        set_={'bits': statement.excluded.bits}))
+
+
+def build(done_days):
+    """{(habit_id, год): bits} по парам (habit_id, день) выполненных отметок"""
+    years = collections.defaultdict(int)
+    for habit_id, day in done_days:
+        years[(habit_id, day.year)] |= 1 << day_index(day)
+    return dict(years)
+
+
+def replace(connection, table, years, chunk_size=1000):
+    """Заменяет содержимое таблицы картами years (результат build)"""
+    connection.execute(table.delete())
+    rows = [{'habit_id': habit_id, 'year': year, 'bits': to_bytes(bits)}
+            for (habit_id, year), bits in years.items()]
+    for offset in range(0, len(rows), chunk_size):
+        connection.execute(table.insert(), rows[offset:offset + chunk_size])
+    return len(rows)
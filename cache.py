@@ -0,0 +1,126 @@
+# cache.py
+"""Кеш данных страниц: LRU с TTL в процессе или общий (Redis-подобный) бэкенд"""
+import collections
+import pickle
+import threading
+import time
+
+MISSING = object()
+
+
+class LRUCache:
+    """Кеш в памяти процесса: не больше maxsize ключей, каждый живет ttl секунд"""
+
+    def __init__(self, maxsize=256, ttl=30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (self.clock() + (ttl if ttl is not None else self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SharedCache:
+    """Кеш поверх общего хранилища с интерфейсом Redis: get и set(ex=).
+
+    Ключи общие для всех процессов и реплик. Записи не удаляются явно:
+    вызывающий код включает в ключ версию данных, а старые ключи истекают
+    по TTL. Значения сериализуются pickle; вытеснение и истечение срока
+    выполняет само хранилище.
+    """
+
+    def __init__(self, client, prefix='habit-tracker:', ttl=30.0):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _count(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def get(self, key, default=MISSING):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            # Недоступный кеш не должен ронять страницу - идем в БД
+            self._count('errors')
+            raw = None
+        if raw is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        try:
+            self.client.set(self.prefix + key, pickle.dumps(value), ex=max(int(ttl), 1))
+        except Exception:
+            self._count('errors')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'shared',
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'evictions': None
+            }
+
+
+def create_cache(backend='memory', url=None, maxsize=256, ttl=30.0):
+    """Кеш по настройкам: 'memory' (по умолчанию) или 'redis' (нужен пакет redis)"""
+    if backend == 'redis':
+        import redis
+        return SharedCache(redis.Redis.from_url(url), ttl=ttl)
+    if backend != 'memory':
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return LRUCache(maxsize=maxsize, ttl=ttl)
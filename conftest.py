@@ -10,7 +10,7 @@ os.environ['FLASK_ENV'] = 'testing'
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Переопределяем конфигурацию
-from app import db, app as flask_app
+from app import db, page_cache, user_agents, app as flask_app
 
 # Настраиваем для тестов
 flask_app.config.update({
@@ -29,6 +29,8 @@ def setup_test_database():
         yield
         db.session.remove()
         db.drop_all()
+        user_agents.clear()
+        page_cache.clear()
 
 @pytest.fixture
 def app():
@@ -0,0 +1,94 @@
+# db_pool.py
+"""Пул соединений SQLAlchemy с метриками ожидания и использования"""
+import threading
+import time
+
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """Накопительная статистика ожидания соединения из пула"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'checkout_wait_avg_ms': round(self.wait_total / attempts * 1000, 3) if attempts else 0.0,
+                'checkout_wait_max_ms': round(self.wait_max * 1000, 3)
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, который замеряет, сколько запрос ждал свободное соединение"""
+
+    stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+def build_engine_options(uri, env):
+    """Собирает SQLALCHEMY_ENGINE_OPTIONS из переменных окружения.
+
+    Для SQLite настройки пула не применяются (Flask-SQLAlchemy сам выбирает
+    подходящий пул), для PostgreSQL дополнительно задается statement_timeout.
+    """
+    if uri.startswith('sqlite'):
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(env.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(env.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(env.get('DB_POOL_TIMEOUT', 10)),
+        'pool_pre_ping': env.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(env.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if uri.startswith('postgresql'):
+        statement_timeout = int(env.get('DB_STATEMENT_TIMEOUT_MS', 5000))
+        options['connect_args'] = {
+            'connect_timeout': int(env.get('DB_CONNECT_TIMEOUT', 5)),
+            'options': f'-c statement_timeout={statement_timeout}'
+        }
+    return options
+
+
+def pool_metrics(engine):
+    """Текущее использование пула и статистика ожидания"""
+    pool = engine.pool
+    metrics = {'pool_class': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        metrics.update(pool.stats.snapshot())
+    return metrics
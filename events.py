@@ -0,0 +1,155 @@
+# events.py
+"""Рассылка событий подписчикам (Server-Sent Events) внутри процесса и через PostgreSQL"""
+import collections
+import itertools
+import json
+import os
+import select
+import threading
+import logging
+
+
+class Subscription:
+    """Очередь событий одного клиента с ограниченным размером.
+
+    Если клиент не успевает читать и буфер переполняется, накопленные события
+    отбрасываются, а клиенту один раз отправляется событие 'resync' -
+    ему нужно перечитать данные целиком. Память на клиента не растет.
+    """
+
+    def __init__(self, broker, buffer_size):
+        self.broker = broker
+        self._events = collections.deque()
+        self._buffer_size = buffer_size
+        self._condition = threading.Condition()
+        self.overflowed = False
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, event):
+        with self._condition:
+            if len(self._events) >= self._buffer_size:
+                self.dropped += len(self._events) + 1
+                self._events.clear()
+                self.overflowed = True
+            else:
+                self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Следующее событие или None по таймауту"""
+        with self._condition:
+            if not self._events and not self.overflowed:
+                self._condition.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return {'type': 'resync', 'data': {'dropped': self.dropped}}
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Рассылает опубликованные события всем подписчикам процесса"""
+
+    def __init__(self, buffer_size=100, max_subscribers=100):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self):
+        """Новая подписка; None, если достигнут лимит подписчиков"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, self.buffer_size)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        """Отправляет событие {'type': ..., 'data': ...} всем подписчикам"""
+        event = dict(event, id=next(self._ids))
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'published': self.published,
+            'dropped': sum(subscription.dropped for subscription in subscribers)
+        }
+
+
+class PostgresListener:
+    """Одно соединение LISTEN на процесс, которое передает NOTIFY в EventBroker.
+
+    Так события, закоммиченные любой репликой, доходят до подписчиков всех
+    реплик, а число соединений с БД не зависит от числа клиентов.
+    """
+
+    def __init__(self, connect, channel, broker, logger=None):
+        self.connect = connect
+        self.channel = channel
+        self.broker = broker
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        with self._lock:
+            # После fork поток родителя в дочернем процессе не существует
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='pg-listener', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                self.logger.error(f"LISTEN {self.channel} failed, reconnecting: {e}")
+                threading.Event().wait(1)
+
+    def _listen(self):
+        connection = self.connect()
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(f'LISTEN {self.channel}')
+            while True:
+                if select.select([connection], [], [], 5) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    try:
+                        self.broker.publish(json.loads(notify.payload))
+                    except ValueError:
+                        self.logger.warning(f"Bad NOTIFY payload: {notify.payload!r}")
+        finally:
+            connection.close()
+
+
+def format_sse(event):
+    """Событие в формате text/event-stream"""
+    payload = json.dumps(event.get('data'), ensure_ascii=False, default=str)
+    return f"id: {event.get('id', '')}\nevent: {event['type']}\ndata: {payload}\n\n"
@@ -0,0 +1,36 @@
+# gunicorn.conf.py
+"""Настройки gunicorn: число процессов и потоков задается через окружение"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('FLASK_PORT', 5000)}"
+
+# Процессы-воркеры и потоки в каждом из них
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 2))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# С preload приложение (и ожидание БД) выполняется один раз в мастер-процессе
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-') or None  # пустое значение отключает лог
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Соединения из пула мастер-процесса нельзя делить между воркерами
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Дописываем очередь аудита перед завершением воркера
+    from app import audit_writer
+    audit_writer.stop()
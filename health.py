@@ -0,0 +1,56 @@
+# health.py
+"""Проверки готовности с кешированием результата и ограничением по времени"""
+import threading
+import time
+
+
+class CachedCheck:
+    """Обертка над функцией проверки для readiness-проб.
+
+    Результат кешируется на ttl секунд, поэтому частые пробы не ходят в БД.
+    Сама проверка выполняется в отдельном потоке и ждется не дольше timeout
+    секунд: зависшая БД дает быстрый ответ "не готов", а не зависшую пробу.
+    Пока предыдущая проверка не завершилась, новая не запускается.
+    """
+
+    def __init__(self, check, ttl=2.0, timeout=0.5):
+        self.check = check
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+        self._thread = None
+
+    def _run(self):
+        started = time.monotonic()
+        try:
+            self.check()
+            result = {'ok': True, 'detail': 'ok'}
+        except Exception as e:
+            result = {'ok': False, 'detail': str(e)}
+        result['duration_ms'] = round((time.monotonic() - started) * 1000, 2)
+        with self._lock:
+            self._result = result
+            self._checked_at = time.monotonic()
+
+    def __call__(self):
+        """Возвращает словарь {'ok', 'detail', 'duration_ms', 'cached'}"""
+        with self._lock:
+            fresh = self._result is not None and time.monotonic() - self._checked_at < self.ttl
+            if fresh:
+                return dict(self._result, cached=True)
+            if self._thread is not None and self._thread.is_alive():
+                # Проверка уже идет и еще не уложилась в таймаут
+                return {'ok': False, 'detail': 'check in progress', 'duration_ms': None,
+                        'cached': True}
+            thread = threading.Thread(target=self._run, name='readiness-check', daemon=True)
+            self._thread = thread
+            thread.start()
+
+        thread.join(self.timeout)
+        with self._lock:
+            if thread.is_alive():
+                return {'ok': False, 'detail': f'timed out after {self.timeout}s',
+                        'duration_ms': None, 'cached': False}
+            return dict(self._result, cached=False)
@@ -0,0 +1,108 @@
+# interning.py
+"""Справочник повторяющихся строк (user agent и т.п.) с LRU-кешем id в процессе"""
+import collections
+import hashlib
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def value_hash(value):
+    """Ключ строки в справочнике: md5 в hex (уникальный индекс по длинному Text не нужен)"""
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+class StringInterner:
+    """Возвращает id строки в таблице-справочнике, добавляя новые строки.
+
+    Таблица должна иметь колонки id, hash_column (уникальная) и value.
+    Найденные id кешируются в LRU на maxsize строк, поэтому в обычном
+    режиме - несколько браузеров на миллионы записей - запись аудита
+    вообще не обращается к справочнику.
+    """
+
+    def __init__(self, table, maxsize=1024, hash_column='value_hash'):
+        self.table = table
+        self.hash_column = table.c[hash_column]
+        self.maxsize = maxsize
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.inserted = 0
+
+    def _cached(self, value):
+        with self._lock:
+            value_id = self._cache.get(value)
+            if value_id is not None:
+                self._cache.move_to_end(value)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value_id
+
+    def _remember(self, value, value_id):
+        with self._lock:
+            self._cache[value] = value_id
+            self._cache.move_to_end(value)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _insert_statement(self, connection):
+        if connection.dialect.name == 'postgresql':
+            return postgresql.insert(self.table).on_conflict_do_nothing(
+                index_elements=[self.hash_column])
+        if connection.dialect.name == 'sqlite':
+            return sqlite.insert(self.table).on_conflict_do_nothing(
+                index_elements=[self.hash_column])
+        return self.table.insert().prefix_with('IGNORE')
+
+    def ids_for(self, begin, values):
+        """{строка: id} для всех непустых values; новые строки вставляются пачкой.
+
+        begin - фабрика транзакции (например, engine.begin). Она открывается
+        только при промахе кеша, и это отдельная транзакция: откат вставки
+        записей аудита не оставит в кеше id несуществующих строк.
+        """
+        result = {}
+        missing = {}
+        for value in set(values):
+            if value is None:
+                continue
+            value_id = self._cached(value)
+            if value_id is None:
+                missing[value_hash(value)] = value
+            else:
+                result[value] = value_id
+        if not missing:
+            return result
+
+        with begin() as connection:
+            inserted = connection.execute(
+                self._insert_statement(connection),
+                [{self.hash_column.key: key, 'value': value} for key, value in missing.items()]
+            )
+            rows = connection.execute(
+                select(self.table.c.id, self.hash_column)
+                .where(self.hash_column.in_(list(missing)))
+            ).all()
+        self.inserted += max(inserted.rowcount, 0)
+        for value_id, key in rows:
+            result[missing[key]] = value_id
+            self._remember(missing[key], value_id)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cached': len(self._cache),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'inserted': self.inserted
+            }
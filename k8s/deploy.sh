@@ -8,7 +8,14 @@ minikube image load habit-tracker-app:latest
 kubectl apply -f k8s/namespace.yaml
 kubectl apply -f k8s/configmap.yaml
 kubectl apply -f k8s/postgres.yaml
+
+# Миграции схемы выполняются один раз, а не каждой репликой при старте
+kubectl delete job habit-tracker-migrate -n habit-tracker --ignore-not-found
+kubectl apply -f k8s/migrate-job.yaml
+kubectl wait --for=condition=complete job/habit-tracker-migrate -n habit-tracker --timeout=300s
+
 kubectl apply -f k8s/app.yaml
+kubectl apply -f k8s/purge-cronjob.yaml
 sleep 60
 
 # Launch web
@@ -0,0 +1,130 @@
+# loadtest.py
+"""Нагрузочный тест: как растет число запросов в секунду с числом воркеров gunicorn
+
+    python loadtest.py --workers 1 2 4 --duration 10 --path /
+
+Для каждого значения --workers запускается gunicorn (gunicorn.conf.py) на
+отдельном порту, после чего --concurrency потоков в течение --duration
+секунд шлют запросы на --path. БД берется из DATABASE_URL; если она не
+задана, используется временный файл SQLite с несколькими привычками.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start in {timeout}s")
+
+
+def hammer(url, duration, concurrency):
+    """Шлет запросы в concurrency потоков; возвращает (успешных, ошибок)"""
+    deadline = time.monotonic() + duration
+    ok = errors = 0
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal ok, errors
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(url, timeout=10) as response:
+                    response.read()
+                with lock:
+                    ok += 1
+            except Exception:
+                with lock:
+                    errors += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return ok, errors
+
+
+def seed_sqlite(env):
+    """Создает таблицы и тестовые данные во временной SQLite-БД"""
+    script = (
+        "from datetime import date, timedelta\n"
+        "from app import app, db, Habit, HabitLog, init_db\n"
+        "init_db()\n"
+        "with app.app_context():\n"
+        "    for n in range(50):\n"
+        "        habit = Habit(name=f'Habit {n}')\n"
+        "        db.session.add(habit)\n"
+        "        db.session.flush()\n"
+        "        for i in range(0, 60, 1 + n % 3):\n"
+        "            db.session.add(HabitLog(habit_id=habit.id,\n"
+        "                                    date=date.today() - timedelta(days=i), status=True))\n"
+        "    db.session.commit()\n"
+    )
+    subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    tmpdir = None
+    if 'DATABASE_URL' not in env:
+        tmpdir = tempfile.TemporaryDirectory()
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir.name, 'loadtest.db')}"
+        seed_sqlite(env)
+
+    results = []
+    for index, workers in enumerate(args.workers):
+        port = args.port + index
+        env.update({
+            'FLASK_PORT': str(port),
+            'GUNICORN_WORKERS': str(workers),
+            'GUNICORN_THREADS': str(args.threads),
+            'GUNICORN_ACCESSLOG': '',
+        })
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            base = f"http://127.0.0.1:{port}"
+            wait_until_up(base + '/livez')
+            hammer(base + args.path, 1, args.concurrency)  # прогрев
+            ok, errors = hammer(base + args.path, args.duration, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait(10)
+        rps = ok / args.duration
+        results.append((workers, rps, errors))
+        print(f"workers={workers:<3} threads={args.threads:<3} rps={rps:8.1f} errors={errors}")
+
+    baseline = results[0][1] or 1
+    for workers, rps, _ in results[1:]:
+        print(f"speedup x{workers / results[0][0]:.0f} workers: {rps / baseline:.2f}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""initial schema: habit, habit_log, activity_log
+
+Revision ID: 0001_initial
+Revises: 
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_initial'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('habit',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('habit_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('habit_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('status', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['habit_id'], ['habit.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('habit_id', 'date', name='unique_habit_date')
+    )
+    op.create_index('ix_habit_log_date', 'habit_log', ['date'], unique=False)
+    op.create_table('activity_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('habit_id', sa.Integer(), nullable=True),
+        sa.Column('action', sa.String(length=100), nullable=False),
+        sa.Column('details', sa.Text(), nullable=True),
+        sa.Column('ip_address', sa.String(length=50), nullable=True),
+        sa.Column('user_agent', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['habit_id'], ['habit.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('activity_log')
+    op.drop_index('ix_habit_log_date', table_name='habit_log')
+    op.drop_table('habit_log')
+    op.drop_table('habit')
@@ -0,0 +1,53 @@
+"""habit_streak table and indexes for hot queries
+
+Индексы создаются через CREATE INDEX CONCURRENTLY вне транзакции, поэтому
+на PostgreSQL миграция не блокирует запись в таблицы.
+
+Revision ID: 0002_streak_state_and_indexes
+Revises: 0001_initial
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_streak_state_and_indexes'
+down_revision = '0001_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('habit_streak',
+        sa.Column('habit_id', sa.Integer(), nullable=False),
+        sa.Column('current_streak', sa.Integer(), nullable=False),
+        sa.Column('longest_streak', sa.Integer(), nullable=False),
+        sa.Column('last_completed_date', sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(['habit_id'], ['habit.id'], ),
+        sa.PrimaryKeyConstraint('habit_id')
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_habit_log_completed_habit_date', 'habit_log',
+                        ['habit_id', sa.text('date DESC')], unique=False,
+                        postgresql_where=sa.text('status'),
+                        sqlite_where=sa.text('status = 1'),
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_activity_log_timestamp', 'activity_log', ['timestamp'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_activity_log_habit_timestamp', 'activity_log',
+                        ['habit_id', 'timestamp'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_activity_log_habit_timestamp', table_name='activity_log',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_activity_log_timestamp', table_name='activity_log',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_habit_log_completed_habit_date', table_name='habit_log',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_table('habit_streak')
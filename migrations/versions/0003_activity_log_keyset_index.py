@@ -0,0 +1,34 @@
+"""activity_log (timestamp, id) index for keyset pagination
+
+Заменяет индекс по одному timestamp составным (timestamp, id): по нему
+идут и сортировка /logs, и курсоры /api/logs, и удаление старых записей.
+
+Revision ID: 0003_activity_log_keyset_index
+Revises: 0002_streak_state_and_indexes
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_activity_log_keyset_index'
+down_revision = '0002_streak_state_and_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_activity_log_timestamp_id', 'activity_log', ['timestamp', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_activity_log_timestamp', table_name='activity_log',
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_activity_log_timestamp', 'activity_log', ['timestamp'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_activity_log_timestamp_id', table_name='activity_log',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,105 @@
+"""monthly range partitioning of activity_log on PostgreSQL
+
+На PostgreSQL activity_log пересоздается как PARTITION BY RANGE (timestamp)
+с помесячными секциями и секцией по умолчанию, данные переносятся из старой
+таблицы. Первичный ключ секционированной таблицы обязан включать ключ
+секционирования, поэтому он становится (id, timestamp); id по-прежнему
+берется из той же последовательности. На SQLite миграция ничего не делает.
+
+Перенос данных переписывает всю таблицу - на большом журнале его стоит
+запускать после purge-logs.
+
+Revision ID: 0004_partition_activity_log
+Revises: 0003_activity_log_keyset_index
+Create Date: 2026-10-18 00:00:00
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+from partitions import default_partition_name, ensure_partitions
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_partition_activity_log'
+down_revision = '0003_activity_log_keyset_index'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'id, timestamp, habit_id, action, details, ip_address, user_agent'
+
+
+def _rename_legacy(connection, old, new):
+    connection.exec_driver_sql(f'ALTER TABLE {old} RENAME TO {new}')
+    connection.exec_driver_sql(f'ALTER TABLE {new} RENAME CONSTRAINT {old}_pkey TO {new}_pkey')
+    for index in ('ix_activity_log_timestamp_id', 'ix_activity_log_habit_timestamp'):
+        connection.exec_driver_sql(
+            f'ALTER INDEX IF EXISTS {index} RENAME TO {index.replace("activity_log", new)}'
+        )
+    connection.exec_driver_sql('ALTER SEQUENCE activity_log_id_seq OWNED BY NONE')
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    _rename_legacy(connection, 'activity_log', 'activity_log_legacy')
+    connection.exec_driver_sql("""
+        CREATE TABLE activity_log (
+            id INTEGER NOT NULL DEFAULT nextval('activity_log_id_seq'),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            habit_id INTEGER REFERENCES habit (id),
+            action VARCHAR(100) NOT NULL,
+            details TEXT,
+            ip_address VARCHAR(50),
+            user_agent TEXT,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    connection.exec_driver_sql('ALTER SEQUENCE activity_log_id_seq OWNED BY activity_log.id')
+    connection.exec_driver_sql(
+        'CREATE INDEX ix_activity_log_timestamp_id ON activity_log (timestamp, id)')
+    connection.exec_driver_sql(
+        'CREATE INDEX ix_activity_log_habit_timestamp ON activity_log (habit_id, timestamp)')
+    connection.exec_driver_sql(
+        f'CREATE TABLE {default_partition_name("activity_log")} PARTITION OF activity_log DEFAULT')
+
+    oldest = connection.exec_driver_sql('SELECT min(timestamp) FROM activity_log_legacy').scalar()
+    ensure_partitions(connection, 'activity_log', 'timestamp', date.today(),
+                      since=oldest.date() if oldest else None)
+
+    connection.exec_driver_sql(
+        f'INSERT INTO activity_log ({COLUMNS}) SELECT {COLUMNS} FROM activity_log_legacy')
+    connection.exec_driver_sql('DROP TABLE activity_log_legacy')
+
+
+def downgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.exec_driver_sql('ALTER TABLE activity_log RENAME TO activity_log_partitioned')
+    connection.exec_driver_sql('ALTER SEQUENCE activity_log_id_seq OWNED BY NONE')
+    for index in ('ix_activity_log_timestamp_id', 'ix_activity_log_habit_timestamp'):
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS {index}')
+    op.create_table('activity_log',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('activity_log_id_seq')"),
+                  nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('habit_id', sa.Integer(), nullable=True),
+        sa.Column('action', sa.String(length=100), nullable=False),
+        sa.Column('details', sa.Text(), nullable=True),
+        sa.Column('ip_address', sa.String(length=50), nullable=True),
+        sa.Column('user_agent', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['habit_id'], ['habit.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    connection.exec_driver_sql('ALTER SEQUENCE activity_log_id_seq OWNED BY activity_log.id')
+    op.create_index('ix_activity_log_timestamp_id', 'activity_log', ['timestamp', 'id'])
+    op.create_index('ix_activity_log_habit_timestamp', 'activity_log', ['habit_id', 'timestamp'])
+    connection.exec_driver_sql(
+        f'INSERT INTO activity_log ({COLUMNS}) SELECT {COLUMNS} FROM activity_log_partitioned')
+    connection.exec_driver_sql('DROP TABLE activity_log_partitioned')
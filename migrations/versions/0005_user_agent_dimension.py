@@ -0,0 +1,93 @@
+"""user_agent dimension table instead of repeated strings in activity_log
+
+Различные строки User-Agent переносятся в справочник user_agent, записи
+журнала получают user_agent_id, колонка activity_log.user_agent удаляется.
+На секционированной таблице ALTER и UPDATE применяются ко всем секциям.
+user_agent_id заполняется пачками по диапазонам id, каждая пачка в своей
+транзакции (как purge-logs): большой журнал не держит блокировки и не
+раздувает WAL одним UPDATE. Справочник ищется по индексу value_hash.
+
+Revision ID: 0005_user_agent_dimension
+Revises: 0004_partition_activity_log
+Create Date: 2026-10-18 00:00:00
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_user_agent_dimension'
+down_revision = '0004_partition_activity_log'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+# Строк activity_log на одну транзакцию заполнения user_agent_id
+BACKFILL_BATCH_SIZE = 5000
+
+
+def _md5_hex(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest() if value is not None else None
+
+
+def upgrade():
+    op.create_table('user_agent',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('value_hash', sa.String(length=32), nullable=False),
+        sa.Column('value', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('value_hash')
+    )
+    with op.batch_alter_table('activity_log') as batch_op:
+        batch_op.add_column(sa.Column('user_agent_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_activity_log_user_agent_id', 'user_agent',
+                                    ['user_agent_id'], ['id'])
+
+    # Различных строк немного, поэтому хеши считаем в Python пачками
+    connection = op.get_bind()
+    user_agent = sa.table('user_agent', sa.column('value_hash'), sa.column('value'))
+    values = connection.execute(sa.text(
+        'SELECT DISTINCT user_agent FROM activity_log WHERE user_agent IS NOT NULL'
+    )).scalars()
+    batch = []
+    for value in values:
+        batch.append({'value_hash': _md5_hex(value), 'value': value})
+        if len(batch) >= BATCH_SIZE:
+            connection.execute(user_agent.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(user_agent.insert(), batch)
+
+    if connection.dialect.name == 'sqlite':
+        # В PostgreSQL md5() встроена и совпадает с hashlib; в SQLite ее нет
+        connection.connection.driver_connection.create_function(
+            'md5', 1, _md5_hex, deterministic=True)
+    low, high = connection.execute(sa.text('SELECT min(id), max(id) FROM activity_log')).one()
+    backfill = sa.text(
+        'UPDATE activity_log SET user_agent_id = '
+        '(SELECT id FROM user_agent WHERE user_agent.value_hash = md5(activity_log.user_agent)) '
+        'WHERE user_agent IS NOT NULL AND id >= :low AND id < :high'
+    )
+    with op.get_context().autocommit_block():
+        for start in range(low or 0, (high or 0) + 1, BACKFILL_BATCH_SIZE):
+            connection.execute(backfill, {'low': start, 'high': start + BACKFILL_BATCH_SIZE})
+
+    with op.batch_alter_table('activity_log') as batch_op:
+        batch_op.drop_column('user_agent')
+
+
+def downgrade():
+    with op.batch_alter_table('activity_log') as batch_op:
+        batch_op.add_column(sa.Column('user_agent', sa.Text(), nullable=True))
+    op.get_bind().execute(sa.text(
+        'UPDATE activity_log SET user_agent = '
+        '(SELECT value FROM user_agent WHERE user_agent.id = activity_log.user_agent_id) '
+        'WHERE user_agent_id IS NOT NULL'
+    ))
+    with op.batch_alter_table('activity_log') as batch_op:
+        batch_op.drop_constraint('fk_activity_log_user_agent_id', type_='foreignkey')
+        batch_op.drop_column('user_agent_id')
+    op.drop_table('user_agent')
@@ -0,0 +1,28 @@
+"""resource_version counters for ETag revalidation
+
+Revision ID: 0006_resource_version
+Revises: 0005_user_agent_dimension
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_resource_version'
+down_revision = '0005_user_agent_dimension'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('resource_version',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('resource_version')
@@ -0,0 +1,45 @@
+"""daily_rollup counters of completed days per habit and in total
+
+Счетчики выполнений по дням, неделям (с понедельника) и месяцам для каждой
+привычки и для всех сразу (habit_id = 0). Заполняются по существующим
+отметкам; дальше их поддерживает приложение при каждом изменении.
+
+Revision ID: 0007_daily_rollup
+Revises: 0006_resource_version
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import rollups
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_daily_rollup'
+down_revision = '0006_resource_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    daily_rollup = op.create_table('daily_rollup',
+        sa.Column('period', sa.String(length=5), nullable=False),
+        sa.Column('habit_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('completed', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('period', 'habit_id', 'period_start')
+    )
+
+    habit_log = sa.table('habit_log', sa.column('habit_id', sa.Integer),
+                         sa.column('date', sa.Date), sa.column('status', sa.Boolean))
+    connection = op.get_bind()
+    done_days = connection.execute(
+        sa.select(habit_log.c.habit_id, habit_log.c.date).where(habit_log.c.status == sa.true())
+    )
+    counts = rollups.aggregate((habit_id, day, 1) for habit_id, day in done_days)
+    rollups.replace(connection, daily_rollup, counts)
+
+
+def downgrade():
+    op.drop_table('daily_rollup')
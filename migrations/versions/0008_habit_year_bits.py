@@ -0,0 +1,44 @@
+"""habit_year_bits: per-habit, per-year completion bitmaps
+
+Карта выполнений привычки за год - 46 байт, бит на день (см. bitsets).
+Заполняется по существующим отметкам; дальше ее поддерживает приложение
+при каждом изменении HabitLog.
+
+Revision ID: 0008_habit_year_bits
+Revises: 0007_daily_rollup
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import bitsets
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_habit_year_bits'
+down_revision = '0007_daily_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    habit_year_bits = op.create_table('habit_year_bits',
+        sa.Column('habit_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('bits', sa.LargeBinary(length=bitsets.YEAR_BYTES), nullable=False),
+        sa.ForeignKeyConstraint(['habit_id'], ['habit.id'], ),
+        sa.PrimaryKeyConstraint('habit_id', 'year')
+    )
+
+    habit_log = sa.table('habit_log', sa.column('habit_id', sa.Integer),
+                         sa.column('date', sa.Date), sa.column('status', sa.Boolean))
+    connection = op.get_bind()
+    done_days = connection.execute(
+        sa.select(habit_log.c.habit_id, habit_log.c.date).where(habit_log.c.status == sa.true())
+    )
+    bitsets.replace(connection, habit_year_bits, bitsets.build(done_days))
+
+
+def downgrade():
+    op.drop_table('habit_year_bits')
@@ -0,0 +1,117 @@
+# partitions.py
+"""Помесячное секционирование таблиц по времени (PostgreSQL, PARTITION BY RANGE)"""
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+
+def month_start(day):
+    """Первое число месяца, в который попадает day"""
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    """Первое число месяца через months месяцев после day"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def parse_partition_month(table, name):
+    """Месяц секции по ее имени или None для чужих имен и секции по умолчанию"""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], '%Y%m').date()
+    except ValueError:
+        return None
+
+
+def is_partitioned(connection, table):
+    """True, если table - секционированная таблица PostgreSQL"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    kind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {'table': table}
+    ).scalar()
+    return kind == 'p'
+
+
+def list_partitions(connection, table):
+    """Помесячные секции таблицы: {месяц: имя}, без секции по умолчанию"""
+    names = connection.execute(
+        text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+             "WHERE i.inhparent = to_regclass(:table)"),
+        {'table': table}
+    ).scalars()
+    partitions = {}
+    for name in names:
+        month = parse_partition_month(table, name)
+        if month is not None:
+            partitions[month] = name
+    return partitions
+
+
+def create_month_partition(connection, table, column, month):
+    """Создает секцию месяца month.
+
+    Строки этого месяца, успевшие попасть в секцию по умолчанию, переносятся
+    в новую секцию до ATTACH - иначе PostgreSQL отказал бы в подключении.
+    """
+    name = partition_name(table, month)
+    default = default_partition_name(table)
+    bounds = {'start': month, 'end': add_months(month, 1)}
+    connection.execute(text(
+        f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    ))
+    connection.execute(text(
+        f'INSERT INTO "{name}" SELECT * FROM "{default}" '
+        f'WHERE "{column}" >= :start AND "{column}" < :end'
+    ), bounds)
+    connection.execute(text(
+        f'DELETE FROM "{default}" WHERE "{column}" >= :start AND "{column}" < :end'
+    ), bounds)
+    connection.execute(text(
+        f"ALTER TABLE \"{table}\" ATTACH PARTITION \"{name}\" "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    return name
+
+
+def ensure_partitions(connection, table, column, today, months_ahead=3, since=None):
+    """Создает недостающие секции с месяца since (по умолчанию текущего) на months_ahead вперед"""
+    existing = list_partitions(connection, table)
+    month = month_start(since or today)
+    last = add_months(month_start(today), months_ahead)
+    created = []
+    while month <= last:
+        if month not in existing:
+            created.append(create_month_partition(connection, table, column, month))
+        month = add_months(month, 1)
+    return created
+
+
+def drop_partitions_before(connection, table, cutoff, detach_only=False):
+    """Отключает (и удаляет) секции, целиком лежащие раньше cutoff.
+
+    Вместо DELETE миллионов строк это одна быстрая операция над каталогом.
+    При detach_only секции остаются отдельными таблицами (например, для архива).
+    """
+    removed = []
+    for month, name in sorted(list_partitions(connection, table).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        connection.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        if not detach_only:
+            connection.execute(text(f'DROP TABLE "{name}"'))
+        removed.append(name)
+    return removed
@@ -0,0 +1,85 @@
+# retention.py
+"""Удаление старых записей небольшими пачками по диапазонам первичного ключа"""
+import time
+
+from sqlalchemy import delete, func, select
+
+
+class ChunkedPurge:
+    """Удаляет строки table, у которых timestamp_column < cutoff.
+
+    Вместо одного DELETE на всю таблицу строки удаляются диапазонами id
+    по chunk_size, каждый диапазон в своей короткой транзакции: блокировки
+    держатся недолго, WAL растет равномерно, а прерванный запуск просто
+    продолжается при следующем. Между пачками можно делать паузу, чтобы
+    реплики и autovacuum успевали за удалением.
+    """
+
+    def __init__(self, engine, table, timestamp_column, id_column,
+                 chunk_size=5000, pause=0.0):
+        self.engine = engine
+        self.table = table
+        self.timestamp_column = timestamp_column
+        self.id_column = id_column
+        self.chunk_size = chunk_size
+        self.pause = pause
+
+    def plan(self, cutoff):
+        """Границы id и число строк к удалению: (min_id, max_id, total)"""
+        old = self.timestamp_column < cutoff
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(func.min(self.id_column), func.max(self.id_column), func.count())
+                .select_from(self.table).where(old)
+            ).one()
+        return row[0], row[1], row[2]
+
+    def run(self, cutoff, max_chunks=None, progress=None):
+        """Удаляет старые строки; возвращает итог в виде словаря.
+
+        max_chunks ограничивает число пачек за один запуск (например, для
+        HTTP-запроса), progress вызывается после каждой пачки со словарем
+        {'deleted', 'remaining', 'rows_per_sec', 'last_id', 'max_id'}.
+        """
+        min_id, max_id, total = self.plan(cutoff)
+        started = time.monotonic()
+        deleted = chunks = 0
+        lower = min_id
+
+        while lower is not None and lower <= max_id:
+            if max_chunks is not None and chunks >= max_chunks:
+                break
+            upper = lower + self.chunk_size
+            with self.engine.begin() as connection:
+                result = connection.execute(
+                    delete(self.table).where(
+                        self.id_column >= lower,
+                        self.id_column < upper,
+                        self.timestamp_column < cutoff
+                    )
+                )
+            deleted += result.rowcount
+            chunks += 1
+            lower = upper
+
+            if progress is not None:
+                elapsed = time.monotonic() - started
+                progress({
+                    'deleted': deleted,
+                    'remaining': max(total - deleted, 0),
+                    'rows_per_sec': round(deleted / elapsed, 1) if elapsed else 0.0,
+                    'last_id': min(upper - 1, max_id),
+                    'max_id': max_id
+                })
+            if self.pause and lower <= max_id:
+                time.sleep(self.pause)
+
+        elapsed = time.monotonic() - started
+        return {
+            'deleted': deleted,
+            'remaining': max(total - deleted, 0),
+            'chunks': chunks,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(deleted / elapsed, 1) if elapsed else 0.0,
+            'complete': lower is None or lower > max_id
+        }
@@ -0,0 +1,73 @@
+# rollups.py
+"""Сводные счетчики выполнений по дням, неделям и месяцам (таблица daily_rollup)"""
+import collections
+from datetime import date, timedelta
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+PERIODS = ('day', 'week', 'month')
+# habit_id строки с итогами по всем привычкам
+ALL_HABITS = 0
+
+
+def period_start(period, day):
+    """Начало периода, в который попадает day (неделя - с понедельника)"""
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return date(day.year, day.month, 1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def aggregate(changes):
+    """Сворачивает изменения (habit_id, день, +1/-1) в приращения счетчиков.
+
+    Каждое изменение затрагивает день, неделю и месяц - для самой привычки
+    и для общей строки ALL_HABITS. Возвращает {(period, habit_id, start): delta}.
+    """
+    deltas = collections.Counter()
+    for habit_id, day, delta in changes:
+        for period in PERIODS:
+            start = period_start(period, day)
+            deltas[(period, habit_id, start)] += delta
+            deltas[(period, ALL_HABITS, start)] += delta
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def apply_deltas(connection, table, deltas):
+    """Прибавляет приращения одним INSERT ... ON CONFLICT DO UPDATE.
+
+    Строки идут в порядке ключа: общие строки habit_id = 0 трогает каждая
+    запись, и одинаковый порядок блокировок не дает параллельным пакетам
+    взаимно заблокироваться на PostgreSQL.
+    """
+    if not deltas:
+        return
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(table).values([
+        {'period': period, 'habit_id': habit_id, 'period_start': start, 'completed': delta}
+        for (period, habit_id, start), delta in sorted(deltas.items())
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.period, table.c.habit_id, table.c.period_start],
+        set_={'completed': table.c.completed + statement.excluded.completed}
+    )
+    connection.execute(statement)
+
+
+def replace(connection, table, counts, chunk_size=5000):
+    """Заменяет содержимое таблицы счетчиками counts (результат aggregate).
+
+    Число строк зависит от числа привычек и дней, а не от числа записей,
+    поэтому пересчет держит в памяти только итоговые счетчики.
+    """
+    connection.execute(table.delete())
+    rows = [
+        {'period': period, 'habit_id': habit_id, 'period_start': start, 'completed': count}
+        for (period, habit_id, start), count in counts.items()
+    ]
+    for offset in range(0, len(rows), chunk_size):
+        connection.execute(table.insert(), rows[offset:offset + chunk_size])
+    return len(rows)
@@ -1,6 +1,7 @@
 # test_app.py
 from datetime import date, datetime, timedelta, timezone
 import json
+import os
 import pytest
 
 # Импорты будут через conftest
@@ -812,5 +813,1651 @@ def test_log_statistics(client, app):
         system_logs = ActivityLog.query.filter(ActivityLog.habit_id.is_(None)).count()
         assert system_logs == 1  # view_index
 
+def _count_queries(app, func):
+    """Выполняет func и возвращает (результат, число SQL-запросов)"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements)
+
+def test_dashboard_loader_query_count(app):
+    """Тест: число запросов главной страницы не зависит от числа привычек"""
+    from app import load_dashboard_data
+
+    with app.app_context():
+        today = date.today()
+
+        def create_habits(count):
+            for n in range(count):
+                habit = Habit(name=f'Habit {n}')
+                db.session.add(habit)
+                db.session.flush()
+                for i in range(0, 20, 1 + n % 3):
+                    db.session.add(HabitLog(habit_id=habit.id,
+                                            date=today - timedelta(days=i),
+                                            status=True))
+            db.session.commit()
+
+        create_habits(2)
+        _, small = _count_queries(app, lambda: load_dashboard_data(today))
+
+        create_habits(40)
+        data, large = _count_queries(app, lambda: load_dashboard_data(today))
+
+        assert len(data) == 42
+        assert large == small
+
+        # Когда серии уже сохранены, нужны только привычки, серии и окно логов
+        _, steady = _count_queries(app, lambda: load_dashboard_data(today))
+        assert steady == 3
+
+def test_dashboard_loader_matches_per_habit_queries(app):
+    """Тест: пакетная загрузка дает те же данные, что и расчет по одной привычке"""
+    from app import load_dashboard_data
+
+    with app.app_context():
+        today = date.today()
+        long_run = Habit(name='Long Run')
+        gaps = Habit(name='Gaps')
+        empty = Habit(name='Empty')
+        db.session.add_all([long_run, gaps, empty])
+        db.session.flush()
+
+        for i in range(100):
+            db.session.add(HabitLog(habit_id=long_run.id,
+                                    date=today - timedelta(days=i), status=True))
+        for i in (1, 2, 3, 5, 8):
+            db.session.add(HabitLog(habit_id=gaps.id,
+                                    date=today - timedelta(days=i), status=True))
+        db.session.add(HabitLog(habit_id=gaps.id, date=today, status=False))
+        db.session.commit()
+
+        data = {item['name']: item for item in load_dashboard_data(today)}
+
+        assert data['Long Run']['current_streak'] == 100
+        assert data['Long Run']['completed_last_14'] == 14
+        assert data['Long Run']['done_today'] is True
+        assert data['Gaps']['current_streak'] == 3
+        assert data['Gaps']['done_today'] is False
+        assert data['Gaps']['two_week_history'][-4:] == [True, True, True, False]
+        assert data['Empty']['current_streak'] == 0
+        assert data['Empty']['progress_percentage'] == 0
+
+def test_streak_state_incremental_updates(client, app):
+    """Тест: сохраненные серии обновляются через маршруты и совпадают с пересчетом"""
+    from app import HabitStreak, rebuild_streak_states
+
+    with app.app_context():
+        habit = Habit(name='Streak State')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+    today = date.today()
+    # Отмечаем 6 дней подряд, заканчивая вчера, затем сегодня через toggle
+    for i in range(6, 0, -1):
+        day = (today - timedelta(days=i)).strftime('%Y-%m-%d')
+        client.post(f'/history_update/{habit_id}/{day}', data={'status': 'on'})
+    client.get(f'/toggle/{habit_id}')
+
+    with app.app_context():
+        state = db.session.get(HabitStreak, habit_id)
+        assert state.current_streak == 7
+        assert state.longest_streak == 7
+        assert state.last_completed_date == today
+        assert state.current_for(today) == calculate_streak(habit_id)
+
+    # Снимаем отметку в середине серии - серия разбивается
+    middle = (today - timedelta(days=3)).strftime('%Y-%m-%d')
+    client.post(f'/history_update/{habit_id}/{middle}', data={})
+
+    with app.app_context():
+        state = db.session.get(HabitStreak, habit_id)
+        assert state.current_streak == 3
+        assert state.longest_streak == 3
+        assert state.current_for(today) == calculate_streak(habit_id) == 3
+
+    # Снимаем сегодняшнюю отметку - серия заканчивается вчера
+    client.get(f'/toggle/{habit_id}')
+
+    with app.app_context():
+        state = db.session.get(HabitStreak, habit_id)
+        assert state.last_completed_date == today - timedelta(days=1)
+        assert state.current_for(today) == calculate_streak(habit_id) == 2
+        assert rebuild_streak_states(fix=False) == []
+
+def test_streak_state_without_full_rescan(client, app, monkeypatch):
+    """Тест: новая привычка сразу получает состояние серий, а разрыв самой
+    длинной серии пересчитывается по битовым картам без полного пересчета"""
+    import app as app_module
+    from app import HabitStreak, rebuild_streak_states
+
+    client.post('/add', data={'name': 'No Rescan'})
+    with app.app_context():
+        habit_id = Habit.query.filter_by(name='No Rescan').one().id
+        assert db.session.get(HabitStreak, habit_id).longest_streak == 0
+
+    def fail(*args, **kwargs):
+        raise AssertionError('full rescan')
+
+    today = date.today()
+    for i in (9, 8, 7, 6, 5, 2, 1):
+        day = (today - timedelta(days=i)).strftime('%Y-%m-%d')
+        client.post(f'/history_update/{habit_id}/{day}', data={'status': 'on'})
+    # Разрываем самую длинную серию (5 дней) на 2 и 2
+    monkeypatch.setattr(app_module, 'rebuild_streak_states', fail)
+    middle = (today - timedelta(days=7)).strftime('%Y-%m-%d')
+    client.post(f'/history_update/{habit_id}/{middle}', data={})
+    monkeypatch.undo()
+
+    with app.app_context():
+        state = db.session.get(HabitStreak, habit_id)
+        assert state.longest_streak == 2
+        assert state.current_for(today) == 2
+        assert rebuild_streak_states([habit_id], fix=False) == []
+
+def test_rebuild_streak_states_tolerates_existing_row(app, monkeypatch):
+    """Тест: вставка состояния не падает, если строку уже создала другая транзакция"""
+    from app import HabitStreak, rebuild_streak_states
+
+    with app.app_context():
+        habit = Habit(name='Concurrent Streak')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+        # Другая транзакция успела вставить строку после нашего чтения
+        db.session.execute(HabitStreak.__table__.insert(), {'habit_id': habit_id})
+        monkeypatch.setattr(HabitStreak, 'query', HabitStreak.query.filter(db.false()))
+        rebuild_streak_states([habit_id])
+        db.session.commit()
+        monkeypatch.undo()
+        assert HabitStreak.query.filter_by(habit_id=habit_id).count() == 1
+
+def test_rebuild_streaks_command(app):
+    """Тест: команда пересчета находит и исправляет расхождения"""
+    from app import HabitStreak
+
+    with app.app_context():
+        habit = Habit(name='Rebuild')
+        db.session.add(habit)
+        db.session.commit()
+        for i in range(4):
+            db.session.add(HabitLog(habit_id=habit.id,
+                                    date=date.today() - timedelta(days=i), status=True))
+        db.session.add(HabitStreak(habit_id=habit.id, current_streak=1,
+                                   longest_streak=1, last_completed_date=date.today()))
+        db.session.commit()
+        habit_id = habit.id
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['rebuild-streaks', '--check'])
+    assert result.exit_code == 1
+    assert f'Habit {habit_id}' in result.output
+
+    result = runner.invoke(args=['rebuild-streaks'])
+    assert result.exit_code == 0
+
+    with app.app_context():
+        state = db.session.get(HabitStreak, habit_id)
+        assert (state.current_streak, state.longest_streak) == (4, 4)
+
+def test_weekly_stats_buckets_and_cap(app):
+    """Тест: недельная статистика считается по корзинам и ограничена по числу недель"""
+    from app import get_weekly_stats_many
+
+    with app.app_context():
+        first = Habit(name='Weekly A')
+        second = Habit(name='Weekly B')
+        db.session.add_all([first, second])
+        db.session.commit()
+
+        today = date.today()
+        for i in range(21):
+            db.session.add(HabitLog(habit_id=first.id, date=today - timedelta(days=i), status=True))
+        db.session.add(HabitLog(habit_id=second.id, date=today - timedelta(days=8), status=True))
+        db.session.add(HabitLog(habit_id=second.id, date=today, status=False))
+        db.session.commit()
+
+        stats = get_weekly_stats_many([first.id, second.id], weeks=3, today=today)
+
+        # Последняя корзина начинается сегодня, предыдущие - на 7 и 14 дней раньше
+        assert list(stats[first.id].values()) == [7, 7, 1]
+        assert list(stats[second.id].values()) == [1, 0, 0]
+        assert get_weekly_stats(first.id, 3) == stats[first.id]
+
+        capped = get_weekly_stats_many([first.id], weeks=10000, today=today)
+        assert len(capped[first.id]) == app.config['WEEKLY_STATS_MAX_WEEKS']
+
+def test_api_weekly_stats_many(client, app):
+    """Тест API недельной статистики по нескольким привычкам"""
+    with app.app_context():
+        habits = [Habit(name='Multi 1'), Habit(name='Multi 2')]
+        db.session.add_all(habits)
+        db.session.commit()
+        ids = [h.id for h in habits]
+
+    response = client.get(f'/api/weekly_stats?habit_ids={ids[0]},{ids[1]}&weeks=520')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['weeks'] == app.config['WEEKLY_STATS_MAX_WEEKS']
+    assert set(data['habits']) == {str(i) for i in ids}
+
+    response = client.get('/api/weekly_stats?habit_ids=abc')
+    assert response.status_code == 400
+
+def test_audit_writer_batches_and_drops():
+    """Тест: фоновый писатель аудита пишет пачками и считает отброшенные записи"""
+    import threading
+    from audit import AuditWriter
+
+    batches = []
+    release = threading.Event()
+
+    def write_batch(rows):
+        release.wait(1)
+        batches.append(list(rows))
+
+    writer = AuditWriter(write_batch, batch_size=3, flush_interval=0.05, max_queue=2)
+    # Первая запись забирается потоком, пока запись пачки заблокирована
+    assert writer.submit({'action': 'a0'})
+    import time
+    time.sleep(0.1)
+    results = [writer.submit({'action': f'a{i}'}) for i in range(1, 6)]
+    release.set()
+    writer.stop()
+
+    stats = writer.stats()
+    assert results.count(False) == stats['dropped'] > 0
+    assert stats['queued'] + stats['dropped'] == 6
+    assert stats['flushed'] == stats['queued'] == sum(len(batch) for batch in batches)
+    assert all(len(batch) <= 3 for batch in batches)
+    assert stats['pending'] == 0
+
+def test_audit_writer_flushes_on_size(app):
+    """Тест: пачка записывается одним вызовом, как только набран batch_size"""
+    import time
+    from audit import AuditWriter
+
+    batches = []
+    # flush_interval больше времени теста: записать пачку может только размер
+    writer = AuditWriter(batches.append, batch_size=5, flush_interval=10)
+    for i in range(5):
+        writer.submit({'action': f'bulk_{i}'})
+    deadline = time.monotonic() + 2
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [len(batch) for batch in batches] == [5]
+    assert writer.stats()['flushed'] == 5
+    writer.stop()
+
+def test_audit_writer_retries_failed_batch_row_by_row():
+    """Тест: одна плохая запись не теряет остальные записи пачки, а
+    недоступная БД не дает повторов по одной записи"""
+    from sqlalchemy.exc import IntegrityError, OperationalError
+    from audit import AuditWriter
+
+    written = []
+
+    def write_batch(rows):
+        if any(row['action'] == 'bad' for row in rows):
+            raise IntegrityError('INSERT', {}, Exception('constraint'))
+        written.extend(rows)
+
+    writer = AuditWriter(write_batch, batch_size=10, flush_interval=10)
+    for action in ('a', 'bad', 'b'):
+        writer.submit({'action': action})
+    writer.stop()
+    assert [row['action'] for row in written] == ['a', 'b']
+    assert writer.stats()['flushed'] == 2
+    assert writer.stats()['failed'] == 1
+
+    calls = []
+
+    def database_down(rows):
+        calls.append(len(rows))
+        raise OperationalError('INSERT', {}, Exception('connection refused'))
+
+    writer = AuditWriter(database_down, batch_size=10, flush_interval=10)
+    for action in ('a', 'b', 'c'):
+        writer.submit({'action': action})
+    writer.stop()
+    assert calls == [3]
+    assert writer.stats()['failed'] == 3
+
+def test_activity_rows_for_missing_habits_keep_the_batch(app):
+    """Тест: запись о несуществующей привычке не ломает вставку пачки по внешнему ключу"""
+    from app import _write_activity_rows
+
+    with app.app_context():
+        habit = Habit(name='Есть')
+        db.session.add(habit)
+        db.session.commit()
+        now = datetime.now(timezone.utc)
+        rows = [{'timestamp': now, 'habit_id': habit.id, 'action': 'fk_ok', 'details': None,
+                 'ip_address': None, 'user_agent': None},
+                {'timestamp': now, 'habit_id': 999999, 'action': 'fk_missing', 'details': None,
+                 'ip_address': None, 'user_agent': None}]
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+        try:
+            _write_activity_rows(rows)
+        finally:
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+
+        stored = {log.action: log.habit_id for log in
+                  ActivityLog.query.filter(ActivityLog.action.like('fk_%'))}
+        assert stored == {'fk_ok': habit.id, 'fk_missing': None}
+
+def test_metrics_endpoint(client):
+    """Тест: счетчики аудита доступны через /metrics"""
+    client.get('/')
+    data = json.loads(client.get('/metrics').data)
+    assert data['audit']['flushed'] >= 1
+    assert set(data['audit']) >= {'queued', 'dropped', 'flushed', 'failed', 'pending'}
+
+def test_audit_policy_sampling():
+    """Тест: политика аудита по действиям и счетчики пропущенных событий"""
+    from audit import AuditPolicy
+
+    values = iter([0.05, 0.5, 0.2, 0.9])
+    policy = AuditPolicy.from_spec('view_index=0.25, view_logs=never, toggle_habit=always',
+                                   rng=lambda: next(values))
+
+    assert [policy.should_record('view_index') for _ in range(4)] == [True, False, True, False]
+    assert policy.should_record('view_logs') is False
+    assert policy.should_record('toggle_habit') is True
+    assert policy.should_record('create_habit') is True
+
+    stats = policy.stats()
+    assert stats['sampled_out'] == {'view_index': 2, 'view_logs': 1}
+    assert stats['recorded'] == {'view_index': 2, 'toggle_habit': 1, 'create_habit': 1}
+
+    with pytest.raises(ValueError):
+        AuditPolicy.from_spec('view_index=2')
+
+def test_log_activity_respects_policy(app, monkeypatch):
+    """Тест: log_activity не пишет действия с политикой never"""
+    import app as app_module
+    from audit import AuditPolicy
+
+    monkeypatch.setattr(app_module, 'audit_policy', AuditPolicy.from_spec('view_index=never'))
+
+    with app.app_context():
+        app_module.log_activity('view_index', details='probe')
+        app_module.log_activity('create_habit', details='real change')
+
+        assert ActivityLog.query.filter_by(action='view_index').count() == 0
+        assert ActivityLog.query.filter_by(action='create_habit').count() == 1
+        assert app_module.audit_policy.stats()['sampled_out'] == {'view_index': 1}
+
+def test_probes_do_not_write_activity(client, app):
+    """Тест: /livez, /readyz и /health отвечают без записей в журнал"""
+    response = client.get('/livez')
+    assert response.status_code == 200
+    assert json.loads(response.data)['status'] == 'alive'
+
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert json.loads(response.data)['status'] == 'ready'
+
+    # Повторная проба в пределах READINESS_CACHE_MS берется из кеша
+    assert json.loads(client.get('/readyz').data)['cached'] is True
+
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert json.loads(response.data)['database'] == 'connected'
+
+    with app.app_context():
+        assert ActivityLog.query.count() == 0
+
+def test_cached_check_timeout():
+    """Тест: зависшая проверка не задерживает пробу дольше таймаута"""
+    import threading
+    import time
+    from health import CachedCheck
+
+    release = threading.Event()
+    check = CachedCheck(lambda: release.wait(2), ttl=10, timeout=0.05)
+
+    started = time.monotonic()
+    result = check()
+    assert time.monotonic() - started < 0.5
+    assert result['ok'] is False
+
+    # Пока проверка висит, новая не запускается
+    assert check()['detail'] == 'check in progress'
+
+    release.set()
+    time.sleep(0.05)
+    assert check()['ok'] is True
+
+    failing = CachedCheck(lambda: 1 / 0, ttl=0, timeout=1)
+    assert failing()['ok'] is False
+
+def test_wait_for_database(app, monkeypatch):
+    """Тест: ожидание БД при старте повторяет попытки и сдается по таймауту"""
+    import app as app_module
+
+    app_module.wait_for_database(timeout=1)
+
+    attempts = []
+
+    def failing_ping():
+        attempts.append(1)
+        raise ConnectionError('connection refused')
+
+    monkeypatch.setattr(app_module, '_ping_database', failing_ping)
+    with pytest.raises(RuntimeError, match='not ready'):
+        app_module.wait_for_database(timeout=0.05, interval=0.01)
+    assert len(attempts) >= 2
+
+def test_engine_options_from_env():
+    """Тест: настройки пула и statement_timeout берутся из окружения"""
+    from db_pool import build_engine_options, TimedQueuePool
+
+    assert build_engine_options('sqlite:///:memory:', {}) == {}
+
+    options = build_engine_options('postgresql://u:p@db/habits', {
+        'DB_POOL_SIZE': '7',
+        'DB_MAX_OVERFLOW': '3',
+        'DB_POOL_PRE_PING': 'false',
+        'DB_STATEMENT_TIMEOUT_MS': '1500'
+    })
+    assert options['poolclass'] is TimedQueuePool
+    assert options['pool_size'] == 7
+    assert options['max_overflow'] == 3
+    assert options['pool_pre_ping'] is False
+    assert options['pool_recycle'] == 1800
+    assert options['connect_args']['options'] == '-c statement_timeout=1500'
+
+def test_pool_metrics_track_checkouts(tmp_path):
+    """Тест: пул считает выдачи соединений и время ожидания"""
+    from sqlalchemy import create_engine, text
+    from db_pool import TimedQueuePool, pool_metrics
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    before = TimedQueuePool.stats.snapshot()['checkouts']
+
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+        assert pool_metrics(engine)['checked_out'] == 1
+        # Пул исчерпан - следующая попытка ждет pool_timeout и падает
+        with pytest.raises(Exception):
+            engine.connect()
+
+    metrics = pool_metrics(engine)
+    assert metrics['checked_out'] == 0
+    assert metrics['checkouts'] == before + 1
+    assert metrics['checkout_timeouts'] >= 1
+    assert metrics['checkout_wait_max_ms'] >= 40
+    engine.dispose()
+
+def _hot_queries():
+    """Горячие запросы приложения, которые должны идти по индексам"""
+    from sqlalchemy import delete, select
+
+    today = date(2026, 1, 31)
+    return {
+        'streak_window': select(HabitLog.date).where(
+            HabitLog.habit_id == 1,
+            HabitLog.status == True,
+            HabitLog.date.between(today - timedelta(days=16), today)
+        ).order_by(HabitLog.date.desc()),
+        'view_logs': select(ActivityLog.id, ActivityLog.timestamp)
+            .order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(100),
+        'logs_keyset': select(ActivityLog.id).where(
+            db.tuple_(ActivityLog.timestamp, ActivityLog.id) < (datetime(2026, 1, 1), 10)
+        ).order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(100),
+        'clear_logs': delete(ActivityLog).where(ActivityLog.timestamp < datetime(2026, 1, 1)),
+        'habit_activity': select(ActivityLog.id).where(ActivityLog.habit_id == 1)
+            .order_by(ActivityLog.timestamp.desc()).limit(100),
+    }
+
+def _explain(connection, statement):
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = connection.exec_driver_sql(prefix + sql).fetchall()
+    return '\n'.join(str(row[-1]) for row in rows)
+
+def test_hot_queries_use_indexes_sqlite(app):
+    """Тест: горячие запросы используют индексы (EXPLAIN QUERY PLAN на SQLite)"""
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for name, statement in _hot_queries().items():
+                plan = _explain(connection, statement)
+                assert 'USING' in plan and 'INDEX' in plan, f'{name}: {plan}'
+
+@pytest.mark.skipif(not os.environ.get('TEST_POSTGRES_URL'),
+                    reason='TEST_POSTGRES_URL is not set')
+def test_hot_queries_use_indexes_postgres():
+    """Тест: на PostgreSQL горячие запросы идут по индексам (EXPLAIN)"""
+    from sqlalchemy import create_engine
+
+    engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+    db.metadata.create_all(engine)
+    try:
+        with engine.begin() as connection:
+            # На пустых таблицах планировщик предпочтет Seq Scan - запрещаем его,
+            # чтобы проверить именно наличие подходящего индекса
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            for name, statement in _hot_queries().items():
+                plan = _explain(connection, statement)
+                assert 'Index' in plan and 'Seq Scan' not in plan, f'{name}: {plan}'
+    finally:
+        db.metadata.drop_all(engine)
+        engine.dispose()
+
+def test_migrations_match_models(app, tmp_path):
+    """Тест: миграции с нуля дают ту же схему, что и модели"""
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from sqlalchemy import create_engine
+    from app import run_migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    with app.app_context():
+        with engine.connect() as connection:
+            run_migrations(connection)
+            context = MigrationContext.configure(connection)
+            assert context.get_current_revision() == '0008_habit_year_bits'
+            assert compare_metadata(context, db.metadata) == []
+
+            # Откат до начальной ревизии
+            from alembic import command
+            from app import migrate
+            config = migrate.get_config()
+            config.attributes['connection'] = connection
+            connection.commit()
+            command.downgrade(config, '0001_initial')
+            assert 'habit_streak' not in db.inspect(connection).get_table_names()
+    engine.dispose()
+
+def test_migrations_adopt_create_all_database(app, tmp_path):
+    """Тест: база, созданная через create_all, помечается начальной ревизией"""
+    from alembic.migration import MigrationContext
+    from sqlalchemy import create_engine, text
+    from app import run_migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    # Схема, которую создавал db.create_all() до перехода на миграции
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE habit (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, "
+            "created_at DATETIME)")
+        connection.exec_driver_sql(
+            "CREATE TABLE habit_log (id INTEGER PRIMARY KEY, habit_id INTEGER NOT NULL "
+            "REFERENCES habit (id), date DATE NOT NULL, status BOOLEAN, "
+            "CONSTRAINT unique_habit_date UNIQUE (habit_id, date))")
+        connection.exec_driver_sql("CREATE INDEX ix_habit_log_date ON habit_log (date)")
+        connection.exec_driver_sql(
+            "CREATE TABLE activity_log (id INTEGER PRIMARY KEY, timestamp DATETIME NOT NULL, "
+            "habit_id INTEGER REFERENCES habit (id), action VARCHAR(100) NOT NULL, details TEXT, "
+            "ip_address VARCHAR(50), user_agent TEXT)")
+        connection.execute(text("INSERT INTO habit (name) VALUES ('Legacy')"))
+        for n in range(3):
+            connection.execute(text(
+                "INSERT INTO activity_log (timestamp, action, user_agent) "
+                "VALUES (CURRENT_TIMESTAMP, 'view', :agent)"), {'agent': f'Browser {n % 2}'})
+
+    with app.app_context():
+        with engine.connect() as connection:
+            run_migrations(connection)
+            context = MigrationContext.configure(connection)
+            assert context.get_current_revision() == '0008_habit_year_bits'
+            assert connection.execute(text('SELECT name FROM habit')).scalar() == 'Legacy'
+            # Строки User-Agent перенесены в справочник
+            agents = connection.execute(text(
+                'SELECT user_agent.value FROM activity_log '
+                'JOIN user_agent ON user_agent.id = activity_log.user_agent_id ORDER BY activity_log.id'
+            )).scalars().all()
+            assert agents == ['Browser 0', 'Browser 1', 'Browser 0']
+            assert connection.execute(text('SELECT count(*) FROM user_agent')).scalar() == 2
+    engine.dispose()
+
+def test_history_snapshot_query_count(client, app):
+    """Тест: число запросов страницы истории не зависит от числа записей"""
+    from app import load_history_snapshot
+
+    with app.app_context():
+        short = Habit(name='Short History')
+        long = Habit(name='Long History')
+        db.session.add_all([short, long])
+        db.session.flush()
+        today = date.today()
+        for i in range(3):
+            db.session.add(HabitLog(habit_id=short.id, date=today - timedelta(days=i), status=True))
+        for i in range(400):
+            db.session.add(HabitLog(habit_id=long.id, date=today - timedelta(days=i), status=i % 5 != 0))
+        db.session.commit()
+        ids = (short.id, long.id)
+
+        # Первый вызов сохраняет серии, дальше считаем только рабочие запросы
+        for habit_id in ids:
+            load_history_snapshot(habit_id, '8weeks', today)
+
+        counts = []
+        for habit_id in ids:
+            for view in ('2weeks', '8weeks'):
+                _, count = _count_queries(app, lambda: load_history_snapshot(habit_id, view, today))
+                counts.append(count)
+        assert len(set(counts)) == 1
+        assert counts[0] == 2
+
+        snapshot = load_history_snapshot(long.id, '8weeks', today)
+        assert snapshot['values'] == list(get_weekly_stats(long.id, 8).values())
+        assert snapshot['labels'] == list(get_weekly_stats(long.id, 8).keys())
+        assert snapshot['current_streak'] == calculate_streak(long.id)
+
+    for habit_id in ids:
+        assert client.get(f'/history/{habit_id}').status_code == 200
+        assert client.get(f'/history/{habit_id}/8weeks').status_code == 200
+
+def test_api_logs_keyset_pagination(client, app):
+    """Тест: JSON-журнал листается курсором без пропусков и дублей"""
+    with app.app_context():
+        habit = Habit(name='Paged')
+        db.session.add(habit)
+        db.session.commit()
+        base = datetime(2026, 1, 1, 12, 0, 0)
+        for i in range(25):
+            # Часть записей с одинаковым timestamp - порядок держится на id
+            db.session.add(ActivityLog(action='toggle_habit' if i % 2 else 'view_index',
+                                       habit_id=habit.id if i % 2 else None,
+                                       details=f'#{i}', timestamp=base + timedelta(seconds=i // 3)))
+        db.session.commit()
+        habit_id = habit.id
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/logs?limit=10' + (f'&cursor={cursor}' if cursor else '')
+        data = json.loads(client.get(url).data)
+        seen.extend(log['details'] for log in data['logs'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert seen == [f'#{i}' for i in range(24, -1, -1)]
+
+    data = json.loads(client.get(f'/api/logs?action=toggle_habit&habit_id={habit_id}').data)
+    assert len(data['logs']) == 12
+    assert all(log['action'] == 'toggle_habit' for log in data['logs'])
+
+    data = json.loads(client.get('/api/logs?from=2026-01-01T12:00:03&to=2026-01-01T12:00:05').data)
+    assert [log['details'] for log in data['logs']] == [f'#{i}' for i in range(14, 8, -1)]
+
+    assert client.get('/api/logs?cursor=garbage').status_code == 400
+
+def test_api_logs_since_returns_only_new_rows(client, app):
+    """Тест: режим since отдает только новые записи и не пишет в журнал"""
+    with app.app_context():
+        db.session.add(ActivityLog(action='old', details='old'))
+        db.session.commit()
+
+    latest = json.loads(client.get('/api/logs').data)['latest_cursor']
+
+    data = json.loads(client.get(f'/api/logs?since={latest}').data)
+    assert data['logs'] == []
+    assert data['latest_cursor'] == latest
+
+    with app.app_context():
+        db.session.add_all([ActivityLog(action='new', details=f'new {i}') for i in range(3)])
+        db.session.commit()
+
+    data = json.loads(client.get(f'/api/logs?since={latest}').data)
+    assert [log['details'] for log in data['logs']] == ['new 0', 'new 1', 'new 2']
+
+    data = json.loads(client.get(f"/api/logs?since={data['latest_cursor']}").data)
+    assert data['logs'] == []
+
+    with app.app_context():
+        assert ActivityLog.query.count() == 4
+
+def test_event_broker_bounds_slow_subscribers():
+    """Тест: события доходят до всех подписчиков, медленный получает resync"""
+    from events import EventBroker
+
+    broker = EventBroker(buffer_size=3, max_subscribers=2)
+    fast, slow = broker.subscribe(), broker.subscribe()
+    assert broker.subscribe() is None
+
+    broker.publish({'type': 'activity', 'data': {'n': 0}})
+    assert fast.get(timeout=0)['data'] == {'n': 0}
+
+    for n in range(1, 6):
+        broker.publish({'type': 'activity', 'data': {'n': n}})
+    event = slow.get(timeout=0)
+    assert event['type'] == 'resync'
+    assert event['data'] == {'dropped': 4}
+    assert [slow.get(timeout=0)['data']['n'] for _ in range(2)] == [4, 5]
+    assert slow.get(timeout=0) is None
+
+    fast.close()
+    assert broker.stats()['subscribers'] == 1
+
+def test_toggle_publishes_habit_event(client, app):
+    """Тест: отметка привычки рассылается подписчикам после коммита"""
+    from app import event_broker
+
+    with app.app_context():
+        habit = Habit(name='Live')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+    subscription = event_broker.subscribe()
+    try:
+        client.get(f'/toggle/{habit_id}')
+        events = []
+        while (event := subscription.get(timeout=0)) is not None:
+            events.append(event)
+    finally:
+        subscription.close()
+
+    habit_events = [e for e in events if e['type'] == 'habit_log']
+    assert habit_events[0]['data'] == {'habit_id': habit_id, 'date': date.today().isoformat(),
+                                       'status': True}
+    assert any(e['type'] == 'activity' for e in events)
+
+def test_events_stream_and_subscriber_limit(client, app):
+    """Тест: /events отдает text/event-stream и 503 сверх лимита подписчиков"""
+    from app import event_broker
+
+    response = client.get('/events')
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert next(response.response) == b'retry: 3000\n\n'
+    assert event_broker.stats()['subscribers'] == 1
+    response.close()
+    assert event_broker.stats()['subscribers'] == 0
+
+    limit = event_broker.max_subscribers
+    event_broker.max_subscribers = 0
+    try:
+        assert client.get('/events').status_code == 503
+    finally:
+        event_broker.max_subscribers = limit
+
+def test_dashboard_live_reload_is_opt_in(client, app):
+    """Тест: главная страница подписывается на /events только с EVENTS_LIVE_RELOAD"""
+    assert app.config['EVENTS_MAX_SUBSCRIBERS'] < int(os.getenv('GUNICORN_THREADS', 2))
+    assert b'EventSource' not in client.get('/').data
+
+    app.config['EVENTS_LIVE_RELOAD'] = True
+    try:
+        assert b"new EventSource('/events')" in client.get('/').data
+    finally:
+        app.config['EVENTS_LIVE_RELOAD'] = False
+
+def test_purge_logs_deletes_old_rows_in_chunks(app):
+    """Тест: purge-logs удаляет только старые записи, пачками и с прогрессом"""
+    old = datetime.now(timezone.utc) - timedelta(days=40)
+    with app.app_context():
+        ActivityLog.query.delete()
+        db.session.add_all([ActivityLog(action='old', details=str(i), timestamp=old) for i in range(7)])
+        db.session.add_all([ActivityLog(action='new', details=str(i)) for i in range(2)])
+        db.session.commit()
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('DELETE'):
+            statements.append(statement)
+
+    with app.app_context():
+        db.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            result = app.test_cli_runner().invoke(args=['purge-logs', '--chunk-size', '3'])
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert result.exit_code == 0, result.output
+        assert 'Purged 7 logs' in result.output
+        assert 'remaining=1 ' in result.output
+        assert len(statements) == 3
+        assert [log.action for log in ActivityLog.query.all()] == ['new', 'new']
+
+def test_clear_logs_endpoint_is_bounded(client, app):
+    """Тест: /logs/clear удаляет не больше LOG_PURGE_HTTP_MAX_CHUNKS пачек"""
+    old = datetime.now(timezone.utc) - timedelta(days=40)
+    with app.app_context():
+        ActivityLog.query.delete()
+        db.session.add_all([ActivityLog(action='old', details=str(i), timestamp=old) for i in range(5)])
+        db.session.commit()
+
+    settings = {key: app.config[key] for key in ('LOG_PURGE_CHUNK_SIZE', 'LOG_PURGE_HTTP_MAX_CHUNKS')}
+    app.config.update(LOG_PURGE_CHUNK_SIZE=2, LOG_PURGE_HTTP_MAX_CHUNKS=1)
+    try:
+        data = json.loads(client.post('/logs/clear').data)
+        assert data == {'success': True, 'deleted': 2, 'remaining': 3, 'complete': False}
+        data = json.loads(client.post('/logs/clear').data)
+        assert data['deleted'] == 2 and data['remaining'] == 1
+    finally:
+        app.config.update(settings)
+
+def test_partition_month_arithmetic():
+    """Тест: границы и имена помесячных секций"""
+    from partitions import add_months, month_start, parse_partition_month, partition_name
+
+    assert month_start(date(2026, 3, 17)) == date(2026, 3, 1)
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    name = partition_name('activity_log', date(2026, 2, 1))
+    assert name == 'activity_log_p202602'
+    assert parse_partition_month('activity_log', name) == date(2026, 2, 1)
+    assert parse_partition_month('activity_log', 'activity_log_default') is None
+
+def test_partitioning_is_noop_on_sqlite(app):
+    """Тест: на SQLite журнал не секционируется, очистка идет пачками"""
+    from app import ensure_log_partitions, purge_old_logs
+
+    with app.app_context():
+        assert ensure_log_partitions() == []
+        assert purge_old_logs()['dropped_partitions'] == []
+
+def test_view_logs_reads_recent_window_only(client, app):
+    """Тест: /logs показывает записи только за LOGS_VIEW_WINDOW_DAYS"""
+    with app.app_context():
+        ActivityLog.query.delete()
+        old = datetime.now(timezone.utc) - timedelta(days=app.config['LOGS_VIEW_WINDOW_DAYS'] + 5)
+        db.session.add(ActivityLog(action='ancient', details='ancient', timestamp=old))
+        db.session.add(ActivityLog(action='recent', details='recent'))
+        db.session.commit()
+
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        html = client.get('/logs').get_data(as_text=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert 'recent' in html
+    assert 'ancient' not in html
+    # И версия для ETag, и сама страница читают только окно (свежие секции)
+    reads = [sql for sql in statements if sql.lstrip().startswith('SELECT') and 'FROM activity_log' in sql]
+    assert len(reads) >= 2
+    assert all('activity_log.timestamp >=' in sql for sql in reads)
+
+def test_view_logs_etag_changes_when_window_rows_are_purged(client, app):
+    """Тест: удаление старых записей внутри окна (без новых) меняет ETag /logs"""
+    with app.app_context():
+        ActivityLog.query.delete()
+        for days in (20, 10, 0):
+            db.session.add(ActivityLog(action='entry', details=f'{days} days ago',
+                                       timestamp=datetime.now(timezone.utc) - timedelta(days=days)))
+        db.session.commit()
+
+    etag = client.get('/logs').headers['ETag']
+    assert client.get('/logs', headers={'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        oldest = ActivityLog.query.filter_by(details='20 days ago').one()
+        db.session.delete(oldest)
+        db.session.commit()
+
+    response = client.get('/logs', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert '20 days ago' not in response.get_data(as_text=True)
+
+@pytest.mark.skipif(not os.environ.get('TEST_POSTGRES_URL'),
+                    reason='TEST_POSTGRES_URL is not set')
+def test_activity_log_partitions_postgres(app):
+    """Тест: на PostgreSQL журнал секционирован, старые месяцы удаляются целиком"""
+    from sqlalchemy import create_engine, text
+    from partitions import add_months, drop_partitions_before, list_partitions, month_start
+    from app import run_migrations
+
+    engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+    today = date.today()
+    try:
+        with app.app_context():
+            with engine.connect() as connection:
+                run_migrations(connection)
+        with engine.begin() as connection:
+            months = list_partitions(connection, 'activity_log')
+            assert month_start(today) in months
+            assert add_months(month_start(today), 3) in months
+
+            old = add_months(month_start(today), -2)
+            connection.execute(text(
+                "INSERT INTO activity_log (timestamp, action) VALUES (:ts, 'old')"
+            ), {'ts': old})
+            # Строка в секции по умолчанию переносится при создании секции месяца
+            from partitions import create_month_partition
+            create_month_partition(connection, 'activity_log', 'timestamp', old)
+            assert connection.execute(text(
+                "SELECT count(*) FROM activity_log_default")).scalar() == 0
+
+            dropped = drop_partitions_before(connection, 'activity_log', month_start(today))
+            assert f"activity_log_p{old:%Y%m}" in dropped
+            assert connection.execute(text(
+                "SELECT count(*) FROM activity_log WHERE action = 'old'")).scalar() == 0
+
+            previous = add_months(month_start(today), -1)
+            create_month_partition(connection, 'activity_log', 'timestamp', previous)
+            plan = '\n'.join(row[0] for row in connection.execute(text(
+                "EXPLAIN SELECT * FROM activity_log WHERE timestamp >= :start "
+                "ORDER BY timestamp DESC LIMIT 100"), {'start': month_start(today)}))
+            assert f"activity_log_p{previous:%Y%m}" not in plan
+    finally:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                'DROP TABLE IF EXISTS activity_log, habit_streak, habit_log, habit, alembic_version CASCADE')
+        engine.dispose()
+
+def test_purge_archives_expired_logs_by_day(app, tmp_path):
+    """Тест: перед удалением записи уходят в сжатые архивы по дням"""
+    from archive import scan_archives
+    from app import purge_old_logs
+
+    base = datetime.now(timezone.utc).replace(hour=12) - timedelta(days=45)
+    with app.app_context():
+        ActivityLog.query.delete()
+        db.session.add(Habit(id=1, name='Archived'))
+        for offset in range(3):
+            for n in range(2):
+                db.session.add(ActivityLog(timestamp=base + timedelta(days=offset, minutes=n),
+                                           habit_id=1, action='toggle', details=f'{offset}-{n}',
+                                           ip_address='10.0.0.1', user_agent='pytest'))
+        db.session.add(ActivityLog(action='fresh', details='fresh'))
+        db.session.commit()
+
+    app.config['LOG_ARCHIVE_DIR'] = str(tmp_path)
+    try:
+        with app.app_context():
+            result = purge_old_logs()
+            assert result['archived']['rows'] == 6
+            assert result['archived']['files'] == 3
+            assert result['deleted'] == 6
+            assert [log.action for log in ActivityLog.query.all()] == ['fresh']
+
+            # Повторный запуск не трогает готовые файлы
+            assert purge_old_logs()['archived']['rows'] == 0
+    finally:
+        app.config['LOG_ARCHIVE_DIR'] = ''
+
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == [f"activity-{(base + timedelta(days=i)).date():%Y-%m-%d}.jsonl.gz" for i in range(3)]
+
+    records = list(scan_archives(str(tmp_path)))
+    assert [record['details'] for record in records] == ['0-0', '0-1', '1-0', '1-1', '2-0', '2-1']
+    assert records[0]['habit_id'] == 1
+    assert records[0]['ip_address'] == '10.0.0.1'
+    assert records[0]['user_agent'] == 'pytest'
+    assert isinstance(records[0]['timestamp'], datetime)
+
+    last_day = (base + timedelta(days=2)).date()
+    assert [r['details'] for r in scan_archives(str(tmp_path), start=last_day)] == ['2-0', '2-1']
+
+def test_user_agents_are_interned(client, app):
+    """Тест: журнал хранит ссылку на справочник User-Agent, повторы берутся из кеша"""
+    from app import UserAgent, user_agents
+
+    before = user_agents.stats()
+    for agent in ('Browser A', 'Browser B', 'Browser A', 'Browser A'):
+        client.get('/', headers={'User-Agent': agent})
+
+    with app.app_context():
+        assert sorted(ua.value for ua in UserAgent.query.all()) == ['Browser A', 'Browser B']
+        logs = ActivityLog.query.order_by(ActivityLog.id).all()
+        assert [log.user_agent for log in logs] == ['Browser A', 'Browser B', 'Browser A', 'Browser A']
+        assert len({log.user_agent_id for log in logs}) == 2
+
+    stats = user_agents.stats()
+    assert stats['inserted'] - before['inserted'] == 2
+    assert stats['hits'] - before['hits'] == 2
+
+def test_habit_log_upserts_are_single_statements(app):
+    """Тест: переключение и правка дня - один запрос к habit_log без чтения перед записью,
+    один к daily_rollup и чтение с записью годовой карты (на PostgreSQL - один set_bit)"""
+    from app import toggle_habit_log, set_habit_log_status
+
+    today = date.today()
+    with app.app_context():
+        habit = Habit(name='Upsert')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+        assert _count_queries(app, lambda: toggle_habit_log(habit_id, today)) == (True, 4)
+        assert toggle_habit_log(habit_id, today) is False
+        assert toggle_habit_log(habit_id, today) is True
+
+        # Запись, вставленная "параллельно" мимо сессии, не ломает переключение
+        yesterday = today - timedelta(days=1)
+        with db.engine.begin() as connection:
+            connection.execute(HabitLog.__table__.insert(),
+                               {'habit_id': habit_id, 'date': yesterday, 'status': True})
+        assert toggle_habit_log(habit_id, yesterday) is False
+
+        before = today - timedelta(days=2)
+        assert _count_queries(app, lambda: set_habit_log_status(habit_id, before, True)) == (True, 4)
+        assert set_habit_log_status(habit_id, before, True) is False
+        assert set_habit_log_status(habit_id, before, False) is True
+        assert set_habit_log_status(habit_id, before, False) is False
+        # Снятие отметки с пустого дня ничего не создает
+        assert set_habit_log_status(habit_id, today - timedelta(days=3), False) is False
+        db.session.commit()
+
+        statuses = {log.date: log.status for log in HabitLog.query.filter_by(habit_id=habit_id)}
+        assert statuses == {today: True, yesterday: False, before: False}
+
+def test_bulk_checkins_apply_in_one_transaction(client, app):
+    """Тест: пакет отметок применяется целиком, с результатами по элементам и одной записью журнала"""
+    from app import HabitStreak
+
+    today = date.today()
+    with app.app_context():
+        first, second = Habit(name='Bulk 1'), Habit(name='Bulk 2')
+        db.session.add_all([first, second])
+        db.session.commit()
+        first_id, second_id = first.id, second.id
+        db.session.add(HabitLog(habit_id=second_id, date=today, status=True))
+        db.session.commit()
+        ActivityLog.query.delete()
+        db.session.commit()
+
+    items = [{'habit_id': first_id, 'date': (today - timedelta(days=i)).isoformat(), 'status': True}
+             for i in range(3)]
+    items += [
+        {'habit_id': second_id, 'date': today.isoformat(), 'status': True},    # без изменений
+        {'habit_id': second_id, 'date': today.isoformat(), 'status': False},   # повтор дня
+        {'habit_id': 999, 'date': today.isoformat(), 'status': True},
+        {'habit_id': first_id, 'date': 'yesterday', 'status': True},
+    ]
+    response = client.post('/api/checkins', json={'items': items})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [r['result'] for r in data['results']] == [
+        'changed', 'changed', 'changed', 'unchanged', 'error', 'error', 'error']
+    assert (data['changed'], data['unchanged'], data['errors']) == (3, 1, 3)
+    assert data['results'][5]['error'] == 'habit not found'
+
+    with app.app_context():
+        assert db.session.get(HabitStreak, first_id).current_streak == 3
+        logs = ActivityLog.query.all()
+        assert [log.action for log in logs] == ['bulk_checkin']
+
+    # Снятие отметок тем же пакетным путем
+    data = client.post('/api/checkins', json={'items': [
+        {'habit_id': first_id, 'date': today.isoformat(), 'status': False},
+        {'habit_id': first_id, 'date': (today - timedelta(days=5)).isoformat(), 'status': False},
+    ]}).get_json()
+    assert [r['result'] for r in data['results']] == ['changed', 'unchanged']
+    with app.app_context():
+        assert db.session.get(HabitStreak, first_id).current_streak == 2
+
+def test_bulk_checkins_update_streaks_incrementally(client, app, monkeypatch):
+    """Тест: пакет отметок обновляет серии по дням, без полного пересчета"""
+    import app as app_module
+    from app import HabitStreak, rebuild_streak_states
+
+    today = date.today()
+    client.post('/add', data={'name': 'Bulk Streak'})
+    with app.app_context():
+        habit_id = Habit.query.filter_by(name='Bulk Streak').one().id
+
+    def post(statuses):
+        return client.post('/api/checkins', json={'items': [
+            {'habit_id': habit_id, 'date': (today - timedelta(days=i)).isoformat(), 'status': status}
+            for i, status in statuses.items()]})
+
+    def fail(*args, **kwargs):
+        raise AssertionError('full rescan')
+
+    monkeypatch.setattr(app_module, 'rebuild_streak_states', fail)
+    assert post({i: True for i in range(1, 8)}).status_code == 200
+    # Соседние снятые дни внутри самой длинной серии и новая отметка сегодня
+    assert post({3: False, 5: False, 0: True}).status_code == 200
+    monkeypatch.undo()
+
+    with app.app_context():
+        state = db.session.get(HabitStreak, habit_id)
+        assert (state.current_streak, state.longest_streak) == (3, 3)
+        assert state.last_completed_date == today
+        assert rebuild_streak_states([habit_id], fix=False) == []
+
+def test_bulk_checkins_validate_request(client, app):
+    """Тест: некорректное тело и слишком большой пакет отклоняются целиком"""
+    assert client.post('/api/checkins', json={'items': []}).status_code == 400
+    assert client.post('/api/checkins', data='not json').status_code == 400
+
+    limit = app.config['CHECKINS_MAX_BATCH']
+    app.config['CHECKINS_MAX_BATCH'] = 2
+    try:
+        item = {'habit_id': 1, 'date': date.today().isoformat(), 'status': True}
+        assert client.post('/api/checkins', json={'items': [item] * 3}).status_code == 413
+    finally:
+        app.config['CHECKINS_MAX_BATCH'] = limit
+
+def test_log_dates_outside_window_are_rejected(client, app):
+    """Тест: отметки в будущем и до 1900 года отклоняются в пакете и в истории"""
+    with app.app_context():
+        habit = Habit(name='Window')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    for day in ('0001-01-01', '1899-12-31', '9999-12-31', tomorrow):
+        data = client.post('/api/checkins', json={'items': [
+            {'habit_id': habit_id, 'date': day, 'status': True}]}).get_json()
+        assert data['results'][0]['result'] == 'error'
+        assert client.post(f'/history_update/{habit_id}/{day}', data={'status': 'on'}).status_code == 400
+    assert client.post(f'/history_update/{habit_id}/not-a-date', data={}).status_code == 400
+
+    with app.app_context():
+        assert HabitLog.query.filter_by(habit_id=habit_id).count() == 0
+
+def test_export_import_round_trip(client, app, tmp_path):
+    """Тест: выгрузка CSV/JSONL идет кусками, загрузка восстанавливает данные"""
+    from app import HabitStreak
+
+    today = date.today()
+    with app.app_context():
+        habits = [Habit(name=f'Export "{n}", with comma') for n in range(3)]
+        db.session.add_all(habits)
+        db.session.commit()
+        for habit in habits:
+            for i in range(4):
+                db.session.add(HabitLog(habit_id=habit.id, date=today - timedelta(days=i),
+                                        status=i != 2))
+        db.session.commit()
+        expected_habits = [(h.id, h.name) for h in Habit.query.order_by(Habit.id)]
+        expected_logs = [(l.habit_id, l.date, l.status) for l in HabitLog.query.order_by(HabitLog.id)]
+
+    batch = app.config['EXPORT_BATCH_SIZE']
+    app.config['EXPORT_BATCH_SIZE'] = 5
+    try:
+        response = client.get('/export/habit_logs.jsonl')
+        assert response.mimetype == 'application/x-ndjson'
+        chunks = list(response.response)
+        assert len(chunks) == 3  # 12 строк по 5
+        (tmp_path / 'habit_logs.jsonl').write_bytes(b''.join(chunks))
+        (tmp_path / 'habits.csv').write_bytes(client.get('/export/habits.csv').data)
+    finally:
+        app.config['EXPORT_BATCH_SIZE'] = batch
+
+    assert client.get('/export/secrets.csv').status_code == 404
+    assert client.get('/export/habits.xml').status_code == 404
+    assert client.get('/export/activity_logs.csv').data.startswith(b'id,timestamp,habit_id')
+
+    with app.app_context():
+        HabitStreak.query.delete()
+        HabitLog.query.delete()
+        ActivityLog.query.delete()
+        Habit.query.delete()
+        db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['import', 'habits', str(tmp_path / 'habits.csv')])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(args=['import', 'habit_logs', str(tmp_path / 'habit_logs.jsonl')])
+    assert 'Imported 12 rows' in result.output
+
+    with app.app_context():
+        assert [(h.id, h.name) for h in Habit.query.order_by(Habit.id)] == expected_habits
+        assert [(l.habit_id, l.date, l.status)
+                for l in HabitLog.query.order_by(HabitLog.id)] == expected_logs
+        assert db.session.get(HabitStreak, expected_habits[0][0]).current_streak == 2
+
+def test_lru_cache_ttl_and_eviction():
+    """Тест: LRU-кеш вытесняет старые ключи и истекает по TTL"""
+    from cache import LRUCache, MISSING
+
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # вытесняет 'b' - к нему обращались раньше всех
+    assert cache.get('b') is MISSING
+    now[0] = 11
+    assert cache.get('a') is MISSING
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['expirations']) == (1, 2, 1, 1)
+
+class FakeRedis:
+    """Локальная замена Redis для тестов общего кеша"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+def test_shared_cache_backend_round_trip():
+    """Тест: общий кеш работает через интерфейс Redis и переживает его недоступность"""
+    from cache import SharedCache, MISSING
+
+    client = FakeRedis()
+    cache = SharedCache(client, prefix='t:')
+    cache.set('dashboard', [{'id': 1, 'date': date(2026, 1, 1)}])
+    assert list(client.data) == ['t:dashboard']
+    assert cache.get('dashboard') == [{'id': 1, 'date': date(2026, 1, 1)}]
+    assert cache.get('other') is MISSING
+
+    client.get = lambda key: (_ for _ in ()).throw(ConnectionError('down'))
+    assert cache.get('dashboard') is MISSING
+    assert cache.stats()['errors'] == 1
+
+def test_dashboard_cache_hit_and_versioned_keys(client, app, monkeypatch):
+    """Тест: главная страница берется из кеша, изменения меняют версию в ключе"""
+    import app as app_module
+    from app import get_versions
+    from cache import LRUCache
+
+    monkeypatch.setattr(app_module, 'page_cache', LRUCache(maxsize=16, ttl=60))
+    with app.app_context():
+        habit = Habit(name='Cached')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+    def dashboard_queries():
+        return _count_queries(app, lambda: client.get('/'))[1]
+
+    def version(key):
+        with app.app_context():
+            return get_versions([key])[key]
+
+    today = date.today()
+    with app.app_context():
+        assert dashboard_queries() > 1
+        assert dashboard_queries() == 2  # из кеша; остаются версия для ETag и запись аудита
+
+    client.get(f'/toggle/{habit_id}')
+    client.get('/')
+    data = app_module.page_cache.get(app_module.dashboard_cache_key(today, version('global')))
+    assert data[0]['done_today'] is True
+
+    # История кешируется под версией привычки; правка дня дает новый ключ
+    client.get(f'/history/{habit_id}')
+    old_key = app_module.history_cache_key(habit_id, '2weeks', today, version(f'habit:{habit_id}'))
+    assert app_module.page_cache.get(old_key)['current_streak'] == 1
+    client.post(f'/history_update/{habit_id}/{today}', data={})
+    new_key = app_module.history_cache_key(habit_id, '2weeks', today, version(f'habit:{habit_id}'))
+    assert new_key != old_key
+    assert app_module.page_cache.get(new_key) is app_module.MISSING
+
+    # Полночь: ключ другого дня - промах без явного сброса
+    tomorrow = today + timedelta(days=1)
+    assert app_module.page_cache.get(
+        app_module.dashboard_cache_key(tomorrow, version('global'))) is app_module.MISSING
+
+    stats = client.get('/metrics').get_json()['page_cache']
+    assert stats['hits'] >= 1
+
+def test_stale_cache_fill_never_pairs_with_newer_etag(client, app, monkeypatch):
+    """Тест: данные, прочитанные до чужого коммита, не отдаются под ETag новой версии"""
+    import app as app_module
+    from app import get_versions
+    from cache import LRUCache
+
+    monkeypatch.setattr(app_module, 'page_cache', LRUCache(maxsize=16, ttl=60))
+    with app.app_context():
+        habit = Habit(name='Race')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+    original = app_module.load_dashboard_data
+
+    def load_then_concurrent_toggle(today=None):
+        data = original(today)
+        # Другой запрос коммитит отметку, пока загрузчик еще не положил данные в кеш
+        app.test_client().get(f'/toggle/{habit_id}')
+        return data
+
+    monkeypatch.setattr(app_module, 'load_dashboard_data', load_then_concurrent_toggle)
+    stale = client.get('/')
+    monkeypatch.setattr(app_module, 'load_dashboard_data', original)
+
+    fresh = client.get('/')
+    assert fresh.headers['ETag'] != stale.headers['ETag']
+    with app.app_context():
+        version = get_versions(['global'])['global']
+    data = app_module.page_cache.get(app_module.dashboard_cache_key(date.today(), version))
+    assert data[0]['done_today'] is True
+    assert client.get('/', headers={'If-None-Match': stale.headers['ETag']}).status_code == 200
+
+def test_conditional_get_returns_304_until_data_changes(client, app):
+    """Тест: If-None-Match дает 304 одним запросом версии, изменения меняют ETag"""
+    with app.app_context():
+        first, second = Habit(name='ETag 1'), Habit(name='ETag 2')
+        db.session.add_all([first, second])
+        db.session.commit()
+        first_id, second_id = first.id, second.id
+
+    urls = ['/', f'/history/{first_id}', f'/api/weekly_stats/{first_id}',
+            f'/api/weekly_stats?habit_ids={first_id},{second_id}', '/logs']
+    etags = {}
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'no-cache'
+        etags[url] = response.headers['ETag']
+
+    with app.app_context():
+        for url in urls:
+            response, queries = _count_queries(
+                app, lambda: client.get(url, headers={'If-None-Match': etags[url]}))
+            assert response.status_code == 304, url
+            assert response.data == b''
+            assert queries == 1, url
+
+    # Отметка первой привычки меняет главную и ее страницы, но не историю второй
+    second_history = client.get(f'/history/{second_id}').headers['ETag']
+    client.get(f'/toggle/{first_id}')
+    for url in urls:
+        assert client.get(url, headers={'If-None-Match': etags[url]}).status_code == 200, url
+    assert client.get(f'/history/{second_id}',
+                      headers={'If-None-Match': second_history}).status_code == 304
+
+def test_rollups_follow_every_write_path(client, app):
+    """Тест: счетчики daily_rollup после кликов, правок, пакета, ORM и удаления совпадают с пересчетом"""
+    from app import DailyRollup, rebuild_rollups
+
+    today = date.today()
+    with app.app_context():
+        first, second, third = Habit(name='Roll 1'), Habit(name='Roll 2'), Habit(name='Roll 3')
+        db.session.add_all([first, second, third])
+        db.session.commit()
+        first_id, second_id, third_id = first.id, second.id, third.id
+        # Запись через ORM тоже учитывается
+        db.session.add(HabitLog(habit_id=third_id, date=today, status=True))
+        db.session.commit()
+
+    client.get(f'/toggle/{first_id}')
+    client.get(f'/toggle/{second_id}')
+    client.get(f'/toggle/{second_id}')
+    client.post(f'/history_update/{first_id}/{(today - timedelta(days=1)).isoformat()}',
+                data={'status': 'on'})
+    client.post('/api/checkins', json={'items': [
+        {'habit_id': second_id, 'date': (today - timedelta(days=i)).isoformat(), 'status': True}
+        for i in range(3)
+    ]})
+
+    with app.app_context():
+        log = HabitLog.query.filter_by(habit_id=second_id, date=today - timedelta(days=2)).one()
+        log.status = False
+        db.session.commit()
+        assert rebuild_rollups(fix=False) == []
+
+        day_total = db.session.get(DailyRollup, ('day', 0, today)).completed
+        assert day_total == 3
+        month = db.session.get(DailyRollup, ('month', 0, today.replace(day=1))).completed
+        assert month == HabitLog.query.filter(
+            HabitLog.status == True, HabitLog.date >= today.replace(day=1)).count()
+
+    client.post(f'/delete/{third_id}')
+    with app.app_context():
+        assert rebuild_rollups(fix=False) == []
+        assert DailyRollup.query.filter_by(habit_id=third_id).count() == 0
+        assert db.session.get(DailyRollup, ('day', 0, today)).completed == 2
+
+        # Пересчет исправляет счетчики, разошедшиеся после записи мимо приложения
+        with db.engine.begin() as connection:
+            connection.execute(HabitLog.__table__.insert(), {
+                'habit_id': first_id, 'date': today - timedelta(days=40), 'status': True})
+        mismatches = rebuild_rollups()
+        assert ('day', first_id, today - timedelta(days=40), 0, 1) in mismatches
+        db.session.commit()
+        assert rebuild_rollups(fix=False) == []
+
+def test_rollup_stats_read_one_query(client, app):
+    """Тест: /api/stats/<period> отдает итоги из daily_rollup одним запросом"""
+    from app import get_rollup_totals
+
+    today = date.today()
+    with app.app_context():
+        first, second = Habit(name='Stats 1'), Habit(name='Stats 2')
+        db.session.add_all([first, second])
+        db.session.commit()
+        first_id, second_id = first.id, second.id
+        for i in range(10):
+            db.session.add(HabitLog(habit_id=first_id, date=today - timedelta(days=i), status=True))
+        db.session.add(HabitLog(habit_id=second_id, date=today, status=True))
+        db.session.commit()
+
+        (totals, habits), queries = _count_queries(
+            app, lambda: get_rollup_totals('day', 7, [first_id], today))
+        assert queries == 1
+        assert list(totals) == [(today - timedelta(days=i)).isoformat() for i in range(6, -1, -1)]
+        assert totals[today.isoformat()] == 2
+        assert sum(habits[first_id].values()) == 7
+
+        weekly = get_weekly_stats(first_id, 2)
+        assert list(weekly.values()) == [7, 1]
+
+    response = client.get(f'/api/stats/month?count=2&habit_ids={second_id}')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['period'] == 'month'
+    assert data['totals'][today.replace(day=1).isoformat()] >= 2
+    assert data['habits'][str(second_id)][today.replace(day=1).isoformat()] == 1
+    assert client.get('/api/stats/year').status_code == 404
+    assert client.get('/api/stats/day', headers={'If-None-Match': response.headers['ETag']}
+                      ).status_code == 200
+    cached = client.get(f'/api/stats/month?count=2&habit_ids={second_id}',
+                        headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+def test_completion_bitsets_match_streak_state():
+    """Тест: анализ битовых карт совпадает с пересчетом серий по списку дат"""
+    import random
+    import bitsets
+    from app import compute_streak_state, HabitStreak
+
+    rng = random.Random(7)
+    origin = date(2016, 1, 1)
+    for _ in range(50):
+        days = sorted({origin + timedelta(days=rng.randint(0, 3650))
+                       for _ in range(rng.randint(0, 1200))})
+        years = {year: bits for (_, year), bits in bitsets.build((1, d) for d in days).items()}
+        history = bitsets.CompletionHistory(years)
+        assert history.longest_run() == compute_streak_state(days)[1]
+
+        today = origin + timedelta(days=rng.randint(-10, 3700))
+        current, _, last = compute_streak_state([d for d in days if d <= today])
+        state = HabitStreak(current_streak=current, longest_streak=0, last_completed_date=last)
+        assert history.current_streak(today) == state.current_for(today)
+
+        start = today - timedelta(days=60)
+        done = set(days)
+        assert history.days(start, today) == [start + timedelta(days=i) in done for i in range(61)]
+        assert history.weekly_counts(start, 2) == [
+            sum(start + timedelta(days=7 * week + i) in done for i in range(7)) for week in range(2)
+        ]
+    assert bitsets.from_bytes(bitsets.to_bytes(1 << 365)) == 1 << 365
+    assert bitsets.day_index(date(2024, 12, 31)) == 365
+
+def test_year_bits_follow_writes_and_summary(client, app):
+    """Тест: годовые карты совпадают с HabitLog после любых записей, сводка читает одну выборку"""
+    from app import HabitYearBits, load_completion_history, rebuild_year_bits
+
+    today = date.today()
+    with app.app_context():
+        habit, other = Habit(name='Bits'), Habit(name='Other bits')
+        db.session.add_all([habit, other])
+        db.session.commit()
+        habit_id, other_id = habit.id, other.id
+        # Несколько лет истории через ORM
+        for i in range(1, 800, 3):
+            db.session.add(HabitLog(habit_id=habit_id, date=today - timedelta(days=i), status=True))
+        db.session.add(HabitLog(habit_id=other_id, date=today, status=True))
+        db.session.commit()
+
+    client.get(f'/toggle/{habit_id}')
+    client.post(f'/history_update/{habit_id}/{(today - timedelta(days=1)).isoformat()}',
+                data={'status': 'on'})
+    client.post('/api/checkins', json={'items': [
+        {'habit_id': habit_id, 'date': (today - timedelta(days=4)).isoformat(), 'status': False}
+    ]})
+
+    with app.app_context():
+        assert rebuild_year_bits(fix=False) == []
+        history, queries = _count_queries(app, lambda: load_completion_history(habit_id))
+        assert queries == 1
+        assert history.is_done(today) and history.is_done(today - timedelta(days=1))
+        assert not history.is_done(today - timedelta(days=4))
+        assert history.bits.bit_count() == HabitLog.query.filter_by(
+            habit_id=habit_id, status=True).count()
+
+    response = client.get(f'/api/summary/{habit_id}')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['current_streak'] == 2
+    assert data['longest_streak'] == 2
+    assert len(data['weekly']) == 8
+    assert client.get(f'/api/summary/{habit_id}',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    client.post(f'/delete/{other_id}')
+    with app.app_context():
+        assert HabitYearBits.query.filter_by(habit_id=other_id).count() == 0
+        assert rebuild_year_bits(fix=False) == []
+    assert client.get(f'/api/summary/{other_id}').status_code == 404
+
+def test_year_heatmap_view_and_api(client, app):
+    """Тест: годовой календарь строится по битовым картам тем же числом запросов, что 2 недели"""
+    from app import load_history_snapshot
+
+    today = date.today()
+    year = today.year - 1
+    with app.app_context():
+        habit = Habit(name='Heatmap')
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+        done = [date(year, 1, 1), date(year, 1, 2), date(year, 3, 15), date(year, 12, 31), today]
+        for day in done:
+            db.session.add(HabitLog(habit_id=habit_id, date=day, status=True))
+        db.session.add(HabitLog(habit_id=habit_id, date=date(year, 3, 16), status=False))
+        db.session.commit()
+
+        load_history_snapshot(habit_id, '2weeks', today)
+        counts = [_count_queries(app, lambda: load_history_snapshot(habit_id, view, today, year=year))[1]
+                  for view in ('2weeks', '8weeks', 'year')]
+        assert counts == [2, 2, 2]
+
+    response = client.get(f'/api/heatmap/{habit_id}?year={year}')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    data = response.get_json()
+    days_in_year = (date(year + 1, 1, 1) - date(year, 1, 1)).days
+    assert data['days'] == days_in_year
+    assert data['completed'] == 4
+    assert data['months'][f'{year}-01'] == 2
+    assert data['months'][f'{year}-03'] == 1
+    assert sum(data['months'].values()) == 4
+    assert all(len(week) == 7 for week in data['grid'])
+    cells = [cell for week in data['grid'] for cell in week]
+    assert len([cell for cell in cells if cell is not None]) == days_in_year
+    first_monday = date.fromisoformat(data['first_monday'])
+    assert first_monday.weekday() == 0
+    assert cells[(date(year, 3, 15) - first_monday).days] == 1
+    assert cells[(date(year, 3, 16) - first_monday).days] == 0
+
+    cached = client.get(f'/api/heatmap/{habit_id}?year={year}',
+                        headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    # Правка дня прошлого года меняет версию привычки и сам календарь
+    client.post(f'/history_update/{habit_id}/{year}-03-16', data={'status': 'on'})
+    fresh = client.get(f'/api/heatmap/{habit_id}?year={year}',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert fresh.status_code == 200
+    assert fresh.get_json()['completed'] == 5
+
+    assert client.get(f'/api/heatmap/{habit_id}?year=1066').status_code == 400
+    assert client.get(f'/api/heatmap/{habit_id}?year=abc').status_code == 400
+    assert client.get(f'/history/{habit_id}/year?year=abc').status_code == 400
+    assert client.get('/api/heatmap/999999').status_code == 404
+
+    # Ссылки на соседние годы не ведут за пределы допустимых
+    def year_links(shown):
+        page = client.get(f'/history/{habit_id}/year?year={shown}').data.decode()
+        return [y for y in (shown - 1, shown + 1) if f'year={y}"' in page]
+
+    assert year_links(1900) == [1901]
+    assert year_links(today.year + 1) == [today.year]
+
+    page = client.get(f'/history/{habit_id}/year?year={year}')
+    assert page.status_code == 200
+    assert f'{year}: выполнено 5'.encode() in page.data
+    assert client.get(f'/history/{habit_id}/year').status_code == 200
+
+def test_rollup_upsert_rows_are_sorted():
+    """Тест: строки счетчиков идут в порядке ключа независимо от порядка изменений"""
+    import rollups
+    from app import DailyRollup
+
+    class Recorder:
+        class dialect:
+            name = 'sqlite'
+
+        def execute(self, statement):
+            self.params = statement.compile().params
+
+    day = date(2026, 3, 4)
+    deltas = rollups.aggregate([(5, day, 1), (2, day - timedelta(days=40), 1), (9, day, -1)])
+    recorder = Recorder()
+    rollups.apply_deltas(recorder, DailyRollup.__table__, dict(reversed(list(deltas.items()))))
+    keys = [(recorder.params[f'period_m{index}'], recorder.params[f'habit_id_m{index}'],
+             recorder.params[f'period_start_m{index}']) for index in range(len(deltas))]
+    assert keys == sorted(deltas)
+
+def test_clear_logs_archives_only_what_it_deletes(client, app, tmp_path):
+    """Тест: с архивом /logs/clear выгружает и удаляет целые дни в пределах лимита пачек"""
+    from archive import scan_archives
+
+    base = datetime.now(timezone.utc).replace(hour=12) - timedelta(days=45)
+    with app.app_context():
+        ActivityLog.query.delete()
+        for offset in range(3):
+            for n in range(2):
+                db.session.add(ActivityLog(timestamp=base + timedelta(days=offset, minutes=n),
+                                           action='old', details=f'{offset}-{n}'))
+        db.session.commit()
+
+    settings = {key: app.config[key]
+                for key in ('LOG_PURGE_CHUNK_SIZE', 'LOG_PURGE_HTTP_MAX_CHUNKS', 'LOG_ARCHIVE_DIR')}
+    app.config.update(LOG_PURGE_CHUNK_SIZE=2, LOG_PURGE_HTTP_MAX_CHUNKS=1,
+                      LOG_ARCHIVE_DIR=str(tmp_path))
+    try:
+        data = json.loads(client.post('/logs/clear').data)
+        assert data['deleted'] == 2
+        assert [r['details'] for r in scan_archives(str(tmp_path))] == ['0-0', '0-1']
+
+        data = json.loads(client.post('/logs/clear').data)
+        assert data['deleted'] == 2
+        assert len(list(tmp_path.iterdir())) == 2
+    finally:
+        app.config.update(settings)
+
+    with app.app_context():
+        # Удалены ровно выгруженные записи
+        assert [log.details for log in ActivityLog.query.filter_by(action='old')] == ['2-0', '2-1']
+
 if __name__ == '__main__':
     pytest.main(['-v', __file__, '--disable-warnings', '-s'])
\ No newline at end of file
@@ -0,0 +1,136 @@
+# transfer.py
+"""Потоковая выгрузка таблиц в CSV/JSONL и пакетная загрузка обратно"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy import Boolean, Date, DateTime, Integer
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(connection, statement, batch_size=1000):
+    """Строки запроса по одной; на PostgreSQL через серверный курсор (yield_per)"""
+    result = connection.execution_options(yield_per=batch_size).execute(statement)
+    for row in result:
+        yield row
+
+
+def encode(rows, columns, fmt, batch_size=1000):
+    """Кодирует строки в куски текста формата fmt (csv с заголовком или jsonl).
+
+    Отдает по одному куску на batch_size строк: памяти нужно на одну пачку,
+    а не на весь результат.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n') if fmt == 'csv' else None
+    if writer is not None:
+        writer.writerow(columns)
+    count = 0
+    for row in rows:
+        if writer is not None:
+            writer.writerow(['' if value is None else _plain(value) for value in row])
+        else:
+            record = {column: _plain(value) for column, value in zip(columns, row)}
+            buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def decode(lines, fmt):
+    """Читает записи (словари строк/значений) из итератора строк файла"""
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _converter(column_type):
+    if isinstance(column_type, Boolean):
+        return lambda value: value if isinstance(value, bool) else str(value).lower() in ('true', '1', 't')
+    if isinstance(column_type, Integer):
+        return int
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column_type, Date):
+        return date.fromisoformat
+    return str
+
+
+def typed_records(records, table, columns):
+    """Приводит значения к типам колонок table; пустая строка CSV - NULL"""
+    converters = {column: _converter(table.c[column].type) for column in columns}
+    for record in records:
+        yield {
+            column: None if record.get(column) in (None, '') else converters[column](record[column])
+            for column in columns
+        }
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_chunk(connection, table, columns, chunk):
+    """COPY ... FROM STDIN для одной пачки (PostgreSQL, psycopg2)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for record in chunk:
+        # Пустое поле без кавычек COPY читает как NULL, пустая строка - как ""
+        writer.writerow([_plain(record[column]) if record[column] is not None else None
+                         for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer
+        )
+    finally:
+        cursor.close()
+
+
+def bulk_load(connection, table, columns, records, chunk_size=5000):
+    """Загружает записи пачками: COPY на PostgreSQL, executemany на остальных БД.
+
+    Возвращает число загруженных строк. Транзакцией управляет вызывающий код.
+    """
+    loaded = 0
+    for chunk in _chunks(typed_records(records, table, columns), chunk_size):
+        if connection.dialect.name == 'postgresql':
+            _copy_chunk(connection, table, columns, chunk)
+        else:
+            connection.execute(table.insert(), chunk)
+        loaded += len(chunk)
+    return loaded
+
+
+def reset_sequence(connection, table, column='id'):
+    """После загрузки с явными id сдвигает последовательность PostgreSQL за максимум"""
+    if connection.dialect.name != 'postgresql':
+        return
+    connection.exec_driver_sql(
+        f"SELECT setval(pg_get_serial_sequence('{table.name}', '{column}'), "
+        f"COALESCE((SELECT max({column}) FROM \"{table.name}\"), 0) + 1, false)"
+    )
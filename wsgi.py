@@ -0,0 +1,17 @@
+# wsgi.py
+"""Точка входа для production WSGI-сервера (gunicorn)
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+from app import app, init_db, wait_for_database
+
+
+def create_app():
+    """Готовит приложение к работе: ждет БД и, если разрешено, применяет миграции"""
+    wait_for_database()
+    if app.config['MIGRATE_ON_START']:
+        init_db()
+    return app
+
+
+application = create_app()